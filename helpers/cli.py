@@ -4,6 +4,8 @@ import sys
 import re
 import textwrap
 
+from helpers.tracer import Tracer
+
 
 class CLI:
 
@@ -26,9 +28,17 @@ class CLI:
     DEFAULT_RESPONSES = dict(zip(DEFAULT_CHOICES.values(),
                                  DEFAULT_CHOICES.keys()))
 
+    # When `True`, prompts are not displayed and default values are used
+    # (e.g. setup from an answers file)
+    non_interactive = False
+
     @classmethod
     def colored_input(cls, message, color=NO_COLOR, default=None):
         text = cls.get_message_with_default(message, default)
+        if cls.non_interactive:
+            print(cls.colorize(text, color))
+            return default if default is not None else ''
+
         input_ = input(cls.colorize(text, color))
 
         # User wants to delete value previously entered.
@@ -98,19 +108,14 @@ class CLI:
             try:
                 response = cls.colored_input('', cls.COLOR_QUESTION, default)
 
-                if (
-                    response.lower() in map(lambda x: x.lower(), validators)
-                    or validators is None
-                    or (
-                        isinstance(validators, str)
-                        and validators.startswith('~')
-                        and re.match(validators[1:], response)
-                    )
-                ):
+                if cls.is_valid_response(validators, response):
                     break
                 else:
                     cls.colored_print(error_msg,
                                       cls.COLOR_ERROR)
+                    if cls.non_interactive:
+                        # Nobody can fix the value, do not loop forever
+                        sys.exit(1)
             except ValueError:
                 cls.colored_print("Sorry, I didn't understand that.",
                                   cls.COLOR_ERROR)
@@ -120,6 +125,26 @@ class CLI:
 
         return response.lower() if to_lower else response
 
+    @classmethod
+    def is_valid_response(cls, validators, response):
+        """
+        Validates `response` the way `get_response()` does.
+
+        Args:
+            validators (list|str): Allowed values (case-insensitive) or a
+                                   regex prefixed with `~`
+            response (str)
+
+        Returns:
+            bool
+        """
+        if isinstance(validators, str):
+            if validators.startswith('~'):
+                return bool(re.match(validators[1:], response))
+            return response.lower() == validators.lower()
+
+        return response.lower() in map(lambda x: x.lower(), validators)
+
     @classmethod
     def get_message_with_default(cls, message, default):
         message = f'{message} ' if message else ''
@@ -140,28 +165,37 @@ class CLI:
 
     @classmethod
     def run_command(cls, command, cwd=None, polling=False):
-        if polling:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd)
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    print(output.decode().strip())
-            return process.poll()
-        else:
-            try:
-                stdout = subprocess.check_output(command,
-                                                 universal_newlines=True,
-                                                 cwd=cwd)
-            except subprocess.CalledProcessError as cpe:
-                # Error will be display by above command.
-                # ^^^ this doesn't seem to be true? let's write it explicitly
-                # see https://docs.python.org/3/library/subprocess.html#subprocess.check_output
-                sys.stderr.write(cpe.output)
-                cls.colored_print('An error has occurred', CLI.COLOR_ERROR)
-                sys.exit(1)
-            return stdout
+        with Tracer.span(' '.join(command), 'command', cwd=cwd) as span:
+            if polling:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd)
+                output_bytes = 0
+                while True:
+                    output = process.stdout.readline()
+                    if output == b'' and process.poll() is not None:
+                        break
+                    if output:
+                        output_bytes += len(output)
+                        print(output.decode().strip())
+                span['exit_code'] = process.poll()
+                span['output_bytes'] = output_bytes
+                return process.poll()
+            else:
+                try:
+                    stdout = subprocess.check_output(command,
+                                                     universal_newlines=True,
+                                                     cwd=cwd)
+                except subprocess.CalledProcessError as cpe:
+                    span['exit_code'] = cpe.returncode
+                    span['output_bytes'] = len((cpe.output or '').encode())
+                    # Error will be display by above command.
+                    # ^^^ this doesn't seem to be true? let's write it explicitly
+                    # see https://docs.python.org/3/library/subprocess.html#subprocess.check_output
+                    sys.stderr.write(cpe.output)
+                    cls.colored_print('An error has occurred', CLI.COLOR_ERROR)
+                    sys.exit(1)
+                span['exit_code'] = 0
+                span['output_bytes'] = len(stdout.encode())
+                return stdout
 
     @classmethod
     def yes_no_question(cls, question, default=True,
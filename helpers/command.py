@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
+import json
 import os
+import re
+import shutil
 import sys
 import time
 import subprocess
 
 from helpers.cli import CLI
 from helpers.config import Config
+from helpers.git_sync import GitSync
+from helpers.log_multiplexer import LogMultiplexer
 from helpers.network import Network
+from helpers.orchestrator import Orchestrator
+from helpers.readiness import Readiness
+from helpers.redis_tuning import RedisTuning
 from helpers.template import Template
 from helpers.upgrading import Upgrading
 from helpers.utils import run_docker_compose
@@ -14,6 +22,20 @@ from helpers.utils import run_docker_compose
 
 class Command:
 
+    # Front-end services are recreated in this order by `--rolling-restart`.
+    # Services which are not listed are restarted after `enketo_express`.
+    # NGINX always comes last to keep serving traffic as long as possible.
+    ROLLING_RESTART_ORDER = [
+        'kpi',
+        'worker',
+        'worker_kobocat',
+        'worker_low_priority',
+        'worker_long_running_tasks',
+        'beat',
+        'enketo_express',
+        'nginx',
+    ]
+
     @staticmethod
     def help():
         output = [
@@ -22,12 +44,13 @@ class Command:
             '    Options:',
             '          -i, --info',
             '                Show KoboToolbox Url and super user credentials',
-            '          -l, --logs',
-            '                Display docker logs',
+            '          -l, --logs [service ...] [--grep <regex>]',
+            '                Display docker logs of all projects',
             '          -b, --build',
             '                Build django (kpi) container (only on dev/staging mode)',
-            '          -s, --setup',
-            '                Prompt questions to (re)write configuration files',
+            '          -s, --setup [--answers <file>]',
+            '                Prompt questions to (re)write configuration files. '
+            'With `--answers`, read them from a JSON (or YAML) file instead',
             '          -S, --stop',
             '                Stop KoboToolbox',
             '          -u, --update, --upgrade [branch or tag]',
@@ -43,8 +66,31 @@ class Command:
             'redirected to maintenance page',
             '          -sm, --stop-maintenance',
             '                Stop maintenance mode',
+            '          --rolling-restart',
+            '                Recreate front-end containers one at a time '
+            'without downtime',
+            '          --scale <service>=<replicas> [...]',
+            '                Run several containers of `kpi` or Celery '
+            'workers',
+            '          --export-cluster <file>',
+            '                Export settings and secrets shared by front-end '
+            'nodes',
+            '          --import-cluster <file>',
+            '                Configure this front-end node with settings exported '
+            'from another one',
+            '          --blue-green [branch or tag]',
+            '                Update KoboToolbox and start the new front end next '
+            'to the running one, then switch traffic to it',
+            '          --rollback',
+            '                Switch traffic back to the previous front end',
+            '          --fleet <inventory> [branch or tag]',
+            '                Update and start KoboToolbox on several hosts over '
+            'SSH',
             '          -v, --version',
             '                Display current version',
+            '          --profile',
+            '                Record timings of the command (can be combined '
+            'with any option)',
             ''
         ]
         print('\n'.join(output))
@@ -116,53 +162,35 @@ class Command:
             ) else ''
         )
 
-        stop = False
-        start = int(time.time())
         success = False
-        hostname = f"{dict_['kpi_subdomain']}.{dict_['public_domain_name']}"
-        https = dict_['https']
-        nginx_port = int(Config.DEFAULT_NGINX_HTTPS_PORT) \
-            if https else int(dict_['exposed_nginx_docker_port'])
+        readiness = Readiness(config)
         already_retried = False
-        while not stop:
-            if Network.status_check(hostname,
-                                    '/service_health/',
-                                    nginx_port, https) == Network.STATUS_OK_200:
-                stop = True
+        while True:
+            if readiness.wait(timeout):
                 success = True
-            elif int(time.time()) - start >= timeout:
-                if timeout > 0:
-                    CLI.colored_print(
-                        '\n`KoboToolbox` has not started yet. '
-                        'This can happen with low CPU/RAM computers.\n',
-                        CLI.COLOR_INFO)
-                    question = f'Wait for another {timeout} seconds?'
-                    response = CLI.yes_no_question(question)
-                    if response:
-                        start = int(time.time())
-                        continue
-                    else:
-                        if not already_retried:
-                            already_retried = True
-                            CLI.colored_print(
-                                '\nSometimes front-end containers cannot '
-                                'communicate with back-end containers.\n'
-                                'Restarting the front-end containers usually '
-                                'fixes it.\n', CLI.COLOR_INFO)
-                            question = 'Would you like to try?'
-                            response = CLI.yes_no_question(question)
-                            if response:
-                                start = int(time.time())
-                                cls.restart_frontend()
-                                continue
-                stop = True
-            else:
-                sys.stdout.write('.')
-                sys.stdout.flush()
-                time.sleep(10)
-
-        # Create a new line
-        print('')
+            elif timeout > 0:
+                CLI.colored_print(
+                    '\n`KoboToolbox` has not started yet. '
+                    'This can happen with low CPU/RAM computers.\n',
+                    CLI.COLOR_INFO)
+                question = f'Wait for another {timeout} seconds?'
+                response = CLI.yes_no_question(question)
+                if response:
+                    continue
+                else:
+                    if not already_retried:
+                        already_retried = True
+                        CLI.colored_print(
+                            '\nSometimes front-end containers cannot '
+                            'communicate with back-end containers.\n'
+                            'Restarting the front-end containers usually '
+                            'fixes it.\n', CLI.COLOR_INFO)
+                        question = 'Would you like to try?'
+                        response = CLI.yes_no_question(question)
+                        if response:
+                            cls.restart_frontend()
+                            continue
+            break
 
         if success:
             username = dict_['super_user_username']
@@ -187,30 +215,86 @@ class Command:
         return success
 
     @classmethod
-    def logs(cls):
+    def logs(cls, args=None):
+        """
+        Follows logs of all projects running on this server at the same time
+        (see `helpers.log_multiplexer.LogMultiplexer`).
+
+        Args:
+            args (list): Service names to filter on, optionally followed by
+                         `--grep <regex>`
+        """
         config = Config()
         dict_ = config.get_dict()
 
+        services = []
+        pattern = None
+        args = list(args or [])
+        while args:
+            arg = args.pop(0)
+            if arg == '--grep':
+                if not args:
+                    CLI.colored_print('`--grep` requires a regular expression',
+                                      CLI.COLOR_ERROR)
+                    sys.exit(1)
+                pattern = args.pop(0)
+            else:
+                services.append(arg)
+
+        try:
+            multiplexer = LogMultiplexer(services=services, pattern=pattern)
+        except re.error as e:
+            CLI.colored_print(f'Invalid regular expression: {e}',
+                              CLI.COLOR_ERROR)
+            sys.exit(1)
+
         if config.backend:
             backend_command = run_docker_compose(dict_, [
                 '-f', f'docker-compose.backend.yml',
                 '-f', f'docker-compose.backend.override.yml',
                 '-p', config.get_prefix('backend'),
-                'logs', '-f'
+                'logs', '-f', '--no-color',
             ])
             cls.__validate_custom_yml(config, backend_command)
-            CLI.run_command(backend_command, dict_['kobodocker_path'], True)
+            multiplexer.add_source(
+                'backend', backend_command, dict_['kobodocker_path']
+            )
 
         if config.frontend:
             frontend_command = run_docker_compose(dict_, [
                 '-f', 'docker-compose.frontend.yml',
                 '-f', 'docker-compose.frontend.override.yml',
                 '-p', config.get_prefix('frontend'),
-                'logs', '-f',
+                'logs', '-f', '--no-color',
             ])
 
             cls.__validate_custom_yml(config, frontend_command)
-            CLI.run_command(frontend_command, dict_['kobodocker_path'], True)
+            multiplexer.add_source(
+                'frontend', frontend_command, dict_['kobodocker_path']
+            )
+
+            if dict_['maintenance_enabled']:
+                maintenance_command = run_docker_compose(dict_, [
+                    '-f', 'docker-compose.maintenance.yml',
+                    '-f', 'docker-compose.maintenance.override.yml',
+                    '-p', config.get_prefix('maintenance'),
+                    'logs', '-f', '--no-color',
+                ])
+                multiplexer.add_source(
+                    'maintenance', maintenance_command, dict_['kobodocker_path']
+                )
+
+            if config.use_letsencrypt:
+                certbot_command = run_docker_compose(
+                    dict_, ['logs', '-f', '--no-color']
+                )
+                multiplexer.add_source(
+                    'certbot',
+                    certbot_command,
+                    config.get_letsencrypt_repo_path(),
+                )
+
+        multiplexer.run()
 
     @classmethod
     def configure_maintenance(cls):
@@ -262,10 +346,264 @@ class Command:
         cls.start(frontend_only=True)
 
     @classmethod
-    def start(cls, frontend_only=False, force_setup=False):
+    def rolling_restart(cls, timeout=600):
+        """
+        Recreates front-end services one at a time instead of tearing down
+        the whole front end. Each service must be healthy (or running if it
+        does not provide any health check) before the next one is recreated.
+
+        Args:
+            timeout (int): Maximum time (in seconds) to wait for each service
+        """
         config = Config()
         dict_ = config.get_dict()
 
+        if config.multi_servers and not config.frontend:
+            CLI.colored_print(
+                'Rolling restart is only available on front-end servers',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        services = cls.__get_rolling_restart_order(config.get_service_names())
+        if dict_['maintenance_enabled']:
+            # Do not start the non-maintenance NGINX
+            services = [s for s in services if s != 'nginx']
+
+        for service in services:
+            CLI.colored_print(f'Recreating `{service}`...', CLI.COLOR_INFO)
+            frontend_command = run_docker_compose(dict_, [
+                '-f', 'docker-compose.frontend.yml',
+                '-f', 'docker-compose.frontend.override.yml',
+                '-p', config.get_prefix('frontend'),
+                'up', '-d', '--no-deps', '--force-recreate', service,
+            ])
+            cls.__validate_custom_yml(config, frontend_command)
+            CLI.run_command(frontend_command, dict_['kobodocker_path'])
+
+            if not cls.__wait_for_service(config, service, timeout):
+                CLI.colored_print(
+                    f'`{service}` did not become healthy within {timeout} '
+                    'seconds. Rolling restart has been aborted.',
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+
+        CLI.colored_print('Front-end containers have been restarted',
+                          CLI.COLOR_SUCCESS)
+
+    @classmethod
+    def deploy_blue_green(cls, timeout=600):
+        """
+        Starts the front end with the current kobo-docker release
+        (`Config.KOBO_DOCKER_BRANCH`) next to the running one, in another
+        directory and Docker Compose project (see
+        `Config.get_idle_deployment()`), against the same back end.
+        Once it is healthy, Let's Encrypt NGINX sends traffic to it and the
+        previous front end is stopped, but kept for `--rollback`.
+
+        Args:
+            timeout (int): Maximum time (in seconds) to wait for the new
+                           front end
+        """
+        config = Config()
+        dict_ = config.get_dict()
+        cls.__validate_blue_green(config)
+
+        active_deployment = (
+            dict_['deployment_color'], dict_['kobodocker_path']
+        )
+        idle_color, idle_path = config.get_idle_deployment()
+
+        CLI.colored_print(
+            f'Deploying {idle_color} front end in `{idle_path}`',
+            CLI.COLOR_INFO,
+        )
+        config.set_deployment(idle_color, idle_path)
+        # Containers of the deployment before the active one are not needed
+        # anymore
+        cls.__remove_frontend(config)
+
+        if os.path.isdir(os.path.join(idle_path, '.git')):
+            GitSync.sync(idle_path, Config.KOBO_DOCKER_BRANCH)
+        else:
+            GitSync.clone(
+                'kobo-docker',
+                idle_path,
+                ref=Config.KOBO_DOCKER_BRANCH,
+                reference_path=dict_['git_reference_path'],
+            )
+
+        if dict_['use_frontend_custom_yml']:
+            custom_file = os.path.join(
+                active_deployment[1], 'docker-compose.frontend.custom.yml'
+            )
+            if os.path.isfile(custom_file):
+                shutil.copy(custom_file, idle_path)
+
+        config.clear_service_catalog()
+        Template.render(config, force=True)
+
+        # `beat` must never run twice. It is started once the active front end
+        # is stopped.
+        up_arguments = ['up', '-d']
+        for service, replicas in dict(config.get_replicas(), beat=0).items():
+            up_arguments += ['--scale', f'{service}={replicas}']
+        cls.__run_frontend_command(config, up_arguments)
+
+        if not cls.__switch_proxy(config, timeout):
+            CLI.colored_print(
+                f'{idle_color.capitalize()} front end is not healthy. Traffic '
+                f'still goes to the {active_deployment[0]} one.',
+                CLI.COLOR_ERROR,
+            )
+            cls.__remove_frontend(config)
+            config.set_deployment(*active_deployment)
+            Template.render(config, force=True)
+            sys.exit(1)
+
+        config.write_config()
+        config.write_unique_id()
+        cls.__hand_over(config, active_deployment)
+
+    @classmethod
+    def rollback(cls, timeout=600):
+        """
+        Sends traffic back to the front end which was active before the last
+        blue/green deployment (see `Command.deploy_blue_green()`) and stops
+        the current one.
+
+        Args:
+            timeout (int): Maximum time (in seconds) to wait for the previous
+                           front end
+        """
+        config = Config()
+        dict_ = config.get_dict()
+        cls.__validate_blue_green(config)
+
+        active_deployment = (
+            dict_['deployment_color'], dict_['kobodocker_path']
+        )
+        idle_color, idle_path = config.get_idle_deployment()
+
+        if not os.path.isfile(
+            os.path.join(idle_path, 'docker-compose.frontend.override.yml')
+        ):
+            CLI.colored_print(
+                'There is no previous front end to roll back to',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        CLI.colored_print(
+            f'Rolling back to {idle_color} front end in `{idle_path}`',
+            CLI.COLOR_INFO,
+        )
+        config.set_deployment(idle_color, idle_path)
+        # Existing containers are restarted as they were, except `beat` which
+        # must never run twice
+        cls.__run_frontend_command(
+            config,
+            ['start'] + [s for s in config.get_service_names() if s != 'beat'],
+        )
+        Template.render(config, force=True)
+
+        if not cls.__switch_proxy(config, timeout):
+            CLI.colored_print(
+                f'{idle_color.capitalize()} front end is not healthy. Traffic '
+                f'still goes to the {active_deployment[0]} one.',
+                CLI.COLOR_ERROR,
+            )
+            cls.__run_frontend_command(config, ['stop'])
+            config.set_deployment(*active_deployment)
+            Template.render(config, force=True)
+            sys.exit(1)
+
+        config.write_config()
+        config.write_unique_id()
+        cls.__hand_over(config, active_deployment)
+
+    @classmethod
+    def scale(cls, args):
+        """
+        Changes the number of replicas of front-end services, e.g.
+        `['kpi=3', 'worker=2']`, saves them in `.run.conf` and applies them
+        with `docker compose up --scale`.
+
+        Args:
+            args (list)
+        """
+        config = Config()
+        dict_ = config.get_dict()
+
+        if config.multi_servers and not config.frontend:
+            CLI.colored_print(
+                'Scaling is only available on front-end servers',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        replicas_keys = config.get_replicas_keys()
+        replicas = {}
+        for arg in args:
+            service, _, value = arg.partition('=')
+            if service not in replicas_keys or not re.match(r'^[1-9]\d*$', value):
+                CLI.colored_print(
+                    f'Invalid argument `{arg}`. Expected `<service>=<replicas>` '
+                    f"where service is one of: {', '.join(replicas_keys)}",
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+            replicas[service] = value
+
+        for service, value in replicas.items():
+            dict_[replicas_keys[service]] = value
+        config.write_config()
+        Template.render(config)
+
+        frontend_command = run_docker_compose(dict_, [
+            '-f', 'docker-compose.frontend.yml',
+            '-f', 'docker-compose.frontend.override.yml',
+            '-p', config.get_prefix('frontend'),
+            'up', '-d', '--no-deps',
+        ])
+        frontend_command += cls.__get_scale_arguments(config)
+        frontend_command += list(replicas)
+        cls.__validate_custom_yml(config, frontend_command)
+        CLI.run_command(frontend_command, dict_['kobodocker_path'])
+
+        if 'kpi' in replicas:
+            cls.__restart_nginx(config)
+
+        CLI.colored_print('Front-end services have been scaled',
+                          CLI.COLOR_SUCCESS)
+
+    @classmethod
+    def start(cls, frontend_only=False, force_setup=False, changed_files=None):
+        """
+        Start containers.
+
+        Args:
+            frontend_only (bool)
+            force_setup (bool)
+            changed_files (list): Files written by `Template.render()`. If
+                containers are already running, only the services which use
+                these files are recreated instead of restarting everything.
+        """
+        config = Config()
+        dict_ = config.get_dict()
+
+        # Download new images while current containers still serve traffic
+        cls.__pull_images(config, frontend_only)
+
+        if (
+            changed_files is not None
+            and not frontend_only
+            and cls.__recreate_services(config, changed_files)
+        ):
+            cls.__wait_for_environment(config, frontend_only)
+            return
+
         cls.stop(output=False, frontend_only=frontend_only)
         if frontend_only:
             CLI.colored_print('Launching front-end containers', CLI.COLOR_INFO)
@@ -287,6 +625,8 @@ class Command:
             ports.append(dict_['mongo_port'])
             ports.append(dict_['redis_main_port'])
             ports.append(dict_['redis_cache_port'])
+            if config.use_pgbouncer:
+                ports.append(dict_['pgbouncer_port'])
 
         for port in ports:
             if Network.is_port_open(port):
@@ -295,6 +635,8 @@ class Command:
                                   CLI.COLOR_ERROR)
                 sys.exit(1)
 
+        orchestrator = Orchestrator()
+
         # Start the back-end containers
         if not frontend_only and config.backend:
 
@@ -305,15 +647,44 @@ class Command:
                 'up', '-d'
             ])
 
+            if config.secondary_backend:
+                # Only the PostgreSQL read replica runs on secondary servers
+                backend_command.append('postgres')
+
             cls.__validate_custom_yml(config, backend_command)
-            CLI.run_command(backend_command, dict_['kobodocker_path'])
+            orchestrator.add_step(
+                'up:backend',
+                lambda: CLI.run_command(
+                    backend_command, dict_['kobodocker_path']
+                ),
+            )
+
+            if not config.secondary_backend:
+                orchestrator.add_step(
+                    'redis',
+                    lambda: cls.__tune_redis(config),
+                    depends_on=['up:backend'],
+                )
+
+            if not config.secondary_backend and dict_['postgres_replication']:
+                orchestrator.add_step(
+                    'replication',
+                    lambda: cls.__setup_postgres_replication(config),
+                    depends_on=['up:backend'],
+                )
 
         # Start the front-end containers
         if config.frontend:
 
             # If this was previously a shared-database setup, migrate to
-            # separate databases for KPI and KoboCAT
-            Upgrading.migrate_single_to_two_databases(config)
+            # separate databases for KPI and KoboCAT.
+            # Only one node of a cluster must do it.
+            if config.primary_frontend:
+                orchestrator.add_step(
+                    'migrate',
+                    lambda: Upgrading.migrate_single_to_two_databases(config),
+                    depends_on=['up:backend'],
+                )
 
             frontend_command = run_docker_compose(dict_, [
                 '-f', 'docker-compose.frontend.yml',
@@ -321,29 +692,50 @@ class Command:
                 '-p', config.get_prefix('frontend'),
                 'up', '-d',
             ])
+            frontend_command += cls.__get_scale_arguments(config)
 
             if dict_['maintenance_enabled']:
-                cls.start_maintenance()
+                # Maintenance container does not need the back end, it can be
+                # started while back-end containers are coming up.
+                orchestrator.add_step('up:maintenance', cls.start_maintenance)
                 # Start all front-end services except the non-maintenance NGINX
                 frontend_command.extend([
                     s for s in config.get_service_names() if s != 'nginx'
                 ])
 
             cls.__validate_custom_yml(config, frontend_command)
-            CLI.run_command(frontend_command, dict_['kobodocker_path'])
+            orchestrator.add_step(
+                'up:frontend',
+                lambda: CLI.run_command(
+                    frontend_command, dict_['kobodocker_path']
+                ),
+                depends_on=['migrate', 'up:maintenance'],
+            )
 
             # Start reverse proxy if user uses it.
             if config.use_letsencrypt:
-                if force_setup:
-                    # Let's Encrypt NGINX container needs kobo-docker NGINX
-                    # container to be started first
-                    config.init_letsencrypt()
-
-                proxy_command = run_docker_compose(dict_, ['up', '-d'])
-                CLI.run_command(
-                    proxy_command, config.get_letsencrypt_repo_path()
+                def start_certbot():
+                    if force_setup:
+                        # Let's Encrypt NGINX container needs kobo-docker NGINX
+                        # container to be started first
+                        config.init_letsencrypt()
+
+                    proxy_command = run_docker_compose(dict_, ['up', '-d'])
+                    CLI.run_command(
+                        proxy_command, config.get_letsencrypt_repo_path()
+                    )
+
+                orchestrator.add_step(
+                    'up:certbot', start_certbot, depends_on=['up:frontend']
                 )
 
+        orchestrator.run()
+        cls.__wait_for_environment(config, frontend_only)
+
+    @classmethod
+    def __wait_for_environment(cls, config, frontend_only):
+        dict_ = config.get_dict()
+
         if dict_['maintenance_enabled']:
             CLI.colored_print(
                 'Maintenance mode is enabled. To resume '
@@ -370,33 +762,66 @@ class Command:
         Because containers share the same network, containers must be stopped
         first, then "down-ed" to remove any attached internal networks.
         The order must respected to avoid removing networks with active endpoints.
+
+        Groups are stopped in parallel (see `helpers.orchestrator.Orchestrator`)
+        as long as the order above is respected.
         """
         config = Config()
+        orchestrator = Orchestrator()
 
         if not config.multi_servers or config.frontend:
             # Stop maintenance container in case it's up&running
-            cls.stop_containers('maintenance')
+            orchestrator.add_step(
+                'stop:maintenance', lambda: cls.stop_containers('maintenance')
+            )
 
             # Stop reverse proxy if user uses it.
             if config.use_letsencrypt:
-                cls.stop_containers('certbot')
+                orchestrator.add_step(
+                    'stop:certbot', lambda: cls.stop_containers('certbot')
+                )
 
             # Stop down front-end containers
-            cls.stop_containers('frontend')
+            orchestrator.add_step(
+                'stop:frontend', lambda: cls.stop_containers('frontend')
+            )
 
             # Clean maintenance services
-            cls.stop_containers('maintenance', down=True)
+            orchestrator.add_step(
+                'down:maintenance',
+                lambda: cls.stop_containers('maintenance', down=True),
+                depends_on=['stop:maintenance', 'stop:certbot', 'stop:frontend'],
+            )
 
             # Clean certbot services if user uses it.
             if config.use_letsencrypt:
-                cls.stop_containers('certbot', down=True)
+                orchestrator.add_step(
+                    'down:certbot',
+                    lambda: cls.stop_containers('certbot', down=True),
+                    depends_on=[
+                        'stop:maintenance', 'stop:certbot', 'stop:frontend'
+                    ],
+                )
 
+        # Front-end containers are attached to the back-end network. It can
+        # only be removed when they are stopped.
         if not frontend_only and config.backend:
-            cls.stop_containers('backend', down=True)
+            orchestrator.add_step(
+                'down:backend',
+                lambda: cls.stop_containers('backend', down=True),
+                depends_on=['stop:maintenance', 'stop:certbot', 'stop:frontend'],
+            )
 
-        # Clean front-end services
+        # Clean front-end services. Front-end network is shared with
+        # maintenance and certbot containers, they must be removed first.
         if not config.multi_servers or config.frontend:
-            cls.stop_containers('frontend', down=True)
+            orchestrator.add_step(
+                'down:frontend',
+                lambda: cls.stop_containers('frontend', down=True),
+                depends_on=['stop:frontend', 'down:maintenance', 'down:certbot'],
+            )
+
+        orchestrator.run()
 
         if output:
             CLI.colored_print('KoboToolbox has been stopped', CLI.COLOR_SUCCESS)
@@ -492,6 +917,518 @@ class Command:
             CLI.COLOR_SUCCESS,
         )
 
+    @classmethod
+    def __is_running(cls, config):
+        """
+        Returns whether containers of each project managed on this server have
+        been started.
+        """
+        dict_ = config.get_dict()
+        projects = []
+        if config.backend:
+            projects.append(('backend', 'docker-compose.backend'))
+        if not config.multi_servers or config.frontend:
+            projects.append(('frontend', 'docker-compose.frontend'))
+
+        for project, compose_file in projects:
+            command = run_docker_compose(dict_, [
+                '-f', f'{compose_file}.yml',
+                '-f', f'{compose_file}.override.yml',
+                '-p', config.get_prefix(project),
+                'ps', '--services', '--status', 'running',
+            ])
+            cls.__validate_custom_yml(config, command)
+            if not CLI.run_command(command, dict_['kobodocker_path']).strip():
+                return False
+
+        return True
+
+    @classmethod
+    def __recreate_services(cls, config, changed_files):
+        """
+        Recreates only the services which consume `changed_files` (see
+        `Template.SERVICES_BY_RENDERED_FILE`) with
+        `docker compose up -d --no-deps`.
+
+        Returns:
+            bool: `False` if a full restart is needed instead
+        """
+        affected_services = Template.get_affected_services(changed_files)
+        if affected_services is None or not cls.__is_running(config):
+            return False
+
+        dict_ = config.get_dict()
+        CLI.colored_print('Recreating updated containers', CLI.COLOR_INFO)
+
+        projects = []
+        if config.backend:
+            excluded_services = []
+            if config.secondary_backend:
+                excluded_services = [
+                    s for s in Template.BACKEND_SERVICES if s != 'postgres'
+                ]
+            projects.append(
+                ('backend', 'docker-compose.backend', excluded_services)
+            )
+        if not config.multi_servers or config.frontend:
+            excluded_services = []
+            if dict_['maintenance_enabled']:
+                # Do not start the non-maintenance NGINX
+                excluded_services.append('nginx')
+            projects.append(
+                ('frontend', 'docker-compose.frontend', excluded_services)
+            )
+
+        for project, compose_file, excluded_services in projects:
+            base_command = run_docker_compose(dict_, [
+                '-f', f'{compose_file}.yml',
+                '-f', f'{compose_file}.override.yml',
+                '-p', config.get_prefix(project),
+                'up', '-d', '--no-deps',
+            ])
+            if project == 'frontend':
+                base_command += cls.__get_scale_arguments(config)
+            cls.__validate_custom_yml(config, base_command)
+
+            # Files mounted in containers are not tracked by compose, services
+            # which use them must be recreated explicitly.
+            services = [
+                s
+                for s in affected_services.get(project, [])
+                if s not in excluded_services
+            ]
+            if services:
+                CLI.run_command(
+                    base_command + ['--force-recreate'] + services,
+                    dict_['kobodocker_path'],
+                )
+
+            # Let compose recreate services whose configuration has changed
+            # (e.g. override files or image versions)
+            if project == 'frontend' and excluded_services:
+                CLI.run_command(
+                    base_command + [
+                        s
+                        for s in config.get_service_names()
+                        if s not in excluded_services
+                    ],
+                    dict_['kobodocker_path'],
+                )
+            elif project == 'backend' and config.secondary_backend:
+                CLI.run_command(
+                    base_command + ['postgres'], dict_['kobodocker_path']
+                )
+            else:
+                CLI.run_command(base_command, dict_['kobodocker_path'])
+
+            if project == 'backend' and not config.secondary_backend:
+                cls.__tune_redis(config)
+                if dict_['postgres_replication']:
+                    cls.__setup_postgres_replication(config)
+
+        if 'maintenance' in affected_services and dict_['maintenance_enabled']:
+            cls.start_maintenance()
+        elif (
+            'kobo-docker/docker-compose.frontend.override.yml' in changed_files
+            and not dict_['maintenance_enabled']
+            and (not config.multi_servers or config.frontend)
+        ):
+            # `kpi` containers may have been scaled or recreated
+            cls.__restart_nginx(config)
+
+        return True
+
+    @staticmethod
+    def __get_scale_arguments(config):
+        """
+        Returns `--scale <service>=<replicas>` arguments of `docker compose up`
+        for front-end services which can be scaled.
+        """
+        arguments = []
+        for service, replicas in config.get_replicas().items():
+            arguments += ['--scale', f'{service}={replicas}']
+        return arguments
+
+    @classmethod
+    def __setup_postgres_replication(cls, config):
+        """
+        Creates the replication user on the primary PostgreSQL server and
+        allows secondary back-end servers to connect with it.
+        """
+        dict_ = config.get_dict()
+        replication_command = run_docker_compose(dict_, [
+            '-f', 'docker-compose.backend.yml',
+            '-f', 'docker-compose.backend.override.yml',
+            '-p', config.get_prefix('backend'),
+            'exec', '-T', 'postgres',
+            'bash', '/kobo-install-scripts/replication/primary.bash',
+        ])
+        cls.__validate_custom_yml(config, replication_command)
+        CLI.run_command(replication_command, dict_['kobodocker_path'])
+
+    @classmethod
+    def __tune_redis(cls, config):
+        """
+        Applies memory and persistence settings to both Redis instances
+        (see `RedisTuning`). Containers do not need to be restarted.
+        """
+        dict_ = config.get_dict()
+        for service, port in RedisTuning.PORTS.items():
+            tuning_command = run_docker_compose(dict_, [
+                '-f', 'docker-compose.backend.yml',
+                '-f', 'docker-compose.backend.override.yml',
+                '-p', config.get_prefix('backend'),
+                'exec', '-T', service,
+                'bash', '/kobo-install-scripts/redis/apply.bash', service, port,
+            ])
+            cls.__validate_custom_yml(config, tuning_command)
+            CLI.run_command(tuning_command, dict_['kobodocker_path'])
+
+    @classmethod
+    def __pull_images(cls, config, frontend_only=False):
+        """
+        Pulls images of back-end, front-end and Let's Encrypt projects in
+        parallel, before any containers are stopped or recreated. Front-end
+        images are pulled one by one to report progress per image. Images of
+        services which are built locally are skipped.
+
+        Failures (e.g. offline host, registry rate limit) are only reported:
+        containers are started with the images which are already present.
+        """
+        dict_ = config.get_dict()
+        orchestrator = Orchestrator()
+        pulled = []
+
+        def add_step(name, command, cwd):
+            def pull():
+                CLI.colored_print(f'Pulling {name}...', CLI.COLOR_INFO)
+                exit_code = CLI.run_command(command, cwd, polling=True)
+                pulled.append(name)
+                if exit_code == 0:
+                    CLI.colored_print(
+                        f'{name} is ready ({len(pulled)}/{len(steps)})',
+                        CLI.COLOR_SUCCESS,
+                    )
+                else:
+                    CLI.colored_print(
+                        f'Could not pull {name}, local images will be used '
+                        f'({len(pulled)}/{len(steps)})',
+                        CLI.COLOR_WARNING,
+                    )
+
+            steps.append(name)
+            orchestrator.add_step(f'pull:{name}', pull)
+
+        steps = []
+
+        if not frontend_only and config.backend:
+            backend_command = run_docker_compose(dict_, [
+                '-f', 'docker-compose.backend.yml',
+                '-f', 'docker-compose.backend.override.yml',
+                '-p', config.get_prefix('backend'),
+                'pull', '--quiet', '--ignore-pull-failures',
+            ])
+            if config.secondary_backend:
+                backend_command.append('postgres')
+            cls.__validate_custom_yml(config, backend_command)
+            add_step(
+                'back-end images', backend_command, dict_['kobodocker_path']
+            )
+
+        if config.frontend:
+            # Several services (e.g. Celery workers) share the same image
+            services_by_image = {}
+            for service, properties in config.get_service_catalog().items():
+                if properties.get('build') or not properties.get('image'):
+                    continue
+                services_by_image.setdefault(properties['image'], service)
+
+            for image, service in sorted(services_by_image.items()):
+                frontend_command = run_docker_compose(dict_, [
+                    '-f', 'docker-compose.frontend.yml',
+                    '-f', 'docker-compose.frontend.override.yml',
+                    '-p', config.get_prefix('frontend'),
+                    'pull', '--quiet', '--ignore-pull-failures', service,
+                ])
+                cls.__validate_custom_yml(config, frontend_command)
+                add_step(
+                    f'`{image}`', frontend_command, dict_['kobodocker_path']
+                )
+
+            if config.use_letsencrypt:
+                add_step(
+                    "Let's Encrypt images",
+                    run_docker_compose(
+                        dict_, ['pull', '--quiet', '--ignore-pull-failures']
+                    ),
+                    config.get_letsencrypt_repo_path(),
+                )
+
+        if steps:
+            orchestrator.run()
+
+    @classmethod
+    def __get_proxy_container(cls, config):
+        """
+        Returns:
+            str: id of Let's Encrypt NGINX container
+        """
+        dict_ = config.get_dict()
+        ps_command = run_docker_compose(dict_, ['ps', '-q', 'nginx_ssl_proxy'])
+        container_id = CLI.run_command(
+            ps_command, config.get_letsencrypt_repo_path()
+        ).strip()
+        if not container_id:
+            CLI.colored_print(
+                "Let's Encrypt NGINX is not running", CLI.COLOR_ERROR
+            )
+            sys.exit(1)
+        return container_id
+
+    @classmethod
+    def __hand_over(cls, config, previous_deployment):
+        """
+        Stops the front end of `previous_deployment`, i.e. `(color, path)`,
+        without removing its containers, then starts `beat` on the active one.
+        """
+        dict_ = config.get_dict()
+        active_deployment = (
+            dict_['deployment_color'], dict_['kobodocker_path']
+        )
+
+        config.set_deployment(*previous_deployment)
+        cls.__run_frontend_command(config, ['stop'])
+        config.set_deployment(*active_deployment)
+        cls.__run_frontend_command(config, ['up', '-d', '--no-deps', 'beat'])
+
+        CLI.colored_print(
+            f'{active_deployment[0].capitalize()} front end is serving '
+            f'traffic. Use `python3 run.py --rollback` to go back to the '
+            f'{previous_deployment[0]} one.',
+            CLI.COLOR_SUCCESS,
+        )
+
+    @classmethod
+    def __is_frontend_healthy(cls, config, timeout):
+        """
+        Probes NGINX of the active front end from Let's Encrypt NGINX
+        container, i.e. the way traffic will go once it is switched.
+
+        Returns:
+            bool
+        """
+        dict_ = config.get_dict()
+        upstream = f"nginx-{dict_['deployment_color']}"
+        domain_name = dict_['public_domain_name']
+
+        start = time.time()
+        for hostname, endpoint in [
+            (f"{dict_['kpi_subdomain']}.{domain_name}", '/service_health/'),
+            (f"{dict_['ee_subdomain']}.{domain_name}", '/'),
+        ]:
+            delay = Readiness.INITIAL_DELAY
+            while cls.__run_proxy_command(config, [
+                'sh', '-c',
+                f"wget -q -O /dev/null --header 'Host: {hostname}' "
+                f"--header 'X-Forwarded-Proto: https' "
+                f"'http://{upstream}{endpoint}' 2>/dev/null",
+            ]) != 0:
+                if time.time() - start >= timeout:
+                    CLI.colored_print(
+                        f'  `{hostname}` is not ready', CLI.COLOR_WARNING
+                    )
+                    return False
+                time.sleep(delay)
+                delay = min(delay * Readiness.BACKOFF_FACTOR,
+                            Readiness.MAX_DELAY)
+
+            CLI.colored_print(f'  `{hostname}` is ready', CLI.COLOR_SUCCESS)
+
+        return True
+
+    @classmethod
+    def __remove_frontend(cls, config):
+        """
+        Takes down the containers of the active front end, if it has ever
+        been rendered, after disconnecting Let's Encrypt NGINX from its
+        network.
+        """
+        dict_ = config.get_dict()
+        if not os.path.isfile(os.path.join(
+            dict_['kobodocker_path'], 'docker-compose.frontend.override.yml'
+        )):
+            return
+
+        container_id = cls.__get_proxy_container(config)
+        network = f"{config.get_prefix('frontend')}_kobo-fe-network"
+        if network in cls.__get_container_networks(container_id):
+            CLI.run_command(
+                ['docker', 'network', 'disconnect', network, container_id]
+            )
+
+        cls.__run_frontend_command(config, ['down'])
+
+    @staticmethod
+    def __get_container_networks(container_id):
+        inspect_command = [
+            'docker', 'inspect', '--format',
+            '{{json .NetworkSettings.Networks}}', container_id,
+        ]
+        return list(json.loads(CLI.run_command(inspect_command) or '{}'))
+
+    @classmethod
+    def __run_frontend_command(cls, config, args):
+        dict_ = config.get_dict()
+        frontend_command = run_docker_compose(dict_, [
+            '-f', 'docker-compose.frontend.yml',
+            '-f', 'docker-compose.frontend.override.yml',
+            '-p', config.get_prefix('frontend'),
+        ] + args)
+        cls.__validate_custom_yml(config, frontend_command)
+        return CLI.run_command(frontend_command, dict_['kobodocker_path'])
+
+    @staticmethod
+    def __run_proxy_command(config, args):
+        """
+        Runs `args` in Let's Encrypt NGINX container.
+
+        Returns:
+            int: exit code
+        """
+        dict_ = config.get_dict()
+        exec_command = run_docker_compose(
+            dict_, ['exec', '-T', 'nginx_ssl_proxy'] + args
+        )
+        return CLI.run_command(
+            exec_command, config.get_letsencrypt_repo_path(), polling=True
+        )
+
+    @classmethod
+    def __switch_proxy(cls, config, timeout):
+        """
+        Connects Let's Encrypt NGINX to the network of the active front end
+        and, once this front end is healthy, reloads NGINX with the rendered
+        configuration. Reloading is graceful: current requests are completed
+        by the previous workers.
+
+        Returns:
+            bool: `True` if traffic goes to the active front end
+        """
+        container_id = cls.__get_proxy_container(config)
+        network = f"{config.get_prefix('frontend')}_kobo-fe-network"
+        if network not in cls.__get_container_networks(container_id):
+            CLI.run_command(
+                ['docker', 'network', 'connect', network, container_id]
+            )
+
+        CLI.colored_print('Waiting for the new front end to be ready',
+                          CLI.COLOR_INFO)
+        if not cls.__is_frontend_healthy(config, timeout):
+            return False
+
+        if cls.__run_proxy_command(config, ['nginx', '-t', '-q']) != 0:
+            return False
+
+        return cls.__run_proxy_command(config, ['nginx', '-s', 'reload']) == 0
+
+    @classmethod
+    def __validate_blue_green(cls, config):
+        dict_ = config.get_dict()
+        if not config.use_letsencrypt:
+            CLI.colored_print(
+                "Blue/green deployments need Let's Encrypt NGINX to switch "
+                'traffic between front ends',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        if config.multi_servers and not config.frontend:
+            CLI.colored_print(
+                'Blue/green deployments are only available on front-end '
+                'servers',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        if dict_['maintenance_enabled']:
+            CLI.colored_print(
+                'Please stop maintenance mode first', CLI.COLOR_ERROR
+            )
+            sys.exit(1)
+
+        # Fail before changing anything if NGINX is not running
+        cls.__get_proxy_container(config)
+
+    @classmethod
+    def __restart_nginx(cls, config):
+        """
+        NGINX resolves `kpi` when it starts. Restarting it makes it balance
+        requests across all current `kpi` replicas.
+        """
+        dict_ = config.get_dict()
+        nginx_command = run_docker_compose(dict_, [
+            '-f', 'docker-compose.frontend.yml',
+            '-f', 'docker-compose.frontend.override.yml',
+            '-p', config.get_prefix('frontend'),
+            'restart', 'nginx',
+        ])
+        cls.__validate_custom_yml(config, nginx_command)
+        CLI.run_command(nginx_command, dict_['kobodocker_path'])
+
+    @classmethod
+    def __get_rolling_restart_order(cls, services):
+        order = cls.ROLLING_RESTART_ORDER
+        position_of_unknown = order.index('nginx')
+
+        def _sort_key(service):
+            try:
+                return order.index(service), service
+            except ValueError:
+                return position_of_unknown - 0.5, service
+
+        return sorted(services, key=_sort_key)
+
+    @classmethod
+    def __wait_for_service(cls, config, service, timeout):
+        """
+        Waits for all containers of `service` to be healthy.
+        Containers without health check are considered ready when running.
+
+        Returns:
+            bool
+        """
+        dict_ = config.get_dict()
+        ps_command = run_docker_compose(dict_, [
+            '-f', 'docker-compose.frontend.yml',
+            '-f', 'docker-compose.frontend.override.yml',
+            '-p', config.get_prefix('frontend'),
+            'ps', '-q', service,
+        ])
+        cls.__validate_custom_yml(config, ps_command)
+
+        start = int(time.time())
+        while int(time.time()) - start < timeout:
+            container_ids = CLI.run_command(
+                ps_command, dict_['kobodocker_path']
+            ).split()
+            if container_ids:
+                inspect_command = [
+                    'docker', 'inspect', '--format',
+                    '{{if .State.Health}}{{.State.Health.Status}}'
+                    '{{else}}{{.State.Status}}{{end}}',
+                ] + container_ids
+                statuses = CLI.run_command(inspect_command).split()
+                if any(s in ['unhealthy', 'exited', 'dead'] for s in statuses):
+                    return False
+                if all(s in ['healthy', 'running'] for s in statuses):
+                    return True
+
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            time.sleep(2)
+
+        return False
+
     @staticmethod
     def __validate_custom_yml(config, command):
         """
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import binascii
+import hashlib
 import json
 import os
 import re
@@ -13,7 +14,11 @@ from random import choice
 
 from helpers.aws_validation import AWSValidation
 from helpers.cli import CLI
+from helpers.git_sync import GitSync
+from helpers.host_profile import HostProfile
 from helpers.network import Network
+from helpers.postgres_tuning import PostgresTuning
+from helpers.redis_tuning import RedisTuning
 from helpers.singleton import Singleton
 from helpers.upgrading import Upgrading
 from helpers.utils import run_docker_compose
@@ -26,18 +31,46 @@ class Config(metaclass=Singleton):
     CONFIG_FILE = '.run.conf'
     UNIQUE_ID_FILE = '.uniqid'
     UPSERT_DB_USERS_TRIGGER_FILE = '.upsert_db_users'
+    SERVICE_CATALOG_FILE = '.service_catalog.json'
     LETSENCRYPT_DOCKER_DIR = 'nginx-certbot'
     ENV_FILES_DIR = 'kobo-env'
+    BLUE_DEPLOYMENT = 'blue'
+    GREEN_DEPLOYMENT = 'green'
     DEFAULT_PROXY_PORT = '8080'
     DEFAULT_NGINX_PORT = '80'
     DEFAULT_NGINX_HTTPS_PORT = '443'
     KOBO_DOCKER_BRANCH = '2.026.23a'
     KOBO_INSTALL_VERSION = '10.2.0'
     MAXIMUM_AWS_CREDENTIAL_ATTEMPTS = 3
+    POSTGRES_REPLICATION_USER = 'kobo_replication'
+    # Keys which are specific to each node of a front-end cluster, thus
+    # not exported with `--export-cluster`
+    CLUSTER_NODE_KEYS = [
+        'date_created',
+        'date_modified',
+        'deployment_color',
+        'kobodocker_path',
+        'local_interface',
+        'local_interface_ip',
+        'primary_frontend',
+        'unique_id',
+    ]
+    # Celery workers of the front end, one per queue
+    CELERY_WORKERS = [
+        'worker',
+        'worker_kobocat',
+        'worker_low_priority',
+        'worker_long_running_tasks',
+    ]
     ALLOWED_PASSWORD_CHARACTERS = (
         string.ascii_letters
         + string.digits
     )
+    BACKUP_SCHEDULE_PATTERN = (
+        r'^\-|((((\d+(,\d+)*)|(\d+-\d+)|(\*(\/\d+)?)))'
+        r'(\s+(((\d+(,\d+)*)|(\d+\-\d+)|(\*(\/\d+)?)))){4})?$'
+    )
+    IPV4_PATTERN = r'~\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}'
 
     def __init__(self):
         self.__first_time = None
@@ -79,6 +112,31 @@ class Config(metaclass=Singleton):
         """
         return self.__dict['use_aws']
 
+    def apply_host_profile(self, host_profile=None):
+        """
+        Sizes PostgreSQL, MongoDB, Redis, uWSGI and Celery according to the
+        resources of the host (see `HostProfile`).
+        Does not ask anything, thus it can be used non-interactively.
+
+        Args:
+            host_profile (HostProfile): Detected from this host if omitted
+
+        Returns:
+            dict: applied values
+        """
+        if host_profile is None:
+            host_profile = HostProfile.detect()
+
+        proposals = host_profile.get_proposals(
+            frontend=self.frontend, backend=self.backend
+        )
+        self.__dict.update(proposals)
+        CLI.colored_print(
+            f'Defaults have been sized for this host ({host_profile}).',
+            CLI.COLOR_INFO,
+        )
+        return proposals
+
     @property
     def backend(self):
         return self.__dict['server_role'] == 'backend' or not self.multi_servers
@@ -114,6 +172,7 @@ class Config(metaclass=Singleton):
                     if self.multi_servers:
                         self.__questions_roles()
                         if self.frontend:
+                            self.__questions_frontend_nodes()
                             self.__questions_private_routes()
                     else:
                         self.__reset(fake_dns=True)
@@ -123,15 +182,24 @@ class Config(metaclass=Singleton):
                     self.__questions_https()
                     self.__questions_reverse_proxy()
 
+            if self.first_time:
+                # Server roles are known, propose defaults for this host
+                self.apply_host_profile()
+
             if self.frontend:
                 self.__questions_smtp()
                 self.__questions_super_user_credentials()
 
             if self.advanced_options:
                 self.__questions_docker_prefix()
+                self.__questions_git_reference()
                 self.__questions_dev_mode()
                 self.__questions_postgres()
+                if self.multi_servers:
+                    self.__questions_postgres_replication()
+                self.__questions_pgbouncer()
                 self.__questions_mongo()
+                self.__questions_mongo_settings()
                 self.__questions_redis()
                 self.__questions_ports()
 
@@ -141,7 +209,10 @@ class Config(metaclass=Singleton):
                     self.__questions_google()
                     self.__questions_raven()
                     self.__questions_uwsgi()
+                    self.__questions_celery()
                     self.__questions_session_cookies()
+                    if self.use_letsencrypt:
+                        self.__questions_ssl_proxy()
 
                 self.__questions_custom_yml()
 
@@ -154,6 +225,112 @@ class Config(metaclass=Singleton):
 
             return self.__dict
 
+    def build_from_answers(self, path):
+        """
+        Builds configuration from an answers file instead of asking
+        questions. Answers use the keys of `.run.conf` and are validated with
+        the same rules as the questions. Missing answers keep their current
+        (or default) values.
+
+        Nothing is asked: `CLI` is switched to non-interactive mode for the
+        rest of the execution and it exits on the first invalid value.
+
+        Args:
+            path (str): JSON file, or YAML file if PyYAML is installed
+
+        Returns:
+            dict
+        """
+        answers = self.__load_answers(path)
+        errors = self.validate_answers(answers)
+        if errors:
+            for error in errors:
+                CLI.colored_print(error, CLI.COLOR_ERROR)
+            sys.exit(1)
+
+        if not Network.get_primary_ip():
+            CLI.colored_print(
+                'No valid networks detected. Cannot continue!',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        CLI.non_interactive = True
+        self.__dict = self.get_upgraded_dict()
+        self.__dict.update(answers)
+
+        kobodocker_path = self.__dict['kobodocker_path']
+        if kobodocker_path.startswith('.'):
+            base_dir = os.path.dirname(
+                os.path.dirname(os.path.realpath(__file__)))
+            kobodocker_path = os.path.normpath(
+                os.path.join(base_dir, kobodocker_path))
+        try:
+            os.makedirs(kobodocker_path, exist_ok=True)
+        except OSError:
+            CLI.colored_print(
+                f'Could not create directory {kobodocker_path}!',
+                CLI.COLOR_ERROR)
+            sys.exit(1)
+        self.__dict['kobodocker_path'] = kobodocker_path
+        self.write_unique_id()
+        self.__validate_installation()
+
+        if 'local_interface' in answers:
+            interfaces = Network.get_local_interfaces(all_=True)
+            if self.__dict['local_interface'] not in interfaces:
+                CLI.colored_print(
+                    f"Unknown network interface: "
+                    f"{self.__dict['local_interface']}",
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+            self.__dict['local_interface_ip'] = interfaces[
+                self.__dict['local_interface']
+            ]
+        else:
+            self.__dict['local_interface_ip'] = Network.get_primary_ip()
+
+        if self.frontend and not self.multi_servers:
+            self.__dict['primary_backend_ip'] = self.__dict[
+                'local_interface_ip']
+
+        if self.first_time:
+            self.apply_host_profile()
+            # Answers win over detected values
+            self.__dict.update(answers)
+
+        if self.use_letsencrypt:
+            self.__dict['proxy'] = True
+            self.__dict['nginx_proxy_port'] = Config.DEFAULT_PROXY_PORT
+            self.__dict[
+                'exposed_nginx_docker_port'] = Config.DEFAULT_NGINX_PORT
+            self.__clone_repo(self.get_letsencrypt_repo_path(),
+                              'nginx-certbot')
+
+        if self.__dict['postgres_settings']:
+            self.__dict['postgres_settings_content'] = (
+                PostgresTuning.get_settings_content(
+                    cpus=self.__dict['postgres_cpus'],
+                    ram=self.__dict['postgres_ram'],
+                    drive_type=self.__dict['postgres_hard_drive_type'],
+                    max_connections=self.__dict['postgres_max_connections'],
+                    profile=self.__dict['postgres_profile'],
+                )
+            )
+        else:
+            self.__dict['postgres_settings_content'] = (
+                self.get_static_template()['postgres_settings_content']
+            )
+
+        self.__secure_mongo()
+        self.write_config()
+
+        CLI.colored_print(
+            f'Configuration has been built from `{path}`', CLI.COLOR_SUCCESS
+        )
+        return self.__dict
+
     @property
     def block_common_http_ports(self):
         return self.use_letsencrypt or self.__dict['block_common_http_ports']
@@ -162,6 +339,46 @@ class Config(metaclass=Singleton):
     def expose_backend_ports(self):
         return self.__dict['expose_backend_ports']
 
+    def export_cluster(self, path):
+        """
+        Writes the configuration shared by all front-end nodes (i.e. all
+        settings and secrets except `Config.CLUSTER_NODE_KEYS`) to `path`,
+        to be imported on another node with `--import-cluster`.
+
+        Args:
+            path (str)
+        """
+        if not self.multi_servers or not self.frontend:
+            CLI.colored_print(
+                'Only front-end servers can be exported',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        cluster_config = {
+            key: value
+            for key, value in self.__dict.items()
+            if key not in self.CLUSTER_NODE_KEYS
+        }
+        content = json.dumps({
+            'kobo_install_version': self.KOBO_INSTALL_VERSION,
+            'config': cluster_config,
+        }, indent=2, sort_keys=True)
+
+        # File contains secrets, only its owner can read it
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+
+        CLI.framed_print(
+            f'Cluster configuration has been exported to `{path}`.\n\n'
+            'It contains passwords and secret keys. Copy it to the other '
+            'front-end nodes and run:\n'
+            f'  python3 run.py --import-cluster {os.path.basename(path)}\n'
+            'Then delete it.',
+            color=CLI.COLOR_INFO,
+        )
+
     def get_env_files_path(self):
         current_path = os.path.realpath(os.path.normpath(os.path.join(
             self.__dict['kobodocker_path'],
@@ -181,6 +398,21 @@ class Config(metaclass=Singleton):
 
         return current_path
 
+    def get_idle_deployment(self):
+        """
+        Returns the color and the kobo-docker directory of the blue/green
+        deployment which does not serve traffic. The green directory is the
+        blue one suffixed with `-green`.
+
+        Returns:
+            tuple
+        """
+        kobodocker_path = self.__dict['kobodocker_path']
+        suffix = f'-{Config.GREEN_DEPLOYMENT}'
+        if self.__dict['deployment_color'] == Config.GREEN_DEPLOYMENT:
+            return Config.BLUE_DEPLOYMENT, kobodocker_path[:-len(suffix)]
+        return Config.GREEN_DEPLOYMENT, f'{kobodocker_path}{suffix}'
+
     def get_letsencrypt_repo_path(self):
         return os.path.realpath(os.path.normpath(os.path.join(
             self.__dict['kobodocker_path'],
@@ -201,6 +433,13 @@ class Config(metaclass=Singleton):
             CLI.colored_print('Invalid composer file', CLI.COLOR_ERROR)
             sys.exit(1)
 
+        if (
+            role == 'frontend'
+            and self.__dict.get('deployment_color') == Config.GREEN_DEPLOYMENT
+        ):
+            # See `Command.deploy_blue_green()`
+            prefix_ = f'{prefix_}-{Config.GREEN_DEPLOYMENT}'
+
         if not self.__dict['docker_prefix']:
             return prefix_
 
@@ -215,7 +454,12 @@ class Config(metaclass=Singleton):
             dict
         """
 
-        upgraded_dict = self.get_template()
+        upgraded_dict = self.get_static_template()
+        # Only generate secrets and detect network for missing keys
+        upgraded_dict.update(
+            self.get_dynamic_template(skipped_keys=self.__dict)
+        )
+        upgraded_dict = dict(sorted(upgraded_dict.items()))
         upgraded_dict.update(self.__dict)
 
         # Upgrade to use two databases
@@ -226,6 +470,59 @@ class Config(metaclass=Singleton):
 
         return upgraded_dict
 
+    def import_cluster(self, path):
+        """
+        Reads the configuration exported by another front-end node with
+        `--export-cluster`. Node-specific values are detected again and this
+        node is not the primary one.
+
+        Args:
+            path (str)
+
+        Returns:
+            dict
+        """
+        try:
+            with open(path, 'r') as f:
+                exported = json.loads(f.read())
+            cluster_config = exported['config']
+            version = exported['kobo_install_version']
+        except (IOError, ValueError, KeyError):
+            CLI.colored_print(
+                f'`{path}` is not a valid cluster configuration file',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        if version != self.KOBO_INSTALL_VERSION:
+            CLI.colored_print(
+                f'Cluster configuration comes from kobo-install {version}. '
+                f'Please update this node (currently '
+                f'{self.KOBO_INSTALL_VERSION}) first.',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        node_config = {
+            key: value
+            for key, value in self.__dict.items()
+            if key in self.CLUSTER_NODE_KEYS
+        }
+        node_config.update({
+            key: value
+            for key, value in cluster_config.items()
+            if key not in self.CLUSTER_NODE_KEYS
+        })
+        node_config['primary_frontend'] = False
+        self.__dict = node_config
+        self.__dict = self.get_upgraded_dict()
+        self.write_config()
+
+        CLI.colored_print(
+            'Cluster configuration has been imported', CLI.COLOR_SUCCESS
+        )
+        return self.__dict
+
     @property
     def dev_mode(self):
         return self.__dict['dev_mode'] is True
@@ -255,6 +552,35 @@ class Config(metaclass=Singleton):
             not self.multi_servers or self.__dict['server_role'] == 'frontend'
         )
 
+    @property
+    def frontend_cluster(self):
+        """
+        Checks whether this server is one of several front-end nodes sharing
+        the same back end
+
+        Returns:
+            bool
+        """
+        return (
+            self.multi_servers
+            and self.frontend
+            and len(self.frontend_nodes) > 1
+        )
+
+    @property
+    def frontend_nodes(self):
+        """
+        Returns addresses of all front-end nodes
+
+        Returns:
+            list
+        """
+        return [
+            node.strip()
+            for node in self.__dict['frontend_nodes'].split(',')
+            if node.strip()
+        ]
+
     @classmethod
     def generate_password(cls, required_chars_count=20):
         """
@@ -271,25 +597,193 @@ class Config(metaclass=Singleton):
     def get_dict(self):
         return self.__dict
 
-    def get_service_names(self):
-        service_list_command = run_docker_compose(self.__dict, [
-            '-f', 'docker-compose.frontend.yml',
-            '-f', 'docker-compose.frontend.override.yml',
-            'config', '--services',
-        ])
+    @classmethod
+    def get_replicas_keys(cls):
+        """
+        Returns the `.run.conf` key holding the number of replicas of each
+        front-end service which can be scaled.
+
+        Returns:
+            dict
+        """
+        replicas_keys = {'kpi': 'kpi_replicas'}
+        for worker in cls.CELERY_WORKERS:
+            replicas_keys[worker] = f'celery_{worker}_replicas'
+        return replicas_keys
+
+    def get_replicas(self):
+        """
+        Returns the number of replicas of each front-end service which can
+        be scaled, e.g. `{'kpi': 2, 'worker': 1, ...}`
+
+        Returns:
+            dict
+        """
+        return {
+            service: int(self.__dict[key])
+            for service, key in self.get_replicas_keys().items()
+        }
 
-        services = CLI.run_command(
-            service_list_command, self.__dict['kobodocker_path']
+    def get_service_catalog(self):
+        """
+        Returns front-end services with their dependencies and images, e.g.:
+        `{'kpi': {'build': False, 'depends_on': ['worker'],
+                  'image': 'kobotoolbox/kpi:...'}}`
+
+        Parsing the compose project is slow, so the result is cached in
+        `Config.SERVICE_CATALOG_FILE` until one of the compose files changes.
+
+        Returns:
+            dict
+        """
+        compose_files = ['docker-compose.frontend.yml',
+                         'docker-compose.frontend.override.yml']
+        if self.__dict['use_frontend_custom_yml']:
+            compose_files.append('docker-compose.frontend.custom.yml')
+
+        catalog_file = os.path.join(
+            self.get_env_files_path(), Config.SERVICE_CATALOG_FILE
         )
-        return services.strip().split('\n')
+        try:
+            with open(catalog_file, 'r') as f:
+                catalog = json.loads(f.read())
+            known_fingerprints = catalog['fingerprints']
+            services = catalog['services']
+        except (IOError, ValueError, KeyError, TypeError):
+            known_fingerprints = {}
+            services = None
+
+        fingerprints = self.__get_compose_files_fingerprints(
+            compose_files, known_fingerprints
+        )
+        if (
+            fingerprints is not None
+            and services is not None
+            and sorted(fingerprints) == sorted(known_fingerprints)
+            and all(
+                fingerprint['sha256']
+                == known_fingerprints[compose_file]['sha256']
+                for compose_file, fingerprint in fingerprints.items()
+            )
+        ):
+            if fingerprints != known_fingerprints:
+                # Files have been touched but not modified
+                self.__write_service_catalog(
+                    catalog_file, fingerprints, services
+                )
+            return services
+
+        compose_args = []
+        for compose_file in compose_files:
+            compose_args += ['-f', compose_file]
+        service_config_command = run_docker_compose(
+            self.__dict, compose_args + ['config', '--format', 'json']
+        )
+        compose_config = json.loads(CLI.run_command(
+            service_config_command, self.__dict['kobodocker_path']
+        ))
+
+        services = {}
+        for name, service in compose_config.get('services', {}).items():
+            services[name] = {
+                # Images of services which are built locally cannot be pulled
+                'build': 'build' in service,
+                # `depends_on` is a list in short syntax, a dict otherwise
+                'depends_on': sorted(service.get('depends_on') or []),
+                'image': service.get('image', ''),
+            }
+
+        if fingerprints is not None:
+            self.__write_service_catalog(catalog_file, fingerprints, services)
+
+        return services
+
+    def get_service_names(self):
+        return list(self.get_service_catalog())
+
+    def clear_service_catalog(self):
+        """
+        Deletes cached front-end services (see `Config.get_service_catalog()`)
+        """
+        try:
+            os.remove(os.path.join(
+                self.get_env_files_path(), Config.SERVICE_CATALOG_FILE
+            ))
+        except OSError:
+            pass
 
     @classmethod
-    def get_template(cls):
+    def get_dynamic_template(cls, skipped_keys=None):
+        """
+        Returns default values which are generated (i.e. secrets) or detected
+        from the network. Values of `skipped_keys` are not computed to avoid
+        useless network probes and calls to `os.urandom()`.
+
+        Args:
+            skipped_keys (iterable): Keys to leave out, e.g. the ones already
+                                     present in `.run.conf`
 
-        primary_ip = Network.get_primary_ip()
+        Returns:
+            dict
+        """
+        primary_ip = []
+
+        def _get_primary_ip():
+            # Share the same detected IP across keys, detect it only once
+            if not primary_ip:
+                primary_ip.append(Network.get_primary_ip())
+            return primary_ip[0]
+
+        def _get_random_key(bytes_count):
+            return binascii.hexlify(os.urandom(bytes_count)).decode()
 
         # Keep properties sorted alphabetically
+        defaults = {
+            'django_secret_key': lambda: _get_random_key(50),
+            'enketo_api_token': lambda: _get_random_key(60),
+            'enketo_encryption_key': lambda: _get_random_key(60),
+            'local_interface': Network.get_primary_interface,
+            'local_interface_ip': _get_primary_ip,
+            'mongo_root_password': cls.generate_password,
+            'mongo_user_password': cls.generate_password,
+            'postgres_password': cls.generate_password,
+            'postgres_replication_password': cls.generate_password,
+            'primary_backend_ip': _get_primary_ip,
+            'redis_password': cls.generate_password,
+            'super_user_password': cls.generate_password,
+        }
+
+        skipped_keys = skipped_keys or []
+
         return {
+            key: get_default()
+            for key, get_default in defaults.items()
+            if key not in skipped_keys
+        }
+
+    @classmethod
+    def get_template(cls):
+        """
+        Returns all default values, static and dynamic ones.
+
+        Returns:
+            dict
+        """
+        template = cls.get_static_template()
+        template.update(cls.get_dynamic_template())
+        return dict(sorted(template.items()))
+
+    @classmethod
+    def get_static_template(cls):
+        """
+        Returns default values which do not need any computation.
+        See `Config.get_dynamic_template()` for the other ones.
+
+        Returns:
+            dict
+        """
+        # Keep properties sorted alphabetically
+        template = {
             'advanced': False,
             'aws_access_key': '',
             'aws_backup_bucket_deletion_rule_enabled': False,
@@ -310,23 +804,27 @@ class Config(metaclass=Singleton):
             'aws_secret_key': '',
             'aws_use_profile': False,
             'aws_validate_credentials': True,
+            'backend_server_role': 'primary',
             'block_common_http_ports': True,
+            'celery_autoscale_max': '6',
+            'celery_autoscale_min': '2',
+            'celery_settings': False,
             'custom_secret_keys': False,
             'customized_ports': False,
             'debug': False,
             'default_from_email': 'support@kobo.local',
+            'deployment_color': Config.BLUE_DEPLOYMENT,
             'dev_mode': False,
-            'django_secret_key': binascii.hexlify(os.urandom(50)).decode(),
             'django_session_cookie_age': 604800,
             'docker_prefix': '',
             'ee_subdomain': 'ee',
-            'enketo_api_token': binascii.hexlify(os.urandom(60)).decode(),
-            'enketo_encryption_key': binascii.hexlify(os.urandom(60)).decode(),
             # default value from enketo. Because it was not customizable before
             # we want to keep the same value when users upgrade.
             'enketo_less_secure_encryption_key': 'this $3cr3t key is crackable',
             'expose_backend_ports': False,
             'exposed_nginx_docker_port': Config.DEFAULT_NGINX_PORT,
+            'frontend_nodes': '',
+            'git_reference_path': '',
             'google_api_key': '',
             'google_ua': '',
             'https': True,
@@ -344,13 +842,12 @@ class Config(metaclass=Singleton):
             ),
             'kpi_dev_build_id': '',
             'kpi_path': '',
+            'kpi_replicas': '1',
             'kpi_postgres_db': 'koboform',
             'kpi_raven': '',
             'kpi_raven_js': '',
             'kpi_subdomain': 'kf',
             'local_installation': False,
-            'local_interface': Network.get_primary_interface(),
-            'local_interface_ip': primary_ip,
             'letsencrypt_email': 'support@kobo.local',
             'maintenance_date_iso': '',
             'maintenance_date_str': '',
@@ -358,10 +855,12 @@ class Config(metaclass=Singleton):
             'maintenance_enabled': False,
             'maintenance_eta': '2 hours',
             'mongo_backup_schedule': '0 1 * * 0',
+            'mongo_block_compressor': 'snappy',
+            'mongo_journal_commit_interval': '100',
+            'mongo_settings': False,
+            'mongo_wiredtiger_cache_size': '',
             'mongo_port': '27017',
-            'mongo_root_password': Config.generate_password(),
             'mongo_root_username': 'root',
-            'mongo_user_password': Config.generate_password(),
             'mongo_user_username': 'kobo',
             'multi': False,
             'nginx_proxy_port': Config.DEFAULT_PROXY_PORT,
@@ -370,10 +869,8 @@ class Config(metaclass=Singleton):
             'postgres_backup_schedule': '0 2 * * 0',
             'postgres_hard_drive_type': 'hdd',
             'postgres_max_connections': '100',
-            'postgres_password': Config.generate_password(),
             'postgres_profile': 'Mixed',
             'postgres_ram': '2',
-            'postgres_replication_password': Config.generate_password(),
             'postgres_settings': False,
             'postgres_settings_content': '\n'.join([
                 '# Generated by PGConfig 3.1.0 (1d600ea0d1d79f13dd7ed686f9e2befc1fcf9226)',
@@ -406,27 +903,39 @@ class Config(metaclass=Singleton):
                 '',
                 ''
             ]),
+            'pgbouncer_default_pool_size': '',
+            'pgbouncer_image': 'edoburu/pgbouncer:v1.23.1-p2',
+            'pgbouncer_max_client_conn': '1000',
+            'pgbouncer_pool_mode': 'session',
+            'pgbouncer_port': '6432',
+            'postgres_replication': False,
             'postgres_user': 'kobo',
             'postgresql_port': '5432',
-            'primary_backend_ip': primary_ip,
+            'primary_frontend': True,
             'private_domain_name': 'kobo.private',
             'proxy': True,
             'public_domain_name': 'kobo.local',
             'raven_settings': False,
             'redis_backup_schedule': '0 3 * * 0',
+            'redis_cache_eviction_policy': 'allkeys-lru',
             'redis_cache_max_memory': '',
             'redis_cache_port': '6380',
+            'redis_main_max_memory': '',
             'redis_main_port': '6379',
-            'redis_password': Config.generate_password(),
             'review_host': True,
+            'secondary_backend_ip': '',
             'server_role': 'frontend',
             'smtp_host': '',
             'smtp_password': '',
             'smtp_port': '25',
             'smtp_user': '',
             'smtp_use_tls': False,
+            'ssl_proxy_client_max_body_size': '100',
+            'ssl_proxy_http2': True,
+            'ssl_proxy_keepalive': '32',
+            'ssl_proxy_settings': False,
+            'ssl_proxy_static_cache': True,
             'staging_mode': False,
-            'super_user_password': Config.generate_password(),
             'super_user_username': 'super_admin',
             'two_databases': True,
             'use_aws': False,
@@ -435,6 +944,8 @@ class Config(metaclass=Singleton):
             'use_celery': True,
             'use_frontend_custom_yml': False,
             'use_letsencrypt': True,
+            'use_pgbouncer': False,
+            'use_postgres_replica': False,
             'use_private_dns': False,
             'uwsgi_harakiri': '120',
             'uwsgi_max_requests': '1024',
@@ -444,6 +955,8 @@ class Config(metaclass=Singleton):
             'uwsgi_workers_max': '4',
             'uwsgi_workers_start': '2',
         }
+        template.update(cls.__get_celery_workers_template())
+        return template
 
     @property
     def is_secure(self):
@@ -482,6 +995,17 @@ class Config(metaclass=Singleton):
         """
         return self.__dict['multi']
 
+    @property
+    def primary_frontend(self):
+        """
+        Checks whether this server runs tasks which must run only once per
+        cluster (e.g. Celery beat, database migrations)
+
+        Returns:
+            bool
+        """
+        return not self.frontend_cluster or self.__dict['primary_frontend']
+
     @property
     def proxy(self):
         """
@@ -492,6 +1016,70 @@ class Config(metaclass=Singleton):
         """
         return self.__dict['proxy']
 
+    @classmethod
+    def __get_celery_workers_template(cls):
+        """
+        Returns default values of per-queue settings of Celery workers.
+        Empty values mean Celery defaults, except for autoscale which falls
+        back to `celery_autoscale_min` and `celery_autoscale_max`.
+        """
+        template = {}
+        for worker in cls.CELERY_WORKERS:
+            template.update({
+                f'celery_{worker}_autoscale_max': '',
+                f'celery_{worker}_autoscale_min': '',
+                f'celery_{worker}_max_memory_per_child': '',
+                f'celery_{worker}_max_tasks_per_child': '',
+                f'celery_{worker}_prefetch_multiplier': '',
+                f'celery_{worker}_replicas': '1',
+            })
+
+        # Long-running tasks (e.g. exports) should not be reserved by a busy
+        # process while another one is idle
+        template['celery_worker_long_running_tasks_prefetch_multiplier'] = '1'
+        return template
+
+    def __get_compose_files_fingerprints(
+        self, compose_files, known_fingerprints
+    ):
+        """
+        Returns modification times and hashes of `compose_files`, or `None`
+        if one of them does not exist.
+        Files are only hashed again if their modification time differs from
+        the one in `known_fingerprints`.
+        """
+        fingerprints = {}
+        for compose_file in compose_files:
+            path = os.path.join(self.__dict['kobodocker_path'], compose_file)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+
+            known_fingerprint = known_fingerprints.get(compose_file)
+            if known_fingerprint and known_fingerprint.get('mtime') == mtime:
+                fingerprints[compose_file] = known_fingerprint
+                continue
+
+            with open(path, 'rb') as f:
+                fingerprints[compose_file] = {
+                    'mtime': mtime,
+                    'sha256': hashlib.sha256(f.read()).hexdigest(),
+                }
+
+        return fingerprints
+
+    @staticmethod
+    def __write_service_catalog(catalog_file, fingerprints, services):
+        try:
+            with open(catalog_file, 'w') as f:
+                f.write(json.dumps({
+                    'fingerprints': fingerprints,
+                    'services': services,
+                }, indent=2, sort_keys=True))
+        except (IOError, OSError):
+            pass
+
     def read_config(self):
         """
         Reads config from file `Config.CONFIG_FILE` if exists
@@ -546,9 +1134,32 @@ class Config(metaclass=Singleton):
 
         return unique_id
 
+    @property
+    def secondary_backend(self):
+        """
+        Checks whether this server only runs a PostgreSQL read replica of the
+        primary back-end server
+
+        Returns:
+            bool
+        """
+        return (
+            self.multi_servers
+            and self.backend
+            and self.__dict['backend_server_role'] == 'secondary'
+        )
+
     def set_config(self, value):
         self.__dict = value
 
+    def set_deployment(self, color, kobodocker_path):
+        """
+        Makes the blue/green deployment `color` the active one, i.e. the one
+        used by all commands. Changes are not saved.
+        """
+        self.__dict['deployment_color'] = color
+        self.__dict['kobodocker_path'] = kobodocker_path
+
     @property
     def staging_mode(self):
         return self.__dict['staging_mode']
@@ -557,10 +1168,70 @@ class Config(metaclass=Singleton):
     def use_letsencrypt(self):
         return not self.local_install and self.__dict['use_letsencrypt']
 
+    @property
+    def use_pgbouncer(self):
+        # A secondary back-end server only runs the PostgreSQL replica
+        return not self.secondary_backend and self.__dict['use_pgbouncer']
+
+    @property
+    def use_postgres_replica(self):
+        return (
+            self.multi_servers
+            and self.frontend
+            and self.__dict['use_postgres_replica']
+        )
+
     @property
     def use_private_dns(self):
         return self.__dict['use_private_dns']
 
+    def validate_answers(self, answers):
+        """
+        Validates `answers` (see `build_from_answers()`). Numbers are
+        converted to strings in place, like values typed by users.
+
+        Args:
+            answers (dict)
+
+        Returns:
+            list: error messages, empty if all answers are valid
+        """
+        defaults = self.get_static_template()
+        defaults.update(self.get_dynamic_template(skipped_keys=defaults))
+        validators = self.__get_answers_validators()
+        errors = []
+
+        for key, value in answers.items():
+            if key not in defaults:
+                errors.append(f'`{key}`: unknown option')
+                continue
+
+            default = defaults[key]
+            if isinstance(default, bool):
+                if not isinstance(value, bool):
+                    errors.append(f'`{key}`: must be `true` or `false`')
+                continue
+
+            if isinstance(default, int):
+                if isinstance(value, bool) or not isinstance(value, int):
+                    errors.append(f'`{key}`: must be an integer')
+                continue
+
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+                answers[key] = value
+
+            if not isinstance(value, str):
+                errors.append(f'`{key}`: must be a string')
+                continue
+
+            if key in validators and not CLI.is_valid_response(
+                validators[key], value
+            ):
+                errors.append(f'`{key}`: invalid value `{value}`')
+
+        return errors
+
     def validate_aws_credentials(self):
         validation = AWSValidation(
             aws_access_key_id=self.__dict['aws_access_key'],
@@ -604,7 +1275,6 @@ class Config(metaclass=Singleton):
             },
         }
         errors = []
-        psql_replication = passwords.pop('PostgreSQL replication')
         for label, config_ in passwords.items():
             if not re.match(config_['pattern'], config_['password']):
                 errors.append(label)
@@ -717,18 +1387,16 @@ class Config(metaclass=Singleton):
 
             # Only clone if folder is empty
             if not os.path.isdir(os.path.join(full_repo_path, '.git')):
-                git_command = [
-                    'git', 'clone',
-                    f'https://github.com/kobotoolbox/{repo_name}',
-                    full_repo_path
-                ]
 
                 CLI.colored_print(
                     f'Cloning `{repo_name}` repository to `{full_repo_path}`',
                     CLI.COLOR_INFO
                 )
-                CLI.run_command(git_command,
-                                cwd=os.path.dirname(full_repo_path))
+                GitSync.clone(
+                    repo_name,
+                    full_repo_path,
+                    reference_path=self.__dict['git_reference_path'],
+                )
 
     def __detect_network(self):
 
@@ -783,6 +1451,101 @@ class Config(metaclass=Singleton):
                 self.__dict['primary_backend_ip'] = self.__dict[
                     'local_interface_ip']
 
+    def __get_answers_validators(self):
+        """
+        Returns validators of answers (see `build_from_answers()`), i.e. the
+        ones used by `CLI.get_response()` in questions.
+
+        Returns:
+            dict
+        """
+        number = r'~^\d+$'
+        optional_number = r'~^(\d+)?$'
+        positive_number = r'~^[1-9]\d*$'
+        optional_memory = r'~^(\d+|-)?$'
+        name = r'~^\w+$'
+        schedule = f'~{self.BACKUP_SCHEDULE_PATTERN}'
+        password = self.__get_password_validation_pattern()
+
+        validators = {
+            'aws_backup_daily_retention': number,
+            'aws_backup_monthly_retention': number,
+            'aws_backup_upload_chunk_size': number,
+            'aws_backup_weekly_retention': number,
+            'aws_backup_yearly_retention': number,
+            'aws_mongo_backup_minimum_size': number,
+            'aws_postgres_backup_minimum_size': number,
+            'aws_redis_backup_minimum_size': number,
+            'backend_server_role': ['primary', 'secondary'],
+            'celery_autoscale_max': number,
+            'celery_autoscale_min': number,
+            'django_secret_key': r'~^.{50,}$',
+            'enketo_api_token': r'~^.{50,}$',
+            'enketo_encryption_key': r'~^.{50,}$',
+            'enketo_less_secure_encryption_key': r'~^.{10,}$',
+            'exposed_nginx_docker_port': number,
+            'frontend_nodes': r'~^([\w.-]+(\s*,\s*[\w.-]+)*)?$',
+            'kc_postgres_db': name,
+            'kobocat_media_backup_schedule': schedule,
+            'kpi_postgres_db': name,
+            'kpi_replicas': positive_number,
+            'mongo_backup_schedule': schedule,
+            'mongo_block_compressor': ['snappy', 'zstd', 'zlib', 'none'],
+            'mongo_journal_commit_interval': r'~^([1-9]\d?|[1-4]\d\d|500)$',
+            'mongo_port': number,
+            'mongo_root_password': password,
+            'mongo_root_username': name,
+            'mongo_user_password': password,
+            'mongo_user_username': name,
+            'mongo_wiredtiger_cache_size': r'~^(\d+(\.\d+)?)?$',
+            'nginx_proxy_port': number,
+            'pgbouncer_default_pool_size': r'~^\d*$',
+            'pgbouncer_max_client_conn': number,
+            'pgbouncer_pool_mode': ['session', 'transaction'],
+            'pgbouncer_port': number,
+            'postgres_backup_schedule': schedule,
+            'postgres_cpus': positive_number,
+            'postgres_hard_drive_type': ['hdd', 'ssd', 'san'],
+            'postgres_max_connections': positive_number,
+            'postgres_password': password,
+            'postgres_profile': ['web', 'oltp', 'dw', 'mixed', 'desktop'],
+            'postgres_ram': positive_number,
+            'postgres_replication_password': password,
+            'postgres_user': name,
+            'postgresql_port': number,
+            'primary_backend_ip': self.IPV4_PATTERN,
+            'redis_backup_schedule': schedule,
+            'redis_cache_eviction_policy': RedisTuning.EVICTION_POLICIES,
+            'redis_cache_max_memory': optional_memory,
+            'redis_cache_port': number,
+            'redis_main_max_memory': optional_memory,
+            'redis_main_port': number,
+            'redis_password': self.__get_password_validation_pattern(
+                allow_empty=True
+            ),
+            'secondary_backend_ip': self.IPV4_PATTERN,
+            'server_role': ['backend', 'frontend'],
+            'ssl_proxy_client_max_body_size': positive_number,
+            'ssl_proxy_keepalive': positive_number,
+            'uwsgi_harakiri': number,
+            'uwsgi_max_requests': number,
+            'uwsgi_soft_limit': number,
+            'uwsgi_worker_reload_mercy': number,
+            'uwsgi_workers_max': number,
+            'uwsgi_workers_start': number,
+        }
+        for worker in self.CELERY_WORKERS:
+            validators.update({
+                f'celery_{worker}_autoscale_max': optional_number,
+                f'celery_{worker}_autoscale_min': optional_number,
+                f'celery_{worker}_max_memory_per_child': optional_number,
+                f'celery_{worker}_max_tasks_per_child': optional_number,
+                f'celery_{worker}_prefetch_multiplier': optional_number,
+                f'celery_{worker}_replicas': positive_number,
+            })
+
+        return validators
+
     def __get_password_validation_pattern(
         self, chars=8, allow_empty=False, add_prefix=True
     ):
@@ -799,6 +1562,50 @@ class Config(metaclass=Singleton):
             pattern += '|'
         return rf'{prefix}^{pattern}$'
 
+    @staticmethod
+    def __load_answers(path):
+        """
+        Reads answers from a JSON file, or a YAML file (`.yml`, `.yaml`) if
+        PyYAML is installed.
+
+        Returns:
+            dict
+        """
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except IOError:
+            CLI.colored_print(f'Cannot read `{path}`', CLI.COLOR_ERROR)
+            sys.exit(1)
+
+        if path.lower().endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                CLI.colored_print(
+                    'PyYAML is required to read YAML answers files. '
+                    'Install it or use JSON.',
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+            try:
+                answers = yaml.safe_load(content)
+            except yaml.YAMLError:
+                answers = None
+        else:
+            try:
+                answers = json.loads(content)
+            except ValueError:
+                answers = None
+
+        if not isinstance(answers, dict):
+            CLI.colored_print(
+                f'`{path}` is not a valid answers file', CLI.COLOR_ERROR
+            )
+            sys.exit(1)
+
+        return answers
+
     def __questions_advanced_options(self):
         """
         Asks if user wants to see advanced options
@@ -1010,10 +1817,7 @@ class Config(metaclass=Singleton):
                     if self.backend and not self.frontend:
                         self.__questions_aws()
 
-                    schedule_regex_pattern = (
-                        r'^\-|((((\d+(,\d+)*)|(\d+-\d+)|(\*(\/\d+)?)))'
-                        r'(\s+(((\d+(,\d+)*)|(\d+\-\d+)|(\*(\/\d+)?)))){4})?$'
-                    )
+                    schedule_regex_pattern = self.BACKUP_SCHEDULE_PATTERN
                     message = (
                         'Schedules use linux cron syntax with UTC date times.\n'
                         'For example, schedule at 12:00 AM E.S.T every Sunday '
@@ -1071,6 +1875,91 @@ class Config(metaclass=Singleton):
         else:
             self.__reset(no_backups=True)
 
+    def __questions_celery(self):
+        """
+        Concurrency and limits of Celery workers, per queue.
+        Empty answers fall back to Celery defaults (or to global autoscale
+        values for concurrency).
+        """
+        self.__dict['celery_settings'] = CLI.yes_no_question(
+            'Do you want to tweak Celery workers settings?',
+            default=self.__dict['celery_settings']
+        )
+
+        if self.__dict['celery_settings']:
+            CLI.colored_print('Minimum number of processes per worker?',
+                              CLI.COLOR_QUESTION)
+            self.__dict['celery_autoscale_min'] = CLI.get_response(
+                r'~^\d+$',
+                self.__dict['celery_autoscale_min'])
+
+            CLI.colored_print('Maximum number of processes per worker?',
+                              CLI.COLOR_QUESTION)
+            self.__dict['celery_autoscale_max'] = CLI.get_response(
+                r'~^\d+$',
+                self.__dict['celery_autoscale_max'])
+
+            for worker in self.CELERY_WORKERS:
+                CLI.colored_print(f'Settings of `{worker}`. Leave empty to '
+                                  f'use defaults.', CLI.COLOR_INFO)
+
+                CLI.colored_print('Minimum number of processes?',
+                                  CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_autoscale_min'] = CLI.get_response(
+                    r'~^(\d+)?$',
+                    self.__dict[f'celery_{worker}_autoscale_min'])
+
+                CLI.colored_print('Maximum number of processes?',
+                                  CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_autoscale_max'] = CLI.get_response(
+                    r'~^(\d+)?$',
+                    self.__dict[f'celery_{worker}_autoscale_max'])
+
+                CLI.colored_print('Prefetch multiplier?', CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_prefetch_multiplier'] = (
+                    CLI.get_response(
+                        r'~^(\d+)?$',
+                        self.__dict[f'celery_{worker}_prefetch_multiplier'])
+                )
+
+                CLI.colored_print('Maximum number of tasks a process can '
+                                  'execute before being replaced?',
+                                  CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_max_tasks_per_child'] = (
+                    CLI.get_response(
+                        r'~^(\d+)?$',
+                        self.__dict[f'celery_{worker}_max_tasks_per_child'])
+                )
+
+                CLI.colored_print('Replace a process if its memory use '
+                                  'exceeds this many MB?', CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_max_memory_per_child'] = (
+                    CLI.get_response(
+                        r'~^(\d+)?$',
+                        self.__dict[f'celery_{worker}_max_memory_per_child'])
+                )
+
+                CLI.colored_print('Number of containers (replicas)?',
+                                  CLI.COLOR_QUESTION)
+                self.__dict[f'celery_{worker}_replicas'] = CLI.get_response(
+                    r'~^[1-9]\d*$',
+                    self.__dict[f'celery_{worker}_replicas'])
+
+            return
+
+        proposals = HostProfile.detect().get_proposals(
+            frontend=self.frontend, backend=self.backend
+        )
+        self.__dict['celery_autoscale_min'] = proposals['celery_autoscale_min']
+        self.__dict['celery_autoscale_max'] = proposals['celery_autoscale_max']
+        # Number of replicas is managed by `run.py --scale` as well, keep it
+        replicas_keys = self.get_replicas_keys().values()
+        self.__dict.update({
+            key: value
+            for key, value in self.__get_celery_workers_template().items()
+            if key not in replicas_keys
+        })
+
     def __questions_custom_yml(self):
 
         if self.frontend:
@@ -1174,6 +2063,41 @@ class Config(metaclass=Singleton):
             CLI.COLOR_QUESTION,
             self.__dict['docker_prefix'])
 
+    def __questions_git_reference(self):
+        """
+        Asks for a directory shared by all instances of the same host to cache
+        git repositories, i.e. to download them only once.
+        """
+        self.__dict['git_reference_path'] = CLI.colored_input(
+            'Shared git cache directory? (leave empty to disable)',
+            CLI.COLOR_QUESTION,
+            self.__dict['git_reference_path'])
+
+    def __questions_frontend_nodes(self):
+        """
+        Asks for all front-end nodes which share the same back end, and
+        whether this one is the primary one.
+        """
+        CLI.colored_print(
+            'IP addresses or hostnames of all front-end nodes?',
+            CLI.COLOR_QUESTION,
+        )
+        CLI.colored_print(
+            'Comma-separated. Leave empty if there is only one front-end '
+            'server',
+            CLI.COLOR_INFO,
+        )
+        self.__dict['frontend_nodes'] = CLI.get_response(
+            r'~^([\w.-]+(\s*,\s*[\w.-]+)*)?$',
+            self.__dict['frontend_nodes'],
+        )
+        if self.frontend_cluster:
+            self.__dict['primary_frontend'] = CLI.yes_no_question(
+                'Is this the primary front-end node (i.e. the one which '
+                'runs scheduled tasks)?',
+                default=self.__dict['primary_frontend'],
+            )
+
     def __questions_google(self):
         """
         Asks for Google's keys
@@ -1382,11 +2306,56 @@ class Config(metaclass=Singleton):
             default=self.__dict['multi']
         )
 
+    def __questions_mongo_settings(self):
+        """
+        Ask for WiredTiger settings only when server is for:
+        - primary back end
+        - single server installation
+        """
+        if not self.backend or self.secondary_backend:
+            return
+
+        self.__dict['mongo_settings'] = CLI.yes_no_question(
+            'Do you want to tweak MongoDB settings?',
+            default=self.__dict['mongo_settings']
+        )
+        if not self.__dict['mongo_settings']:
+            return
+
+        CLI.colored_print('WiredTiger cache size in GB?', CLI.COLOR_QUESTION)
+        CLI.colored_print(
+            'Leave empty to let MongoDB use 50% of RAM minus 1 GB',
+            CLI.COLOR_INFO,
+        )
+        self.__dict['mongo_wiredtiger_cache_size'] = CLI.get_response(
+            r'~^(\d+(\.\d+)?)?$', self.__dict['mongo_wiredtiger_cache_size']
+        )
+
+        CLI.colored_print('Block compressor?', CLI.COLOR_QUESTION)
+        CLI.colored_print('\tsnappy) Fast, default compression')
+        CLI.colored_print('\tzstd) Higher compression, more CPU')
+        CLI.colored_print('\tzlib) Highest compression, most CPU')
+        CLI.colored_print('\tnone) No compression')
+        self.__dict['mongo_block_compressor'] = CLI.get_response(
+            ['snappy', 'zstd', 'zlib', 'none'],
+            self.__dict['mongo_block_compressor'],
+        )
+
+        CLI.colored_print(
+            'Journal commit interval in milliseconds (1-500)?',
+            CLI.COLOR_QUESTION,
+        )
+        self.__dict['mongo_journal_commit_interval'] = CLI.get_response(
+            r'~^([1-9]\d?|[1-4]\d\d|500)$',
+            self.__dict['mongo_journal_commit_interval'],
+        )
+
     def __questions_postgres(self):
         """
         Postgres credentials and settings.
 
-        Settings can be tweaked thanks to pgconfig.org API
+        Settings can be tweaked thanks to `PostgresTuning`, which computes
+        them offline, following pgconfig.org rules
         """
         CLI.colored_print('KoboCat PostgreSQL database name?',
                           CLI.COLOR_QUESTION)
@@ -1408,7 +2377,7 @@ class Config(metaclass=Singleton):
                 'KPI must use its own PostgreSQL database, not share one with '
                 'KoboCAT. Please enter another database',
                 CLI.COLOR_ERROR,
-                Config.get_template()['kpi_postgres_db'],
+                Config.get_static_template()['kpi_postgres_db'],
             )
 
         if (kc_postgres_db != self.__dict['kc_postgres_db'] or
@@ -1498,31 +2467,18 @@ class Config(metaclass=Singleton):
                 default=self.__dict['postgres_settings']
             )
 
-            template = self.get_template()
+            template = self.get_static_template()
 
             if self.__dict['postgres_settings']:
 
-                CLI.colored_print('Launching pgconfig.org API container...',
-                                  CLI.COLOR_INFO)
-
-                # From https://docs.pgconfig.org/api/#available-parameters
-                # Parameters are case-sensitive, for example
-                # `environment_name` must be one these values:
-                # - `WEB`
-                # - `OLTP`,
-                # - `DW`
-                # - `Mixed`
-                # - `Desktop`
-                # It's case-sensitive.
-
                 CLI.colored_print('Number of CPUs?', CLI.COLOR_QUESTION)
                 self.__dict['postgres_cpus'] = CLI.get_response(
-                    r'~^\d+$',
+                    r'~^[1-9]\d*$',
                     self.__dict['postgres_cpus'])
 
                 CLI.colored_print('Total Memory in GB?', CLI.COLOR_QUESTION)
                 self.__dict['postgres_ram'] = CLI.get_response(
-                    r'~^\d+$',
+                    r'~^[1-9]\d*$',
                     self.__dict['postgres_ram'])
 
                 CLI.colored_print('Storage type?', CLI.COLOR_QUESTION)
@@ -1535,7 +2491,7 @@ class Config(metaclass=Singleton):
 
                 CLI.colored_print('Number of connections?', CLI.COLOR_QUESTION)
                 self.__dict['postgres_max_connections'] = CLI.get_response(
-                    r'~^\d+$',
+                    r'~^[1-9]\d*$',
                     self.__dict['postgres_max_connections'])
 
                 if self.multi_servers:
@@ -1567,35 +2523,16 @@ class Config(metaclass=Singleton):
                 else:
                     self.__dict['postgres_profile'] = 'Mixed'
 
-                # Use pgconfig.org API to get the configuration
-                # Notes: It has failed several times in the past.
-                endpoint = (
-                    'https://api.pgconfig.org/v1/tuning/get-config'
-                    '?environment_name={profile}&format=conf'
-                    '&include_pgbadger=false'
-                    '&cpus={cpus}'
-                    '&max_connections={max_connections}'
-                    '&pg_version=14'
-                    '&total_ram={ram}GB'
-                    '&drive_type={drive_type}'
-                    '&os_type=linux'
-                )
-                endpoint = endpoint.format(
-                    profile=self.__dict['postgres_profile'],
-                    ram=self.__dict['postgres_ram'],
-                    cpus=self.__dict['postgres_cpus'],
-                    max_connections=self.__dict['postgres_max_connections'],
-                    drive_type=self.__dict['postgres_hard_drive_type'].upper()
+                # Settings are computed locally, following pgconfig.org rules
+                self.__dict['postgres_settings_content'] = (
+                    PostgresTuning.get_settings_content(
+                        cpus=self.__dict['postgres_cpus'],
+                        ram=self.__dict['postgres_ram'],
+                        drive_type=self.__dict['postgres_hard_drive_type'],
+                        max_connections=self.__dict['postgres_max_connections'],
+                        profile=self.__dict['postgres_profile'],
+                    )
                 )
-                response = Network.curl(endpoint)
-                if response:
-                    # Patch response because of https://github.com/pgconfig/api/issues/13
-                    configuration = re.sub(r'(\d+)KB', r'\1kB', response)
-                    self.__dict['postgres_settings_content'] = configuration
-                else:
-                    CLI.colored_print('\nAn error has occurred. Current '
-                                      'PostgreSQL settings will be used',
-                                      CLI.COLOR_INFO)
 
             else:
                 # Forcing the default settings to remain even if there
@@ -1606,6 +2543,104 @@ class Config(metaclass=Singleton):
                     'postgres_settings_content'
                 ]
 
+    def __questions_pgbouncer(self):
+        """
+        Asks whether Django apps connect to PostgreSQL through PgBouncer and,
+        on back-end servers, how pools are sized.
+        """
+        if self.secondary_backend:
+            self.__dict['use_pgbouncer'] = False
+            return
+
+        self.__dict['use_pgbouncer'] = CLI.yes_no_question(
+            'Do you want to use PgBouncer (connection pooler) between Django '
+            'apps and PostgreSQL?',
+            default=self.__dict['use_pgbouncer'],
+        )
+        if not self.use_pgbouncer or not self.backend:
+            return
+
+        CLI.colored_print('Pool mode?', CLI.COLOR_QUESTION)
+        CLI.colored_print('\t1) session')
+        CLI.colored_print('\t2) transaction')
+        self.__dict['pgbouncer_pool_mode'] = CLI.get_response(
+            ['session', 'transaction'], self.__dict['pgbouncer_pool_mode']
+        )
+        if self.__dict['pgbouncer_pool_mode'] == 'transaction':
+            CLI.colored_print(
+                'Transaction mode requires server-side cursors and '
+                'persistent connections to be disabled in Django apps.',
+                CLI.COLOR_WARNING,
+            )
+
+        CLI.colored_print(
+            'Maximum number of client connections?', CLI.COLOR_QUESTION
+        )
+        self.__dict['pgbouncer_max_client_conn'] = CLI.get_response(
+            r'~^\d+$', self.__dict['pgbouncer_max_client_conn']
+        )
+
+        CLI.colored_print(
+            'Pool size per database? Leave empty to compute it from '
+            'PostgreSQL `max_connections`',
+            CLI.COLOR_QUESTION,
+        )
+        self.__dict['pgbouncer_default_pool_size'] = CLI.get_response(
+            r'~^\d*$', self.__dict['pgbouncer_default_pool_size']
+        )
+
+    def __questions_postgres_replication(self):
+        """
+        Asks whether back-end servers are primary or secondary (i.e. PostgreSQL
+        hot standby), and whether front-end servers send read-only queries to
+        the replica.
+        """
+        if self.backend:
+            CLI.colored_print(
+                'Which role do you want to assign to this back-end server?',
+                CLI.COLOR_QUESTION,
+            )
+            CLI.colored_print('\t1) primary')
+            CLI.colored_print('\t2) secondary (PostgreSQL read replica)')
+            self.__dict['backend_server_role'] = CLI.get_response(
+                ['primary', 'secondary'], self.__dict['backend_server_role']
+            )
+
+            if self.secondary_backend:
+                CLI.colored_print(
+                    'IP address (IPv4) of primary back-end server?',
+                    CLI.COLOR_QUESTION,
+                )
+                self.__dict['primary_backend_ip'] = CLI.get_response(
+                    self.IPV4_PATTERN,
+                    self.__dict['primary_backend_ip'])
+                CLI.colored_print(
+                    'PostgreSQL port of primary back-end server must be '
+                    'reachable from this server.',
+                    CLI.COLOR_WARNING,
+                )
+            else:
+                self.__dict['postgres_replication'] = CLI.yes_no_question(
+                    'Do you want to allow a secondary back-end server to '
+                    'replicate PostgreSQL?',
+                    default=self.__dict['postgres_replication'],
+                )
+            return
+
+        self.__dict['use_postgres_replica'] = CLI.yes_no_question(
+            'Do you want to send read-only queries to a PostgreSQL read '
+            'replica?',
+            default=self.__dict['use_postgres_replica'],
+        )
+        if self.use_postgres_replica and not self.use_private_dns:
+            CLI.colored_print(
+                'IP address (IPv4) of secondary back-end server?',
+                CLI.COLOR_QUESTION,
+            )
+            self.__dict['secondary_backend_ip'] = CLI.get_response(
+                self.IPV4_PATTERN,
+                self.__dict['secondary_backend_ip'])
+
     def __questions_ports(self):
         """
         Customize services ports
@@ -1613,6 +2648,7 @@ class Config(metaclass=Singleton):
 
         def reset_ports():
             self.__dict['postgresql_port'] = '5432'
+            self.__dict['pgbouncer_port'] = '6432'
             self.__dict['mongo_port'] = '27017'
             self.__dict['redis_main_port'] = '6379'
             self.__dict['redis_cache_port'] = '6380'
@@ -1652,6 +2688,11 @@ class Config(metaclass=Singleton):
         self.__dict['postgresql_port'] = CLI.get_response(
             r'~^\d+$', self.__dict['postgresql_port'])
 
+        if self.use_pgbouncer:
+            CLI.colored_print('PgBouncer?', CLI.COLOR_QUESTION)
+            self.__dict['pgbouncer_port'] = CLI.get_response(
+                r'~^\d+$', self.__dict['pgbouncer_port'])
+
         CLI.colored_print('MongoDB?', CLI.COLOR_QUESTION)
         self.__dict['mongo_port'] = CLI.get_response(
             r'~^\d+$', self.__dict['mongo_port'])
@@ -1679,7 +2720,7 @@ class Config(metaclass=Singleton):
             CLI.colored_print('IP address (IPv4) of primary back-end server?',
                               CLI.COLOR_QUESTION)
             self.__dict['primary_backend_ip'] = CLI.get_response(
-                r'~\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}',
+                self.IPV4_PATTERN,
                 self.__dict['primary_backend_ip'])
         else:
             self.__dict['private_domain_name'] = CLI.colored_input(
@@ -1776,9 +2817,42 @@ class Config(metaclass=Singleton):
                 r'~^(\d+|-)?$', self.__dict['redis_cache_max_memory']
             )
 
+            CLI.colored_print(
+                'Eviction policy for Redis cache container?',
+                CLI.COLOR_QUESTION,
+            )
+            CLI.colored_print('\tallkeys-lru) Least recently used keys')
+            CLI.colored_print('\tallkeys-lfu) Least frequently used keys')
+            self.__dict['redis_cache_eviction_policy'] = CLI.get_response(
+                RedisTuning.EVICTION_POLICIES,
+                self.__dict['redis_cache_eviction_policy'],
+            )
+
+            CLI.colored_print(
+                'Max memory (MB) for Redis main container?', CLI.COLOR_QUESTION
+            )
+            CLI.colored_print(
+                'Leave empty for no limits. Keys are never evicted: Redis '
+                'refuses new tasks when the limit is reached.',
+                CLI.COLOR_INFO,
+            )
+            self.__dict['redis_main_max_memory'] = CLI.get_response(
+                r'~^(\d+|-)?$', self.__dict['redis_main_max_memory']
+            )
+
     def __questions_reverse_proxy(self):
 
-        if self.is_secure:
+        if self.frontend_cluster:
+            # Each node would request its own certificates. HTTPS must be
+            # handled by the load balancer in front of the nodes.
+            CLI.colored_print(
+                "Let's Encrypt is not available with several front-end "
+                'nodes. They must be behind a load balancer.',
+                CLI.COLOR_WARNING,
+            )
+            self.__dict['use_letsencrypt'] = False
+            self.__dict['proxy'] = True
+        elif self.is_secure:
 
             self.__dict['use_letsencrypt'] = CLI.yes_no_question(
                 "Auto-install HTTPS certificates with Let's Encrypt?",
@@ -1977,6 +3051,40 @@ class Config(metaclass=Singleton):
             self.__dict['default_from_email']
         )
 
+    def __questions_ssl_proxy(self):
+        """
+        Customize performance settings of the Let's Encrypt NGINX proxy
+        """
+        self.__dict['ssl_proxy_settings'] = CLI.yes_no_question(
+            'Do you want to tweak HTTPS proxy settings?',
+            default=self.__dict['ssl_proxy_settings']
+        )
+        if not self.__dict['ssl_proxy_settings']:
+            return
+
+        CLI.colored_print('Maximum upload size (in MB)?', CLI.COLOR_QUESTION)
+        self.__dict['ssl_proxy_client_max_body_size'] = CLI.get_response(
+            r'~^[1-9]\d*$', self.__dict['ssl_proxy_client_max_body_size']
+        )
+
+        CLI.colored_print(
+            'Number of idle connections kept open to kobo-docker NGINX?',
+            CLI.COLOR_QUESTION,
+        )
+        self.__dict['ssl_proxy_keepalive'] = CLI.get_response(
+            r'~^[1-9]\d*$', self.__dict['ssl_proxy_keepalive']
+        )
+
+        self.__dict['ssl_proxy_http2'] = CLI.yes_no_question(
+            'Do you want to enable HTTP/2?',
+            default=self.__dict['ssl_proxy_http2']
+        )
+
+        self.__dict['ssl_proxy_static_cache'] = CLI.yes_no_question(
+            'Do you want to cache static files in the HTTPS proxy?',
+            default=self.__dict['ssl_proxy_static_cache']
+        )
+
     def __questions_super_user_credentials(self):
         # Super user. Only ask for credentials the first time.
         # Super user is created if db doesn't exists.
@@ -2027,6 +3135,12 @@ class Config(metaclass=Singleton):
                     r'~^\d+$',
                     self.__dict['uwsgi_workers_max'])
 
+                CLI.colored_print('Number of `kpi` containers (replicas)?',
+                                  CLI.COLOR_QUESTION)
+                self.__dict['kpi_replicas'] = CLI.get_response(
+                    r'~^[1-9]\d*$',
+                    self.__dict['kpi_replicas'])
+
                 CLI.colored_print('Maximum number of requests per worker?',
                                   CLI.COLOR_QUESTION)
                 self.__dict['uwsgi_max_requests'] = CLI.get_response(
@@ -2054,8 +3168,12 @@ class Config(metaclass=Singleton):
 
                 return
 
-        self.__dict['uwsgi_workers_start'] = '2'
-        self.__dict['uwsgi_workers_max'] = '4'
+        proposals = HostProfile.detect().get_proposals(
+            frontend=self.frontend, backend=self.backend
+        )
+        self.__dict['uwsgi_workers_start'] = proposals['uwsgi_workers_start']
+        self.__dict['uwsgi_workers_max'] = proposals['uwsgi_workers_max']
+        # `kpi_replicas` is managed by `run.py --scale` as well, keep it
         self.__dict['uwsgi_max_requests'] = '1024'
         self.__dict['uwsgi_soft_limit'] = '1024'
         self.__dict['uwsgi_harakiri'] = '120'
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.cli import CLI
+
+
+class SSHTransport:
+    """
+    Runs commands on remote hosts with `ssh` and copies files with `scp`.
+    Authentication must not require any prompts (e.g. SSH agent or keys).
+    Remote commands cannot read the local standard input: several hosts are
+    deployed at the same time and their output is captured.
+    """
+
+    SSH_OPTIONS = ['-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10']
+
+    def run(self, address, command):
+        """
+        Args:
+            address (str): `[user@]host` as understood by `ssh`
+            command (str): Shell command run on the remote host
+
+        Returns:
+            tuple: exit code, output (stdout and stderr)
+        """
+        return self.__call(['ssh'] + self.SSH_OPTIONS + [address, command])
+
+    def copy(self, address, local_path, remote_path):
+        """
+        Returns:
+            tuple: exit code, output (stdout and stderr)
+        """
+        return self.__call(
+            ['scp', '-q'] + self.SSH_OPTIONS
+            + [local_path, f'{address}:{remote_path}']
+        )
+
+    @staticmethod
+    def __call(command):
+        process = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        return process.returncode, process.stdout
+
+
+class Fleet:
+    """
+    Updates, renders and starts KoboToolbox on several hosts, then collects
+    their health checks (`run.py --info`) into one report.
+
+    Hosts come from an inventory file:
+    ```
+    {
+        "max_workers": 4,
+        "hosts": [
+            {
+                "name": "kobo-1",
+                "address": "admin@10.0.0.1",
+                "path": "/opt/kobo-install",
+                "run_conf": "kobo-1.run.conf",
+                "canary": true
+            }
+        ]
+    }
+    ```
+    `run_conf` (optional, relative to the inventory file) is copied to
+    `<path>/.run.conf` before updating. Without it, `<path>/.run.conf` must
+    already exist since setup questions cannot be answered remotely.
+    Canary hosts are deployed first; the other hosts are deployed only if
+    all canaries succeed. As soon as a host
+    fails, no other hosts are started and remaining ones are skipped.
+
+    Usage example:
+    ```
+    fleet = Fleet.from_inventory('inventory.json')
+    results = fleet.deploy()
+    ```
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_PATH = '~/kobo-install'
+
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_SKIPPED = 'skipped'
+
+    def __init__(
+        self, hosts, transport=None, max_workers=DEFAULT_MAX_WORKERS,
+        version=None,
+    ):
+        """
+        Args:
+            hosts (list): Dicts with `name`, `address` and optionally `path`,
+                          `run_conf` and `canary`
+            transport (SSHTransport): Any object with `run()` and `copy()`
+            max_workers (int): Maximum number of hosts deployed at a time
+            version (str): Branch or tag passed to `run.py --auto-update`
+        """
+        self.__hosts = hosts
+        self.__transport = transport or SSHTransport()
+        self.__max_workers = max(1, int(max_workers))
+        self.__version = version
+        self.__failed = threading.Event()
+
+    @classmethod
+    def from_inventory(cls, path, transport=None, version=None):
+        """
+        Returns:
+            Fleet
+        """
+        try:
+            with open(path, 'r') as f:
+                inventory = json.loads(f.read())
+            hosts = inventory['hosts']
+            max_workers = inventory.get('max_workers', cls.DEFAULT_MAX_WORKERS)
+        except (IOError, ValueError, KeyError, AttributeError):
+            CLI.colored_print(
+                f'`{path}` is not a valid inventory file', CLI.COLOR_ERROR
+            )
+            sys.exit(1)
+
+        base_dir = os.path.dirname(os.path.realpath(path))
+        for host in hosts:
+            if not isinstance(host, dict) or not host.get('address'):
+                CLI.colored_print(
+                    f'Each host of `{path}` needs an `address`',
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+            host.setdefault('name', host['address'])
+            if host.get('run_conf'):
+                host['run_conf'] = os.path.join(base_dir, host['run_conf'])
+                if not os.path.isfile(host['run_conf']):
+                    CLI.colored_print(
+                        f"`{host['run_conf']}` does not exist",
+                        CLI.COLOR_ERROR,
+                    )
+                    sys.exit(1)
+
+        return cls(
+            hosts,
+            transport=transport,
+            max_workers=max_workers,
+            version=version,
+        )
+
+    def deploy(self):
+        """
+        Deploys canary hosts first, then the other ones.
+
+        Returns:
+            list: one dict per host (`name`, `status`, `step`, `output`),
+                  in inventory order
+        """
+        canaries = [host for host in self.__hosts if host.get('canary')]
+        others = [host for host in self.__hosts if not host.get('canary')]
+
+        results = {}
+        for batch in [canaries, others]:
+            if not batch:
+                continue
+            with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+                for host, result in zip(
+                    batch, executor.map(self.__deploy_host, batch)
+                ):
+                    results[host['name']] = result
+
+        return [results[host['name']] for host in self.__hosts]
+
+    @staticmethod
+    def print_report(results):
+        """
+        Prints the status of each host and the URL reported by its health
+        check.
+        """
+        lines = ['Fleet deployment report', '']
+        for result in results:
+            line = f"{result['name']}: {result['status']}"
+            if result['status'] == Fleet.STATUS_FAILED:
+                line += f" (at `{result['step']}`)"
+            elif result['status'] == Fleet.STATUS_SUCCESS:
+                url = Fleet.__get_url(result['output'])
+                if url:
+                    line += f' - {url}'
+            lines.append(line)
+
+        success = all(
+            result['status'] == Fleet.STATUS_SUCCESS for result in results
+        )
+        CLI.framed_print(
+            '\n'.join(lines),
+            color=CLI.COLOR_SUCCESS if success else CLI.COLOR_ERROR,
+        )
+
+        for result in results:
+            if result['status'] == Fleet.STATUS_FAILED:
+                CLI.colored_print(
+                    f"\n[{result['name']}] {result['step']}:", CLI.COLOR_ERROR
+                )
+                print(result['output'].strip())
+
+    @classmethod
+    def run(cls, inventory_path, version=None):
+        """
+        Deploys all hosts of `inventory_path` and prints the report.
+        Exits with an error if any host has failed.
+        """
+        fleet = cls.from_inventory(inventory_path, version=version)
+        results = fleet.deploy()
+        cls.print_report(results)
+        if any(result['status'] != cls.STATUS_SUCCESS for result in results):
+            sys.exit(1)
+
+    def __deploy_host(self, host):
+        result = {
+            'name': host['name'],
+            'status': self.STATUS_SKIPPED,
+            'step': None,
+            'output': '',
+        }
+        if self.__failed.is_set():
+            return result
+
+        path = host.get('path') or self.DEFAULT_PATH
+        # `~` must be expanded by the remote shell, thus it is not quoted
+        if path.startswith('~/'):
+            quoted_path = f'~/{shlex.quote(path[2:])}'
+        else:
+            quoted_path = shlex.quote(path)
+
+        update_command = 'python3 run.py --auto-update'
+        if self.__version:
+            update_command += f' {shlex.quote(self.__version)}'
+
+        steps = []
+        if host.get('run_conf'):
+            steps.append((
+                'copy',
+                lambda: self.__transport.copy(
+                    host['address'], host['run_conf'], f'{path}/.run.conf'
+                ),
+            ))
+        else:
+            steps.append((
+                'config',
+                lambda: self.__check_config(host['address'], quoted_path),
+            ))
+        for step, command in [
+            ('update', update_command),
+            ('start', 'python3 run.py'),
+            ('info', 'python3 run.py --info'),
+        ]:
+            steps.append((
+                step,
+                lambda command_=command: self.__transport.run(
+                    host['address'], f'cd {quoted_path} && {command_}'
+                ),
+            ))
+
+        for step, callable_ in steps:
+            CLI.colored_print(f"[{host['name']}] {step}", CLI.COLOR_INFO)
+            exit_code, output = callable_()
+            result['step'] = step
+            result['output'] = output
+            if exit_code != 0:
+                result['status'] = self.STATUS_FAILED
+                self.__failed.set()
+                return result
+
+        result['status'] = self.STATUS_SUCCESS
+        return result
+
+    def __check_config(self, address, quoted_path):
+        """
+        Returns:
+            tuple: exit code, output
+        """
+        exit_code, output = self.__transport.run(
+            address, f'cd {quoted_path} && test -f .run.conf'
+        )
+        if exit_code != 0 and not output:
+            output = (
+                '`.run.conf` does not exist. Add `run_conf` to this host in '
+                'the inventory or run `python3 run.py --setup` on it first.'
+            )
+        return exit_code, output
+
+    @staticmethod
+    def __get_url(output):
+        for line in output.split('\n'):
+            if 'URL:' in line:
+                return line.split('URL:', 1)[1].strip(' ║')
+        return None
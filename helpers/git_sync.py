@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+from helpers.cli import CLI
+from helpers.orchestrator import Orchestrator
+
+
+class GitSync:
+    """
+    Clones and updates git repositories (kobo-install, kobo-docker and
+    nginx-certbot) while downloading as little as possible:
+
+    - clones are shallow and only contain the pinned branch or tag. Existing
+      full clones are never made shallow;
+    - tags are considered immutable, thus nothing is fetched when the pinned
+      tag already exists locally (e.g. it is already checked out);
+    - branches are only fast-forwarded. Local commits are never dropped;
+    - an optional shared cache directory holds one mirror per repository.
+      Clones borrow objects from it, then copy them (`--dissociate`), so
+      several instances on the same host download each object once and do
+      not break if the cache is deleted.
+
+    Usage example:
+    ```
+    GitSync.clone('kobo-docker', '/opt/kobo-docker', ref='2.024.12')
+    GitSync.sync('/opt/kobo-docker', '2.024.36')
+    ```
+    """
+
+    URL = 'https://github.com/kobotoolbox/{repo_name}'
+
+    @classmethod
+    def clone(cls, repo_name, path, ref=None, reference_path=''):
+        """
+        Args:
+            repo_name (str): Name of the repository on GitHub
+            path (str): Destination. Must not exist or be empty
+            ref (str): Branch or tag to check out. Default branch if empty
+            reference_path (str): Shared cache directory. Disabled if empty
+        """
+        url = cls.URL.format(repo_name=repo_name)
+        git_command = ['git', 'clone', '--depth', '1', '--single-branch']
+        if ref:
+            git_command += ['--branch', ref]
+
+        reference = cls.__update_reference(url, repo_name, reference_path)
+        if reference:
+            git_command += ['--reference', reference, '--dissociate']
+
+        git_command += [url, path]
+        CLI.run_command(git_command, cwd=os.path.dirname(path))
+
+    @classmethod
+    def sync(cls, path, ref):
+        """
+        Checks out `ref` in `path`, fetching only if needed. Uncommitted
+        changes are discarded.
+
+        Tags are fetched with `--depth 1` in shallow clones only. Branches
+        are fast-forwarded; if the local branch has diverged from the remote
+        one, nothing is changed and the script exits.
+
+        Args:
+            path (str): Working copy
+            ref (str): Branch or tag. `HEAD` (i.e. detached HEAD) resolves to
+                       the tag which points to it, if any
+        """
+        if ref == 'HEAD':
+            ref = cls.__get_output(
+                path, ['describe', '--tags', '--exact-match', 'HEAD']
+            )
+            if not ref:
+                CLI.colored_print(
+                    f'`{path}` is neither on a branch nor on a tag. '
+                    'Nothing to update.',
+                    CLI.COLOR_WARNING,
+                )
+                return
+
+        if cls.__get_commit(path, f'refs/tags/{ref}'):
+            cls.__checkout_tag(path, ref)
+            return
+
+        remote_refs = CLI.run_command(
+            ['git', 'ls-remote', '--heads', '--tags', 'origin', ref], cwd=path
+        ).split()
+
+        if f'refs/tags/{ref}' in remote_refs:
+            git_command = ['git', 'fetch', '--force']
+            if cls.__get_output(
+                path, ['rev-parse', '--is-shallow-repository']
+            ) == 'true':
+                git_command += ['--depth', '1']
+            CLI.run_command(git_command + [
+                'origin', f'+refs/tags/{ref}:refs/tags/{ref}',
+            ], cwd=path)
+            cls.__checkout_tag(path, ref)
+        elif f'refs/heads/{ref}' in remote_refs:
+            # Without `--depth`, even shallow clones keep the history needed
+            # to fast-forward
+            CLI.run_command([
+                'git', 'fetch', '--force', 'origin',
+                f'+refs/heads/{ref}:refs/remotes/origin/{ref}',
+            ], cwd=path)
+            cls.__checkout_branch(path, ref)
+        else:
+            CLI.colored_print(
+                f'`{ref}` does not exist in the remote repository of `{path}`',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+    @classmethod
+    def sync_all(cls, repositories):
+        """
+        Runs `GitSync.sync()` on several working copies at the same time.
+
+        Args:
+            repositories (list): `(path, ref)` tuples
+        """
+        orchestrator = Orchestrator()
+        for path, ref in repositories:
+            orchestrator.add_step(
+                f'git:{path}',
+                lambda path_=path, ref_=ref: cls.sync(path_, ref_),
+            )
+        orchestrator.run()
+
+    @classmethod
+    def __checkout_branch(cls, path, ref):
+        remote_branch = f'refs/remotes/origin/{ref}'
+        if not cls.__get_commit(path, f'refs/heads/{ref}'):
+            CLI.run_command(
+                ['git', 'checkout', '--force', '-b', ref, remote_branch],
+                cwd=path,
+            )
+            return
+
+        CLI.run_command(['git', 'checkout', '--force', ref], cwd=path)
+        if cls.__get_output(
+            path, ['merge-base', '--is-ancestor', 'HEAD', remote_branch]
+        ) is None:
+            CLI.colored_print(
+                f'Branch `{ref}` of `{path}` has diverged from `origin/{ref}`. '
+                'Please merge or rebase it manually.',
+                CLI.COLOR_ERROR,
+            )
+            sys.exit(1)
+
+        CLI.run_command(['git', 'merge', '--ff-only', remote_branch], cwd=path)
+
+    @classmethod
+    def __checkout_tag(cls, path, ref):
+        if cls.__get_commit(path, 'HEAD') == cls.__get_commit(
+            path, f'refs/tags/{ref}'
+        ):
+            # Only restore modified files
+            CLI.run_command(['git', 'checkout', '--force', '.'], cwd=path)
+            return
+
+        CLI.run_command(
+            ['git', 'checkout', '--force', '--detach', f'refs/tags/{ref}'],
+            cwd=path,
+        )
+
+    @classmethod
+    def __get_commit(cls, path, rev):
+        """
+        Returns:
+            str: commit hash, `None` if `rev` does not exist
+        """
+        return cls.__get_output(
+            path, ['rev-parse', '--verify', '--quiet', f'{rev}^{{commit}}']
+        )
+
+    @staticmethod
+    def __get_output(path, args):
+        """
+        Runs `git` with `args` without exiting on errors.
+
+        Returns:
+            str: output, `None` if the command has failed
+        """
+        process = subprocess.run(
+            ['git'] + args,
+            cwd=path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        if process.returncode != 0:
+            return None
+        return process.stdout.strip()
+
+    @staticmethod
+    def __update_reference(url, repo_name, reference_path):
+        """
+        Creates or updates the mirror of `repo_name` in the shared cache.
+
+        Returns:
+            str: path of the mirror, `None` if the cache is disabled
+        """
+        if not reference_path:
+            return None
+
+        mirror_path = os.path.join(reference_path, f'{repo_name}.git')
+        if os.path.isdir(mirror_path):
+            CLI.run_command(['git', 'fetch', '--prune'], cwd=mirror_path)
+        else:
+            try:
+                os.makedirs(reference_path, exist_ok=True)
+            except OSError:
+                CLI.colored_print(
+                    f'Could not create directory {reference_path}!',
+                    CLI.COLOR_ERROR,
+                )
+                sys.exit(1)
+            CLI.colored_print(
+                f'Caching `{repo_name}` repository in `{mirror_path}`',
+                CLI.COLOR_INFO,
+            )
+            CLI.run_command(
+                ['git', 'clone', '--mirror', url, mirror_path],
+                cwd=reference_path,
+            )
+
+        return mirror_path
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import glob
+import math
+import os
+
+
+class HostProfile:
+    """
+    Detects resources of the host (memory, CPUs, storage type), taking
+    container limits (cgroup v1 and v2) into account, and proposes how to
+    split the memory between PostgreSQL, MongoDB, Redis, uWSGI workers and
+    Celery workers.
+
+    Usage example:
+    ```
+    host_profile = HostProfile.detect()
+    proposals = host_profile.get_proposals(frontend=True, backend=True)
+    ```
+    """
+
+    # Memory left to the OS and Docker daemon
+    MIN_RESERVED_MEMORY = 512
+    RESERVED_MEMORY_RATIO = 0.1
+
+    # Shares of the available memory, depending on server roles.
+    # `redis_main` is kept as headroom but never capped: it holds Celery
+    # queues and Enketo data and would refuse writes once full.
+    MEMORY_SHARES = {
+        (True, True): {
+            'postgres': 0.25,
+            'mongo': 0.10,
+            'redis_main': 0.05,
+            'redis_cache': 0.05,
+            'uwsgi': 0.30,
+            'celery': 0.25,
+        },
+        (False, True): {
+            'postgres': 0.55,
+            'mongo': 0.25,
+            'redis_main': 0.10,
+            'redis_cache': 0.10,
+        },
+        (True, False): {
+            'uwsgi': 0.55,
+            'celery': 0.45,
+        },
+    }
+
+    # Average memory used by one process (in MB)
+    UWSGI_WORKER_MEMORY = 300
+    CELERY_WORKER_MEMORY = 200
+    # Each Celery queue has its own container (`worker`, `worker_kobocat`,
+    # `worker_low_priority`, `worker_long_running_tasks`)
+    CELERY_WORKER_SERVICES = 4
+    # Default `celery_autoscale_min` and `celery_autoscale_max`. Celery
+    # workers are mostly idle, thus proposals never go below them.
+    MIN_CELERY_AUTOSCALE_MIN = 2
+    MIN_CELERY_AUTOSCALE_MAX = 6
+
+    MIN_MONGO_CACHE_MEMORY = 256
+    MIN_REDIS_CACHE_MEMORY = 64
+
+    def __init__(self, memory, cpus, drive_type):
+        """
+        Args:
+            memory (int): Total memory in MB
+            cpus (int): Number of CPUs
+            drive_type (str): `hdd` or `ssd`
+        """
+        self.memory = memory
+        self.cpus = cpus
+        self.drive_type = drive_type
+
+    def __repr__(self):
+        return (
+            f'{self.memory} MB of RAM, {self.cpus} CPU(s), '
+            f'{self.drive_type.upper()} storage'
+        )
+
+    @classmethod
+    def detect(cls, root='/'):
+        """
+        Args:
+            root (str): Root of the file system, useful for tests
+
+        Returns:
+            HostProfile
+        """
+        return cls(
+            memory=cls.__detect_memory(root),
+            cpus=cls.__detect_cpus(root),
+            drive_type=cls.__detect_drive_type(root),
+        )
+
+    def get_memory_budget(self, frontend=True, backend=True):
+        """
+        Splits available memory between services running on this server.
+
+        Returns:
+            dict: memory (in MB) per component
+        """
+        reserved = max(
+            self.MIN_RESERVED_MEMORY,
+            int(self.memory * self.RESERVED_MEMORY_RATIO),
+        )
+        available = max(self.memory - reserved, 0)
+        shares = self.MEMORY_SHARES.get((frontend, backend), {})
+        return {
+            component: int(available * share)
+            for component, share in shares.items()
+        }
+
+    def get_proposals(self, frontend=True, backend=True):
+        """
+        Returns values for `.run.conf` keys based on the memory budget.
+
+        Returns:
+            dict
+        """
+        budget = self.get_memory_budget(frontend=frontend, backend=backend)
+        proposals = {}
+
+        if backend:
+            postgres_ram = budget['postgres']
+            if frontend:
+                # `Mixed` profile halves the memory given to PostgreSQL
+                postgres_ram *= 2
+            postgres_ram //= 1024
+
+            proposals.update({
+                'postgres_cpus': str(self.cpus),
+                'postgres_ram': str(max(1, postgres_ram)),
+                'postgres_hard_drive_type': self.drive_type,
+                'redis_cache_max_memory': str(
+                    max(self.MIN_REDIS_CACHE_MEMORY, budget['redis_cache'])
+                ),
+                # WiredTiger cache size in GB, by steps of 0.25 GB
+                'mongo_wiredtiger_cache_size': self.__format_gb(
+                    max(self.MIN_MONGO_CACHE_MEMORY, budget['mongo'])
+                ),
+            })
+
+        if frontend:
+            uwsgi_workers_max = self.__clamp(
+                budget['uwsgi'] // self.UWSGI_WORKER_MEMORY,
+                2,
+                max(2, self.cpus * 2),
+            )
+            celery_autoscale_max = self.__clamp(
+                budget['celery']
+                // (self.CELERY_WORKER_MEMORY * self.CELERY_WORKER_SERVICES),
+                self.MIN_CELERY_AUTOSCALE_MAX,
+                max(self.MIN_CELERY_AUTOSCALE_MAX, self.cpus * 2),
+            )
+            proposals.update({
+                'uwsgi_workers_start': str(max(1, uwsgi_workers_max // 2)),
+                'uwsgi_workers_max': str(uwsgi_workers_max),
+                'celery_autoscale_min': str(max(
+                    self.MIN_CELERY_AUTOSCALE_MIN, celery_autoscale_max // 3
+                )),
+                'celery_autoscale_max': str(celery_autoscale_max),
+            })
+
+        return proposals
+
+    @staticmethod
+    def __clamp(value, minimum, maximum):
+        return max(minimum, min(value, maximum))
+
+    @staticmethod
+    def __format_gb(memory):
+        """
+        Converts `memory` (in MB) to GB, rounded down to the closest 0.25 GB.
+        """
+        quarters = max(1, memory * 4 // 1024)
+        return f'{quarters / 4:g}'
+
+    @classmethod
+    def __detect_cpus(cls, root):
+        try:
+            cpus = len(os.sched_getaffinity(0))
+        except AttributeError:
+            # Not available on macOS
+            cpus = os.cpu_count() or 1
+
+        quota = period = None
+        # cgroup v2
+        cpu_max = cls.__read(root, 'sys/fs/cgroup/cpu.max')
+        if cpu_max:
+            values = cpu_max.split()
+            if len(values) == 2 and values[0] != 'max':
+                quota, period = int(values[0]), int(values[1])
+        else:
+            # cgroup v1
+            cfs_quota = cls.__read(root, 'sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+            cfs_period = cls.__read(root, 'sys/fs/cgroup/cpu/cpu.cfs_period_us')
+            if cfs_quota and cfs_period and int(cfs_quota) > 0:
+                quota, period = int(cfs_quota), int(cfs_period)
+
+        if quota and period:
+            cpus = min(cpus, max(1, math.ceil(quota / period)))
+
+        return cpus
+
+    @classmethod
+    def __detect_drive_type(cls, root):
+        """
+        Returns `ssd` if all physical block devices are non-rotational,
+        `hdd` otherwise.
+        """
+        rotational_flags = []
+        for path in glob.glob(os.path.join(root, 'sys/block/*')):
+            if os.path.basename(path).startswith(('loop', 'ram', 'zram', 'dm-')):
+                continue
+            flag = cls.__read(
+                root, os.path.relpath(os.path.join(path, 'queue/rotational'), root)
+            )
+            if flag is not None:
+                rotational_flags.append(flag)
+
+        if rotational_flags and all(flag == '0' for flag in rotational_flags):
+            return 'ssd'
+        return 'hdd'
+
+    @classmethod
+    def __detect_memory(cls, root):
+        """
+        Returns the total memory in MB, or the memory limit of the cgroup if
+        it is lower.
+        """
+        memory = 2048
+        meminfo = cls.__read(root, 'proc/meminfo')
+        if meminfo:
+            for line in meminfo.split('\n'):
+                if line.startswith('MemTotal:'):
+                    memory = int(line.split()[1]) // 1024
+                    break
+
+        # cgroup v2 first, then v1. No limit is either `max` or a huge number
+        for limit_file in [
+            'sys/fs/cgroup/memory.max',
+            'sys/fs/cgroup/memory/memory.limit_in_bytes',
+        ]:
+            limit = cls.__read(root, limit_file)
+            if limit and limit.isdigit():
+                memory = min(memory, int(limit) // 1024 // 1024)
+                break
+
+        return memory
+
+    @staticmethod
+    def __read(root, path):
+        try:
+            with open(os.path.join(root, path), 'r') as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return None
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import selectors
+import subprocess
+
+from helpers.cli import CLI
+
+
+class LogMultiplexer:
+    """
+    Follows the output of several `docker compose logs -f` commands at the
+    same time and prints their lines as soon as they are available, prefixed
+    by project and service.
+
+    Reads are non-blocking (see `selectors`) and done by chunks. Only
+    incomplete lines are buffered, up to `MAX_LINE_LENGTH` bytes per source,
+    so a chatty service cannot make memory grow.
+
+    Usage example:
+    ```
+    multiplexer = LogMultiplexer(services=['kpi'], pattern='error')
+    multiplexer.add_source('frontend', frontend_command, cwd)
+    multiplexer.add_source('backend', backend_command, cwd)
+    multiplexer.run()
+    ```
+    """
+
+    CHUNK_SIZE = 65536
+    MAX_LINE_LENGTH = 16384
+    PROJECT_COLORS = [
+        CLI.COLOR_INFO,
+        CLI.COLOR_SUCCESS,
+        CLI.COLOR_QUESTION,
+        CLI.COLOR_DEFAULT,
+    ]
+    # `docker compose logs --no-color` prefixes lines with `<service>-<index>  | `
+    COMPOSE_PREFIX_PATTERN = re.compile(r'^(?P<container>\S+?)\s+\| ?(?P<message>.*)$')
+    REPLICA_SUFFIX_PATTERN = re.compile(r'-\d+$')
+
+    def __init__(self, services=None, pattern=None, output=None):
+        """
+        Args:
+            services (list): Only print lines of these services
+            pattern (str): Only print lines matching this regular expression
+            output (callable): Called with each formatted line. Defaults to
+                               `print`
+        """
+        self.__services = set(services or [])
+        self.__pattern = re.compile(pattern) if pattern else None
+        self.__output = output or print
+        self.__sources = []
+
+    def add_source(self, project, command, cwd=None):
+        self.__sources.append({
+            'project': project,
+            'command': command,
+            'cwd': cwd,
+            'color': self.PROJECT_COLORS[
+                len(self.__sources) % len(self.PROJECT_COLORS)
+            ],
+        })
+
+    def run(self):
+        """
+        Streams logs until all commands exit (or the user interrupts).
+        """
+        selector = selectors.DefaultSelector()
+        processes = []
+        try:
+            for source in self.__sources:
+                process = subprocess.Popen(
+                    source['command'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    cwd=source['cwd'],
+                )
+                processes.append(process)
+                os.set_blocking(process.stdout.fileno(), False)
+                selector.register(
+                    process.stdout,
+                    selectors.EVENT_READ,
+                    data={'source': source, 'buffer': bytearray()},
+                )
+
+            while selector.get_map():
+                for key, _ in selector.select():
+                    data = key.data
+                    chunk = os.read(key.fd, self.CHUNK_SIZE)
+                    if not chunk:
+                        # End of file, flush what remains
+                        if data['buffer']:
+                            self.__print_line(data['source'], data['buffer'])
+                        selector.unregister(key.fileobj)
+                        continue
+
+                    self.__feed(data, chunk)
+        finally:
+            selector.close()
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+                process.wait()
+                process.stdout.close()
+
+    def __feed(self, data, chunk):
+        buffer = data['buffer']
+        buffer.extend(chunk)
+        *lines, remainder = buffer.split(b'\n')
+        for line in lines:
+            self.__print_line(data['source'], line)
+
+        if len(remainder) > self.MAX_LINE_LENGTH:
+            # Do not keep growing the buffer with a line which never ends
+            self.__print_line(
+                data['source'], remainder[:self.MAX_LINE_LENGTH] + b'...'
+            )
+            remainder = b''
+
+        data['buffer'] = bytearray(remainder)
+
+    def __print_line(self, source, line):
+        line = bytes(line).decode(errors='replace').rstrip('\r')
+        match = self.COMPOSE_PREFIX_PATTERN.match(line)
+        if match:
+            container = match.group('container')
+            service = self.REPLICA_SUFFIX_PATTERN.sub('', container)
+            message = match.group('message')
+        else:
+            container = service = ''
+            message = line
+
+        if self.__services and service not in self.__services:
+            return
+
+        if self.__pattern and not self.__pattern.search(message):
+            return
+
+        prefix = CLI.colorize(f"[{source['project']}]", source['color'])
+        if container:
+            prefix = f'{prefix} {container} |'
+        self.__output(f'{prefix} {message}')
@@ -9,6 +9,7 @@ from http import client as httplib
 from urllib.request import urlopen
 
 from helpers.cli import CLI
+from helpers.tracer import Tracer
 
 
 class Network:
@@ -16,6 +17,7 @@ class Network:
     STATUS_OK_200 = 200
 
     @staticmethod
+    @Tracer.trace('network')
     def get_local_interfaces(all_=False):
         """
         Returns a dictionary of name:ip key value pairs.
@@ -129,6 +131,7 @@ class Network:
         return ip_dict
 
     @staticmethod
+    @Tracer.trace('network')
     def get_primary_ip():
         """
         https://stackoverflow.com/a/28950776/1141214
@@ -163,6 +166,7 @@ class Network:
         return 'eth0'
 
     @staticmethod
+    @Tracer.trace('network')
     def status_check(hostname, endpoint, port=80, secure=False):
         try:
             if secure:
@@ -182,12 +186,14 @@ class Network:
         return
 
     @staticmethod
+    @Tracer.trace('network')
     def is_port_open(port):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         result = sock.connect_ex(('127.0.0.1', int(port)))
         return result == 0
 
     @staticmethod
+    @Tracer.trace('network')
     def curl(url):
         try:
             response = urlopen(url)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+
+
+class Orchestrator:
+    """
+    Runs a set of steps as a dependency graph.
+
+    Each step is a callable registered with the names of the steps it depends
+    on. Steps whose dependencies are all completed run at the same time on a
+    thread pool. Dependencies on steps which have not been registered are
+    ignored, which lets callers build the graph conditionally (e.g. skip
+    `certbot` steps when Let's Encrypt is not used).
+
+    Usage example:
+    ```
+    orchestrator = Orchestrator()
+    orchestrator.add_step('stop:frontend', stop_frontend)
+    orchestrator.add_step('down:frontend', down_frontend,
+                          depends_on=['stop:frontend'])
+    orchestrator.run()
+    ```
+    """
+
+    MAX_WORKERS = 4
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.__max_workers = max_workers
+        self.__steps = {}
+
+    def add_step(self, name, callable_, depends_on=None):
+        """
+        Registers a step.
+
+        Args:
+            name (str): Unique name of the step
+            callable_ (callable): Function called without arguments
+            depends_on (list): Names of the steps which must be completed first
+        """
+        if name in self.__steps:
+            raise Exception(f'Step `{name}` is already registered')
+
+        self.__steps[name] = {
+            'callable': callable_,
+            'depends_on': set(depends_on or []),
+        }
+
+    def run(self):
+        """
+        Runs all registered steps, respecting their dependencies.
+
+        If a step raises an exception (including `SystemExit` raised by
+        `CLI.run_command()`), no other steps are started, running ones are
+        awaited and the exception is raised again in the calling thread.
+
+        Returns:
+            list: names of the steps in order of completion
+        """
+        pending = {
+            name: step['depends_on'].intersection(self.__steps)
+            for name, step in self.__steps.items()
+        }
+        self.__validate(pending)
+
+        completed = []
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    for name in [
+                        name_
+                        for name_, depends_on in pending.items()
+                        if depends_on.issubset(completed)
+                    ]:
+                        del pending[name]
+                        future = executor.submit(
+                            self.__steps[name]['callable']
+                        )
+                        running[future] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                    else:
+                        completed.append(name)
+
+        if error is not None:
+            raise error
+
+        return completed
+
+    @staticmethod
+    def __validate(pending):
+        """
+        Detects cycles in the dependency graph to avoid waiting forever.
+        """
+        resolved = set()
+        remaining = dict(pending)
+        while remaining:
+            ready = [
+                name
+                for name, depends_on in remaining.items()
+                if depends_on.issubset(resolved)
+            ]
+            if not ready:
+                names = ', '.join(sorted(remaining))
+                raise Exception(f'Circular dependencies between: {names}')
+            for name in ready:
+                resolved.add(name)
+                del remaining[name]
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+
+class PostgresTuning:
+    """
+    Computes PostgreSQL settings offline, following the rules of
+    PGConfig (https://www.pgconfig.org) for PostgreSQL 14 on Linux.
+
+    Usage example:
+    ```
+    content = PostgresTuning.get_settings_content(
+        cpus=2,
+        ram=4,
+        drive_type='ssd',
+        max_connections=100,
+        profile='Mixed',
+    )
+    ```
+    """
+
+    PG_VERSION = 14
+
+    KB = 1
+    MB = 1024 * KB
+    GB = 1024 * MB
+
+    # Lowest value accepted by PostgreSQL
+    MIN_WORK_MEM = 64 * KB
+
+    # `random_page_cost`, `effective_io_concurrency`
+    STORAGE_SETTINGS = {
+        'hdd': ('4', '2'),
+        'ssd': ('1.1', '200'),
+        'san': ('2', '300'),
+    }
+
+    # `min_wal_size`, `max_wal_size` (in kB)
+    WAL_SIZES = {
+        'web': (2 * GB, 3 * GB),
+        'oltp': (2 * GB, 3 * GB),
+        'dw': (4 * GB, 16 * GB),
+        'mixed': (2 * GB, 3 * GB),
+        'desktop': (2 * GB, 3 * GB),
+    }
+
+    # Connections kept for direct access to PostgreSQL when a pooler is used
+    # (superuser, backups, migrations, replication)
+    POOLER_RESERVED_CONNECTIONS = 10
+    POOLER_RESERVE_POOL_RATIO = 0.2
+
+    @classmethod
+    def get_pooler_settings(cls, max_connections, databases=2, pool_size=None):
+        """
+        Returns PgBouncer pool sizes which fit within PostgreSQL
+        `max_connections`. There is one pool per database (KPI and KoboCAT
+        share the same user).
+
+        Args:
+            max_connections (int|str): PostgreSQL `max_connections`
+            databases (int): Number of databases served by the pooler
+            pool_size (int|str): Requested pool size per database. It is
+                                 lowered if it does not fit.
+
+        Returns:
+            dict: `default_pool_size`, `reserve_pool_size` and
+                  `max_db_connections`
+        """
+        max_connections = max(int(max_connections), 1)
+        max_db_connections = max(
+            1, (max_connections - cls.POOLER_RESERVED_CONNECTIONS) // databases
+        )
+        reserve_pool_size = int(max_db_connections * cls.POOLER_RESERVE_POOL_RATIO)
+        if pool_size:
+            default_pool_size = min(int(pool_size), max_db_connections)
+        else:
+            default_pool_size = max(1, max_db_connections - reserve_pool_size)
+
+        return {
+            'default_pool_size': default_pool_size,
+            'reserve_pool_size': min(
+                reserve_pool_size, max_db_connections - default_pool_size
+            ),
+            'max_db_connections': max_db_connections,
+        }
+
+    @classmethod
+    def get_settings(
+        cls, cpus, ram, drive_type, max_connections, profile
+    ):
+        """
+        Returns settings as a list of `(section, [(name, value), ...])`.
+
+        Args:
+            cpus (int|str): Number of CPUs
+            ram (int|str): Total memory in GB
+            drive_type (str): `hdd`, `ssd` or `san`
+            max_connections (int|str)
+            profile (str): `Web`, `OLTP`, `DW`, `Mixed` or `Desktop`
+                           (case-insensitive)
+
+        Returns:
+            list
+        """
+        cpus = int(cpus)
+        ram = int(ram)
+        max_connections = int(max_connections)
+        drive_type = drive_type.lower()
+        profile = profile.lower()
+
+        for name, value in [
+            ('cpus', cpus),
+            ('ram', ram),
+            ('max_connections', max_connections),
+        ]:
+            if value < 1:
+                raise ValueError(f'`{name}` must be positive: {value}')
+        if profile not in cls.WAL_SIZES:
+            raise ValueError(f'Unknown profile: {profile}')
+        if drive_type not in cls.STORAGE_SETTINGS:
+            raise ValueError(f'Unknown drive type: {drive_type}')
+
+        total_ram = ram * cls.GB
+        if profile == 'mixed':
+            # Database shares the server with the application
+            total_ram //= 2
+
+        if profile == 'desktop':
+            shared_buffers = total_ram // 16
+            effective_cache_size = total_ram // 4
+            work_mem = (total_ram - shared_buffers) // (max_connections * 6)
+        else:
+            shared_buffers = total_ram // 4
+            effective_cache_size = total_ram * 3 // 4
+            if profile == 'dw':
+                work_mem = (
+                    (total_ram - shared_buffers) * 2 // (max_connections * 3)
+                )
+            else:
+                work_mem = (
+                    (total_ram - shared_buffers) // (max_connections * 3)
+                )
+
+        work_mem = max(work_mem, cls.MIN_WORK_MEM)
+
+        if profile == 'dw':
+            maintenance_work_mem = total_ram // 8
+        else:
+            maintenance_work_mem = total_ram // 20
+
+        min_wal_size, max_wal_size = cls.WAL_SIZES[profile]
+        random_page_cost, effective_io_concurrency = cls.STORAGE_SETTINGS[
+            drive_type
+        ]
+
+        return [
+            ('Memory Configuration', [
+                ('shared_buffers', cls.format_size(shared_buffers)),
+                ('effective_cache_size', cls.format_size(effective_cache_size)),
+                ('work_mem', cls.format_size(work_mem)),
+                ('maintenance_work_mem', cls.format_size(maintenance_work_mem)),
+            ]),
+            ('Checkpoint Related Configuration', [
+                ('min_wal_size', cls.format_size(min_wal_size)),
+                ('max_wal_size', cls.format_size(max_wal_size)),
+                ('checkpoint_completion_target', '0.9'),
+                ('wal_buffers', '-1'),
+            ]),
+            ('Network Related Configuration', [
+                ('listen_addresses', "'*'"),
+                ('max_connections', str(max_connections)),
+            ]),
+            ('Storage Configuration', [
+                ('random_page_cost', random_page_cost),
+                ('effective_io_concurrency', effective_io_concurrency),
+            ]),
+            ('Worker Processes Configuration', [
+                ('max_worker_processes', str(max(8, cpus))),
+                ('max_parallel_workers_per_gather', str(max(2, cpus // 2))),
+                ('max_parallel_workers', str(max(2, cpus))),
+            ]),
+        ]
+
+    @classmethod
+    def get_settings_content(
+        cls, cpus, ram, drive_type, max_connections, profile
+    ):
+        """
+        Returns the content of `postgres.conf` for the given hardware.
+        See `PostgresTuning.get_settings()` for arguments.
+
+        Returns:
+            str
+        """
+        lines = [
+            '# Generated by kobo-install',
+            f'# pg_version={cls.PG_VERSION} environment_name={profile} '
+            f'total_ram={ram}GB cpus={cpus} drive_type={drive_type.upper()} '
+            f'max_connections={max_connections}',
+            '',
+        ]
+        for section, settings in cls.get_settings(
+            cpus, ram, drive_type, max_connections, profile
+        ):
+            lines.append(f'# {section}')
+            for name, value in settings:
+                lines.append(f'{name} = {value}')
+            lines.append('')
+
+        lines.append('')
+        return '\n'.join(lines)
+
+    @classmethod
+    def format_size(cls, size):
+        """
+        Formats `size` (in kB) the way PostgreSQL expects it, with the
+        largest unit which does not lose precision for GB and rounding down
+        to the closest MB otherwise.
+
+        Returns:
+            str
+        """
+        if size >= cls.GB and size % cls.GB == 0:
+            return f'{size // cls.GB}GB'
+        if size >= cls.MB:
+            return f'{size // cls.MB}MB'
+        return f'{size}kB'
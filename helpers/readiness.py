@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.cli import CLI
+from helpers.config import Config
+from helpers.network import Network
+
+
+class Readiness:
+    """
+    Probes KoboToolbox services concurrently until they are all ready.
+
+    Front-end services are checked through their HTTP endpoints and back-end
+    services (when their ports are exposed) with TCP connections. Each probe
+    retries independently with a jittered exponential backoff, starting at
+    `INITIAL_DELAY` seconds and capped at `MAX_DELAY` seconds, so readiness is
+    detected shortly after it happens.
+
+    Usage example:
+    ```
+    readiness = Readiness(config)
+    if readiness.wait(timeout=600):
+        ...
+    ```
+    """
+
+    INITIAL_DELAY = 0.5
+    MAX_DELAY = 10
+    BACKOFF_FACTOR = 2
+    HTTP_TIMEOUT = 10
+    TCP_TIMEOUT = 3
+
+    def __init__(self, config):
+        self.__probes = self.__get_probes(config)
+
+    @property
+    def probes(self):
+        return [probe['name'] for probe in self.__probes]
+
+    def wait(self, timeout):
+        """
+        Waits for all services to be ready.
+
+        Args:
+            timeout (int): Maximum time (in seconds) to wait. If `0`, each
+                           service is probed only once.
+
+        Returns:
+            bool: `True` if all services are ready
+        """
+        if not self.__probes:
+            return True
+
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=len(self.__probes))
+        loop.set_default_executor(executor)
+        try:
+            statuses = loop.run_until_complete(self.__wait(timeout))
+        finally:
+            loop.close()
+            # Do not wait for HTTP requests which are still pending
+            executor.shutdown(wait=False)
+
+        return all(statuses)
+
+    async def __wait(self, timeout):
+        start = time.monotonic()
+        tasks = [
+            asyncio.ensure_future(self.__run_probe(probe, start, timeout))
+            for probe in self.__probes
+        ]
+        return await asyncio.gather(*tasks)
+
+    @classmethod
+    def __get_delay(cls, attempt):
+        delay = min(
+            cls.MAX_DELAY, cls.INITIAL_DELAY * cls.BACKOFF_FACTOR ** attempt
+        )
+        # Jitter avoids probing all services at the exact same time
+        return random.uniform(delay / 2, delay)
+
+    @classmethod
+    def __get_probes(cls, config):
+        dict_ = config.get_dict()
+        probes = []
+
+        if not config.multi_servers or config.frontend:
+            https = dict_['https']
+            port = (
+                int(Config.DEFAULT_NGINX_HTTPS_PORT)
+                if https
+                else int(dict_['exposed_nginx_docker_port'])
+            )
+            domain_name = dict_['public_domain_name']
+            # KPI must return 200. For the other ones, any answer which does
+            # not come from NGINX because the upstream is unavailable (i.e.
+            # 502, 503, 504) means the service is up.
+            for name, subdomain, endpoint, is_healthy in [
+                (
+                    'kpi',
+                    dict_['kpi_subdomain'],
+                    '/service_health/',
+                    lambda status: status == Network.STATUS_OK_200,
+                ),
+                (
+                    'kobocat',
+                    dict_['kc_subdomain'],
+                    '/service_health/',
+                    lambda status: status is not None and status < 500,
+                ),
+                (
+                    'enketo_express',
+                    dict_['ee_subdomain'],
+                    '/',
+                    lambda status: status is not None and status < 500,
+                ),
+            ]:
+                probes.append({
+                    'name': name,
+                    'check': cls.__get_http_check(
+                        f'{subdomain}.{domain_name}',
+                        endpoint,
+                        port,
+                        https,
+                        is_healthy,
+                    ),
+                })
+
+        if config.expose_backend_ports:
+            host = (
+                '127.0.0.1' if config.backend else dict_['primary_backend_ip']
+            )
+            for name, port in [
+                ('postgres', dict_['postgresql_port']),
+                ('mongo', dict_['mongo_port']),
+                ('redis_main', dict_['redis_main_port']),
+                ('redis_cache', dict_['redis_cache_port']),
+            ]:
+                probes.append({
+                    'name': name,
+                    'check': cls.__get_tcp_check(host, port),
+                })
+
+        return probes
+
+    @classmethod
+    def __get_http_check(cls, hostname, endpoint, port, secure, is_healthy):
+        async def _check():
+            loop = asyncio.get_event_loop()
+            status = await loop.run_in_executor(
+                None,
+                Network.status_check,
+                hostname,
+                endpoint,
+                port,
+                secure,
+            )
+            return is_healthy(status)
+
+        return _check
+
+    @classmethod
+    def __get_tcp_check(cls, host, port):
+        async def _check():
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, int(port)),
+                    timeout=cls.TCP_TIMEOUT,
+                )
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            return True
+
+        return _check
+
+    async def __run_probe(self, probe, start, timeout):
+        attempt = 0
+        while True:
+            if await probe['check']():
+                elapsed = time.monotonic() - start
+                CLI.colored_print(
+                    f"  `{probe['name']}` is ready ({elapsed:.1f}s)",
+                    CLI.COLOR_SUCCESS,
+                )
+                return True
+
+            delay = self.__get_delay(attempt)
+            attempt += 1
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                CLI.colored_print(
+                    f"  `{probe['name']}` is not ready", CLI.COLOR_WARNING
+                )
+                return False
+
+            await asyncio.sleep(min(delay, remaining))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+
+class RedisTuning:
+    """
+    Computes settings of both Redis instances.
+
+    - `redis_main` holds Celery queues and Enketo data. Keys must never be
+      evicted and data must survive a restart (AOF, `fsync` every second).
+    - `redis_cache` holds Django cache and sessions. It evicts keys when it is
+      full and does not persist anything.
+
+    Usage example:
+    ```
+    content = RedisTuning.get_settings_content(
+        'redis_cache', max_memory='512', eviction_policy='allkeys-lru'
+    )
+    ```
+    """
+
+    INSTANCES = ['redis_main', 'redis_cache']
+
+    EVICTION_POLICIES = ['allkeys-lru', 'allkeys-lfu']
+
+    # Ports containers listen to
+    PORTS = {
+        'redis_main': '6379',
+        'redis_cache': '6380',
+    }
+
+    @classmethod
+    def get_settings(cls, instance, max_memory='', eviction_policy=None):
+        """
+        Returns settings as a list of `(name, value)`.
+
+        Args:
+            instance (str): `redis_main` or `redis_cache`
+            max_memory (str): Max memory in MB. Empty (or `-`) means no limit
+            eviction_policy (str): Eviction policy of `redis_cache`
+
+        Returns:
+            list
+        """
+        if instance not in cls.INSTANCES:
+            raise ValueError(f'Unknown Redis instance: {instance}')
+
+        max_memory = str(max_memory).strip()
+        if max_memory.isdigit() and int(max_memory) > 0:
+            max_memory = f'{max_memory}mb'
+        else:
+            max_memory = '0'
+
+        if instance == 'redis_main':
+            return [
+                ('maxmemory', max_memory),
+                # Celery would lose tasks if keys were evicted
+                ('maxmemory-policy', 'noeviction'),
+                ('appendonly', 'yes'),
+                ('appendfsync', 'everysec'),
+                # RDB snapshots are still used by backups
+                ('save', '3600 1 300 100 60 10000'),
+            ]
+
+        eviction_policy = eviction_policy or cls.EVICTION_POLICIES[0]
+        if eviction_policy not in cls.EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy: {eviction_policy}')
+
+        return [
+            ('maxmemory', max_memory),
+            ('maxmemory-policy', eviction_policy),
+            ('appendonly', 'no'),
+            ('save', '""'),
+        ]
+
+    @classmethod
+    def get_settings_content(cls, instance, max_memory='', eviction_policy=None):
+        """
+        Returns settings in `redis.conf` format.
+        See `RedisTuning.get_settings()` for arguments.
+
+        Returns:
+            str
+        """
+        lines = [f'# Generated by kobo-install for `{instance}`']
+        for name, value in cls.get_settings(
+            instance, max_memory, eviction_policy
+        ):
+            lines.append(f'{name} {value}')
+
+        lines.append('')
+        return '\n'.join(lines)
@@ -7,12 +7,15 @@ import tempfile
 from helpers.cli import CLI
 from helpers.command import Command
 from helpers.config import Config
+from helpers.git_sync import GitSync
 from helpers.template import Template
+from helpers.tracer import Tracer
 
 
 class Setup:
 
     @classmethod
+    @Tracer.trace('git')
     def clone_kobodocker(cls, config):
         """
             Args:
@@ -30,12 +33,12 @@ class Setup:
                         os.path.join(tmp_dirpath, Config.UNIQUE_ID_FILE))
 
             # clone project
-            git_command = [
-                'git', 'clone', 'https://github.com/kobotoolbox/kobo-docker',
-                dict_['kobodocker_path']
-            ]
-            CLI.run_command(git_command, cwd=os.path.dirname(
-                dict_['kobodocker_path']))
+            GitSync.clone(
+                'kobo-docker',
+                dict_['kobodocker_path'],
+                ref=Config.KOBO_DOCKER_BRANCH,
+                reference_path=dict_['git_reference_path'],
+            )
 
             shutil.move(os.path.join(tmp_dirpath, Config.UNIQUE_ID_FILE),
                         os.path.join(dict_['kobodocker_path'],
@@ -76,6 +79,7 @@ class Setup:
                 Command.start(force_setup=True)
 
     @staticmethod
+    @Tracer.trace('git')
     def update_kobodocker(dict_=None):
         """
             Args:
@@ -85,31 +89,34 @@ class Setup:
             config = Config()
             dict_ = config.get_dict()
 
-        # fetch new tags and prune
-        git_command = ['git', 'fetch', '-p']
-        CLI.run_command(git_command, cwd=dict_['kobodocker_path'])
-
-        # checkout branch
-        git_command = ['git', 'checkout', '--force', Config.KOBO_DOCKER_BRANCH]
-        CLI.run_command(git_command, cwd=dict_['kobodocker_path'])
+        GitSync.sync(dict_['kobodocker_path'], Config.KOBO_DOCKER_BRANCH)
 
-        # update code
-        git_command = ['git', 'pull', 'origin', Config.KOBO_DOCKER_BRANCH]
-        CLI.run_command(git_command, cwd=dict_['kobodocker_path'])
+        # Compose files may have changed
+        Config().clear_service_catalog()
 
     @staticmethod
-    def update_koboinstall(version):
-        # fetch new tags and prune
-        git_fetch_prune_command = ['git', 'fetch', '-p']
-        CLI.run_command(git_fetch_prune_command)
-
-        # checkout branch
-        git_command = ['git', 'checkout', '--force', version]
-        CLI.run_command(git_command)
-
-        # update code
-        git_command = ['git', 'pull', 'origin', version]
-        CLI.run_command(git_command)
+    @Tracer.trace('git')
+    def update_koboinstall(version, update_kobodocker=False):
+        """
+            Args:
+                version (str): Branch or tag of kobo-install
+                update_kobodocker (bool): Also update kobo-docker, at the
+                                          same time
+        """
+        repositories = [(
+            os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+            version,
+        )]
+        if update_kobodocker:
+            repositories.append(
+                (Config().get_dict()['kobodocker_path'],
+                 Config.KOBO_DOCKER_BRANCH)
+            )
+
+        GitSync.sync_all(repositories)
+
+        if update_kobodocker:
+            Config().clear_service_catalog()
 
     @classmethod
     def update_hosts(cls, dict_):
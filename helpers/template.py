@@ -1,27 +1,123 @@
 # -*- coding: utf-8 -*-
 import fnmatch
+import hashlib
 import json
 import os
 import re
 import stat
 import sys
+from collections import ChainMap
 from string import Template as PyTemplate
 
 from helpers.cli import CLI
 from helpers.config import Config
+from helpers.postgres_tuning import PostgresTuning
+from helpers.redis_tuning import RedisTuning
+from helpers.tracer import Tracer
 
 
 class Template:
     UNIQUE_ID_FILE = '.uniqid'
+    RENDER_MANIFEST_FILE = '.render_manifest.json'
+
+    KPI_SERVICES = [
+        'kpi',
+        'worker',
+        'worker_kobocat',
+        'worker_low_priority',
+        'worker_long_running_tasks',
+        'beat',
+    ]
+    BACKEND_SERVICES = ['postgres', 'mongo', 'redis_main', 'redis_cache']
+
+    # Compose services which consume each rendered file, per project.
+    # `None` means the file is part of the compose configuration itself and
+    # `docker compose up -d` detects by itself which services have changed.
+    # Files which are not listed (e.g. `nginx-certbot` ones) require a full
+    # restart.
+    SERVICES_BY_RENDERED_FILE = {
+        'kobo-env/envfiles/aws.txt': {
+            'frontend': KPI_SERVICES,
+            'backend': BACKEND_SERVICES,
+        },
+        'kobo-env/envfiles/databases.txt': {
+            'frontend': KPI_SERVICES + ['enketo_express'],
+            'backend': BACKEND_SERVICES,
+        },
+        'kobo-env/envfiles/django.txt': {
+            'frontend': KPI_SERVICES,
+        },
+        'kobo-env/envfiles/domains.txt': {
+            'frontend': KPI_SERVICES + ['enketo_express', 'nginx'],
+        },
+        'kobo-env/envfiles/external_services.txt': {
+            'frontend': KPI_SERVICES,
+        },
+        'kobo-env/envfiles/smtp.txt': {
+            'frontend': KPI_SERVICES,
+        },
+        'kobo-env/enketo_express/config.json': {
+            'frontend': ['enketo_express'],
+        },
+        'kobo-env/postgres/conf/postgres.conf': {
+            'backend': ['postgres'],
+        },
+        # Run by `kobo-install` after the back end is up
+        'kobo-env/postgres/replication/primary.bash': {
+            'backend': [],
+        },
+        'kobo-env/postgres/replication/standby.bash': {
+            'backend': ['postgres'],
+        },
+        'kobo-env/pgbouncer/pgbouncer.ini': {
+            'backend': ['pgbouncer'],
+        },
+        'kobo-env/pgbouncer/userlist.txt': {
+            'backend': ['pgbouncer'],
+        },
+        # Applied by `kobo-install` after the back end is up
+        'kobo-env/redis/apply.bash': {
+            'backend': [],
+        },
+        'kobo-env/redis/redis_main.conf': {
+            'backend': [],
+        },
+        'kobo-env/redis/redis_cache.conf': {
+            'backend': [],
+        },
+        'kobo-docker/docker-compose.backend.override.yml': {
+            'backend': None,
+        },
+        'kobo-docker/docker-compose.frontend.override.yml': {
+            'frontend': None,
+        },
+        'kobo-docker/docker-compose.maintenance.override.yml': {
+            'maintenance': None,
+        },
+    }
+
+    # Matches `$VAR`, `${VAR}` and `{% if VAR %}`, but not escaped `$$`
+    VARIABLE_PATTERN = re.compile(
+        r'(?<!\$)\$(?:\{(\w+)\}|(\w+))|{% if (\w+) %}'
+    )
 
     @classmethod
+    @Tracer.trace('template')
     def render(cls, config, force=False):
         """
         Write configuration files based on `config`
 
+        Files whose template and used variables have not changed since last
+        render (see `Template.RENDER_MANIFEST_FILE`) are left untouched to
+        preserve their modification time.
+
         Args:
             config (helpers.config.Config)
             force (bool)
+
+        Returns:
+            list: paths (relative to `templates/`, without `.tpl` extension)
+                  of the files which have been (re)written
         """
 
         dict_ = config.get_dict()
@@ -48,6 +144,8 @@ class Template:
                 sys.exit(0)
 
         cls.__write_unique_id(environment_directory, dict_['unique_id'])
+        manifest = cls.__read_manifest(environment_directory)
+        changed_files = []
 
         # Environment
         templates_path_parent = cls._get_templates_path_parent()
@@ -60,16 +158,24 @@ class Template:
                 root,
                 templates_path
             )
-            cls.__write_templates(
-                template_variables, root, destination_directory, filenames
+            changed_files += cls.__write_templates(
+                template_variables,
+                root,
+                destination_directory,
+                filenames,
+                manifest,
             )
 
         # kobo-docker
         templates_path = os.path.join(templates_path_parent, 'kobo-docker')
         for root, dirnames, filenames in os.walk(templates_path):
             destination_directory = cls.__create_directory(dict_['kobodocker_path'])
-            cls.__write_templates(
-                template_variables, root, destination_directory, filenames
+            changed_files += cls.__write_templates(
+                template_variables,
+                root,
+                destination_directory,
+                filenames,
+                manifest,
             )
 
         # nginx-certbox
@@ -82,30 +188,80 @@ class Template:
                     config.get_letsencrypt_repo_path(),
                     root,
                     templates_path)
-                cls.__write_templates(template_variables,
-                                      root,
-                                      destination_directory,
-                                      filenames)
+                changed_files += cls.__write_templates(template_variables,
+                                                       root,
+                                                       destination_directory,
+                                                       filenames,
+                                                       manifest)
+
+        cls.__write_manifest(environment_directory, manifest)
+        if changed_files:
+            CLI.colored_print(
+                f'{len(changed_files)} configuration file(s) updated',
+                CLI.COLOR_INFO,
+            )
+        else:
+            CLI.colored_print('Configuration files are up-to-date',
+                              CLI.COLOR_INFO)
+
+        return changed_files
+
+    @classmethod
+    def get_affected_services(cls, changed_files):
+        """
+        Returns the services which must be recreated because of
+        `changed_files`, grouped by project (i.e. `frontend`, `backend` and
+        `maintenance`).
+
+        Args:
+            changed_files (list): files returned by `Template.render()`
+
+        Returns:
+            dict|None: `None` if at least one file requires a full restart
+        """
+        affected_services = {}
+        for changed_file in changed_files:
+            try:
+                services_by_project = cls.SERVICES_BY_RENDERED_FILE[
+                    changed_file
+                ]
+            except KeyError:
+                return None
+
+            for project, services in services_by_project.items():
+                project_services = affected_services.setdefault(project, [])
+                for service in services or []:
+                    if service not in project_services:
+                        project_services.append(service)
+
+        return affected_services
 
     @classmethod
+    @Tracer.trace('template')
     def render_maintenance(cls, config):
 
         dict_ = config.get_dict()
         template_variables = cls.__get_template_variables(config)
+        environment_directory = config.get_env_files_path()
+        manifest = cls.__read_manifest(environment_directory)
 
-        base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        templates_path_parent = os.path.join(base_dir, 'templates')
+        templates_path_parent = cls._get_templates_path_parent()
 
         # kobo-docker
         templates_path = os.path.join(templates_path_parent, 'kobo-docker')
+        changed_files = []
         for root, dirnames, filenames in os.walk(templates_path):
             filenames = [filename
                          for filename in filenames if 'maintenance' in filename]
             destination_directory = dict_['kobodocker_path']
-            cls.__write_templates(template_variables,
-                                  root,
-                                  destination_directory,
-                                  filenames)
+            changed_files += cls.__write_templates(template_variables,
+                                                   root,
+                                                   destination_directory,
+                                                   filenames,
+                                                   manifest)
+
+        cls.__write_manifest(environment_directory, manifest)
+        return changed_files
 
     @classmethod
     def __create_directory(cls, template_root_directory, path='', base_dir=''):
@@ -154,7 +310,13 @@ class Template:
         else:
             nginx_port = dict_['exposed_nginx_docker_port']
 
-        return {
+        pooler_settings = PostgresTuning.get_pooler_settings(
+            max_connections=dict_['postgres_max_connections'],
+            databases=2 if dict_['two_databases'] else 1,
+            pool_size=dict_['pgbouncer_default_pool_size'],
+        )
+
+        variables = {
             'PUBLIC_REQUEST_SCHEME': _get_value('https', 'https', 'http'),
             'USE_HTTPS': _get_value('https'),
             'USE_AWS': _get_value('use_aws'),
@@ -206,6 +368,7 @@ class Template:
             'SMTP_USE_TLS': dict_['smtp_use_tls'],
             'DEFAULT_FROM_EMAIL': dict_['default_from_email'],
             'PRIMARY_BACKEND_IP': dict_['primary_backend_ip'],
+            'SECONDARY_BACKEND_IP': dict_['secondary_backend_ip'],
             'LOCAL_INTERFACE_IP': dict_['local_interface_ip'],
             'KPI_PATH': dict_['kpi_path'],
             'USE_KPI_DEV_MODE': _get_value(
@@ -223,6 +386,9 @@ class Template:
                 else f":{dict_['exposed_nginx_docker_port']}"
             ),
             'NGINX_EXPOSED_PORT': nginx_port,
+            'KPI_REPLICAS': dict_['kpi_replicas'],
+            # Scheduled tasks must run only once per cluster
+            'BEAT_REPLICAS': '1' if config.primary_frontend else '0',
             'UWSGI_WORKERS_MAX': dict_['uwsgi_workers_max'],
             # Deactivate cheaper algorithm if defaults are 1 worker to start and
             # 2 maximum.
@@ -237,6 +403,7 @@ class Template:
             'UWSGI_HARAKIRI': dict_['uwsgi_harakiri'],
             'UWSGI_WORKER_RELOAD_MERCY': dict_['uwsgi_worker_reload_mercy'],
             'UWSGI_PASS_TIMEOUT': int(dict_['uwsgi_harakiri']) + 10,
+            'POSTGRES_REPLICATION_USER': Config.POSTGRES_REPLICATION_USER,
             'POSTGRES_REPLICATION_PASSWORD': dict_[
                 'postgres_replication_password'
             ],
@@ -247,10 +414,51 @@ class Template:
             'POSTGRES_RAM': dict_['postgres_ram'],
             'POSTGRES_SETTINGS': dict_['postgres_settings_content'],
             'POSTGRES_PORT': dict_['postgresql_port'],
+            'POSTGRES_MAX_CONNECTIONS': dict_['postgres_max_connections'],
+            'USE_PGBOUNCER': '' if config.use_pgbouncer else '#',
+            'PGBOUNCER_IMAGE': dict_['pgbouncer_image'],
+            'PGBOUNCER_PORT': dict_['pgbouncer_port'],
+            'PGBOUNCER_POOL_MODE': dict_['pgbouncer_pool_mode'],
+            'PGBOUNCER_MAX_CLIENT_CONN': dict_['pgbouncer_max_client_conn'],
+            'PGBOUNCER_DEFAULT_POOL_SIZE': pooler_settings['default_pool_size'],
+            'PGBOUNCER_RESERVE_POOL_SIZE': pooler_settings['reserve_pool_size'],
+            'PGBOUNCER_MAX_DB_CONNECTIONS': pooler_settings[
+                'max_db_connections'
+            ],
+            # Django apps connect to PgBouncer instead of PostgreSQL if enabled
+            'DATABASE_HOST': (
+                f"pgbouncer.{dict_['private_domain_name']}"
+                if config.use_pgbouncer
+                else f"postgres.{dict_['private_domain_name']}"
+            ),
+            'DATABASE_PORT': (
+                dict_['pgbouncer_port']
+                if config.use_pgbouncer
+                else dict_['postgresql_port']
+            ),
             'MONGO_PORT': dict_['mongo_port'],
+            'USE_MONGO_WIREDTIGER_CACHE_SIZE': _get_value(
+                'mongo_wiredtiger_cache_size',
+                true_value='#',
+                false_value='',
+                comparison_value='',
+            ),
+            'MONGO_WIREDTIGER_CACHE_SIZE': dict_['mongo_wiredtiger_cache_size'],
+            'MONGO_BLOCK_COMPRESSOR': dict_['mongo_block_compressor'],
+            'MONGO_JOURNAL_COMMIT_INTERVAL': dict_[
+                'mongo_journal_commit_interval'
+            ],
             'REDIS_MAIN_PORT': dict_['redis_main_port'],
             'REDIS_CACHE_PORT': dict_['redis_cache_port'],
             'REDIS_CACHE_MAX_MEMORY': dict_['redis_cache_max_memory'],
+            'REDIS_MAIN_SETTINGS': RedisTuning.get_settings_content(
+                'redis_main', max_memory=dict_['redis_main_max_memory']
+            ),
+            'REDIS_CACHE_SETTINGS': RedisTuning.get_settings_content(
+                'redis_cache',
+                max_memory=dict_['redis_cache_max_memory'],
+                eviction_policy=dict_['redis_cache_eviction_policy'],
+            ),
             'USE_BACKUP': '' if dict_['use_backup'] else '#',
             'USE_AWS_BACKUP': (
                 ''
@@ -293,6 +501,12 @@ class Template:
                 'aws_backup_bucket_deletion_rule_enabled', 'True', 'False'
             ),
             'LETSENCRYPT_EMAIL': dict_['letsencrypt_email'],
+            'SSL_PROXY_CLIENT_MAX_BODY_SIZE': dict_[
+                'ssl_proxy_client_max_body_size'
+            ],
+            'SSL_PROXY_KEEPALIVE': dict_['ssl_proxy_keepalive'],
+            'SSL_PROXY_HTTP2': _get_value('ssl_proxy_http2', ' http2', ''),
+            'USE_SSL_PROXY_STATIC_CACHE': _get_value('ssl_proxy_static_cache'),
             'MAINTENANCE_ETA': dict_['maintenance_eta'],
             'MAINTENANCE_DATE_ISO': dict_['maintenance_date_iso'],
             'MAINTENANCE_DATE_STR': dict_['maintenance_date_str'],
@@ -302,6 +516,7 @@ class Template:
             ),
             'DOCKER_NETWORK_BACKEND_PREFIX': config.get_prefix('backend'),
             'DOCKER_NETWORK_FRONTEND_PREFIX': config.get_prefix('frontend'),
+            'DEPLOYMENT_COLOR': dict_['deployment_color'],
             'USE_BACKEND_NETWORK': _get_value(
                 'expose_backend_ports', comparison_value=False
             ),
@@ -312,6 +527,26 @@ class Template:
                 if (config.expose_backend_ports and not config.use_private_dns)
                 else '#'
             ),
+            'ADD_REPLICA_EXTRA_HOSTS': (
+                ''
+                if (
+                    config.use_postgres_replica
+                    and config.expose_backend_ports
+                    and not config.use_private_dns
+                )
+                else '#'
+            ),
+            'ADD_PGBOUNCER_EXTRA_HOSTS': (
+                ''
+                if (
+                    config.use_pgbouncer
+                    and config.expose_backend_ports
+                    and not config.use_private_dns
+                )
+                else '#'
+            ),
+            'USE_POSTGRES_STANDBY': '' if config.secondary_backend else '#',
+            'USE_POSTGRES_REPLICA': '' if config.use_postgres_replica else '#',
             'USE_EXTRA_HOSTS': (
                 ''
                 if (
@@ -329,6 +564,8 @@ class Template:
             'REDIS_PASSWORD_JS_ENCODED': json.dumps(dict_['redis_password']),
             'USE_DEV_MODE': _get_value('dev_mode'),
             'USE_CELERY': _get_value('use_celery', comparison_value=False),
+            'CELERY_AUTOSCALE_MIN': dict_['celery_autoscale_min'],
+            'CELERY_AUTOSCALE_MAX': dict_['celery_autoscale_max'],
             'ENKETO_ALLOW_PRIVATE_IP_ADDRESS': _get_value(
                 'local_installation', true_value='true', false_value='false'
             ),
@@ -344,12 +581,81 @@ class Template:
             'DOCKER_COMPOSE_SUFFIX': ' compose'
         }
 
+        # Per-queue settings of Celery workers, e.g. `WORKER_KOBOCAT_REPLICAS`
+        for worker in Config.CELERY_WORKERS:
+            prefix = worker.upper()
+            max_memory_per_child = dict_[f'celery_{worker}_max_memory_per_child']
+            variables.update({
+                f'{prefix}_AUTOSCALE_MIN': (
+                    dict_[f'celery_{worker}_autoscale_min']
+                    or dict_['celery_autoscale_min']
+                ),
+                f'{prefix}_AUTOSCALE_MAX': (
+                    dict_[f'celery_{worker}_autoscale_max']
+                    or dict_['celery_autoscale_max']
+                ),
+                f'USE_{prefix}_PREFETCH_MULTIPLIER': _get_value(
+                    f'celery_{worker}_prefetch_multiplier',
+                    true_value='#',
+                    false_value='',
+                    comparison_value='',
+                ),
+                f'{prefix}_PREFETCH_MULTIPLIER': dict_[
+                    f'celery_{worker}_prefetch_multiplier'
+                ],
+                f'USE_{prefix}_MAX_TASKS_PER_CHILD': _get_value(
+                    f'celery_{worker}_max_tasks_per_child',
+                    true_value='#',
+                    false_value='',
+                    comparison_value='',
+                ),
+                f'{prefix}_MAX_TASKS_PER_CHILD': dict_[
+                    f'celery_{worker}_max_tasks_per_child'
+                ],
+                f'USE_{prefix}_MAX_MEMORY_PER_CHILD': _get_value(
+                    f'celery_{worker}_max_memory_per_child',
+                    true_value='#',
+                    false_value='',
+                    comparison_value='',
+                ),
+                # Celery expects kilobytes
+                f'{prefix}_MAX_MEMORY_PER_CHILD': (
+                    int(max_memory_per_child) * 1024
+                    if max_memory_per_child
+                    else ''
+                ),
+                f'{prefix}_REPLICAS': dict_[f'celery_{worker}_replicas'],
+            })
+
+        return variables
+
     @staticmethod
     def _get_templates_path_parent():
         base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
         templates_path_parent = os.path.join(base_dir, 'templates')
         return templates_path_parent
 
+    @staticmethod
+    def __hash(content):
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def __read_manifest(destination_directory):
+        """
+        Reads hashes of previously rendered files from
+        `Template.RENDER_MANIFEST_FILE`
+        :return: dict
+        """
+        manifest_file = os.path.join(destination_directory,
+                                     Template.RENDER_MANIFEST_FILE)
+        try:
+            with open(manifest_file, 'r') as f:
+                manifest = json.loads(f.read())
+        except (IOError, ValueError):
+            return {}
+
+        return manifest if isinstance(manifest, dict) else {}
+
     @staticmethod
     def __read_unique_id(destination_directory):
         """
@@ -371,17 +677,84 @@ class Template:
 
         return unique_id
 
-    @staticmethod
+    @classmethod
+    def __write_manifest(cls, destination_directory, manifest):
+        try:
+            manifest_file = os.path.join(destination_directory,
+                                         Template.RENDER_MANIFEST_FILE)
+            with open(manifest_file, 'w') as f:
+                f.write(json.dumps(manifest, indent=2, sort_keys=True))
+        except (IOError, OSError):
+            CLI.colored_print('Could not write render manifest file',
+                              CLI.COLOR_ERROR)
+            return False
+
+        return True
+
+    @classmethod
     def __write_templates(
-        template_variables_, root_, destination_directory_, filenames_
+        cls,
+        template_variables_,
+        root_,
+        destination_directory_,
+        filenames_,
+        manifest_,
     ):
-        for filename in fnmatch.filter(filenames_, '*.tpl'):
-            with open(os.path.join(root_, filename), 'r') as template:
-                t = ExtendedPyTemplate(template.read(), template_variables_)
-                with open(
-                    os.path.join(destination_directory_, filename[:-4]), 'w'
-                ) as f:
-                    f.write(t.substitute(template_variables_))
+        """
+        Renders `*.tpl` files of `root_` into `destination_directory_`.
+        A file is skipped when its template, the values of the variables it
+        uses and the existing output match what `manifest_` recorded.
+        `manifest_` is updated in place.
+
+        Returns:
+            list: manifest keys of the files which have been written
+        """
+        templates_path_parent = cls._get_templates_path_parent()
+        changed_files = []
+
+        for filename in sorted(fnmatch.filter(filenames_, '*.tpl')):
+            template_path = os.path.join(root_, filename)
+            destination_path = os.path.join(
+                destination_directory_, filename[:-4]
+            )
+            key = os.path.relpath(template_path, templates_path_parent)[:-4]
+
+            with open(template_path, 'r') as template:
+                content = template.read()
+
+            used_variables = {
+                name: str(template_variables_.get(name))
+                for match in cls.VARIABLE_PATTERN.findall(content)
+                for name in match
+                if name
+            }
+            entry = {
+                'template': cls.__hash(content),
+                'variables': cls.__hash(
+                    json.dumps(used_variables, sort_keys=True)
+                ),
+            }
+
+            previous_entry = manifest_.get(key, {})
+            if (
+                previous_entry.get('template') == entry['template']
+                and previous_entry.get('variables') == entry['variables']
+                and os.path.isfile(destination_path)
+            ):
+                with open(destination_path, 'r') as f:
+                    if cls.__hash(f.read()) == previous_entry.get('output'):
+                        continue
+
+            t = ExtendedPyTemplate(content, template_variables_)
+            output = t.substitute(template_variables_)
+            with open(destination_path, 'w') as f:
+                f.write(output)
+
+            entry['output'] = cls.__hash(output)
+            manifest_[key] = entry
+            changed_files.append(key)
+
+        return changed_files
 
     @classmethod
     def __write_unique_id(cls, destination_directory, unique_id):
@@ -436,22 +809,160 @@ class ExtendedPyTemplate(PyTemplate):
     }
     ```
 
+    Templates are compiled once into a list of literal, variable and
+    conditional nodes and rendered in a single pass. Compiled templates are
+    cached in memory. Templates that the compiler cannot reproduce exactly
+    (e.g. nested conditions) are rendered with the original regex-based
+    algorithm.
     """
     IF_PATTERN = '{{% if {} %}}'
     ENDIF_PATTERN = '{{% endif {} %}}'
+    TAG_PATTERN = re.compile(r'{% (if|endif) (\w+) %}')
+    LEADING_WHITESPACES = re.compile(r'^\s*')
+    TRAILING_WHITESPACES = re.compile(r'\s*$')
+
+    _cache = {}
 
     def __init__(self, template, template_variables_):
+        self.__conditions = template_variables_
+        self.__compiled = self.__get_compiled(template, template_variables_)
+        if self.__compiled is None:
+            template = self.__legacy_conditions(template, template_variables_)
+        super(ExtendedPyTemplate, self).__init__(template)
+
+    def safe_substitute(self, mapping=None, **kws):
+        if self.__compiled is None:
+            return super().safe_substitute(mapping, **kws)
+        template = self.__legacy_conditions(self.template, self.__conditions)
+        return PyTemplate(template).safe_substitute(mapping, **kws)
+
+    def substitute(self, mapping=None, **kws):
+        if self.__compiled is None:
+            return super().substitute(mapping, **kws)
+
+        if mapping is None:
+            mapping = kws
+        elif kws:
+            mapping = ChainMap(kws, mapping)
+
+        output = []
+        for condition, segments in self.__compiled:
+            if condition is not None and not self.__conditions[condition]:
+                continue
+            for segment in segments:
+                if isinstance(segment, str):
+                    output.append(segment)
+                else:
+                    output.append(str(mapping[segment[0]]))
+
+        return ''.join(output)
+
+    @classmethod
+    def __compile(cls, template, template_variables_):
+        """
+        Splits `template` into nodes `[condition, segments]`, where
+        `condition` is `None` for text outside `{% if %}` blocks and
+        `segments` is a list of literal strings and `[variable_name]` lists.
+
+        Returns `None` when the template does not only contain flat,
+        well-formed conditional blocks with non-blank content, because the
+        output of the regex-based algorithm depends on the order of the
+        variables in these cases.
+        """
+        nodes = []
+        position = 0
+        condition = None
+        for match in cls.TAG_PATTERN.finditer(template):
+            tag, key = match.groups()
+            if key not in template_variables_:
+                continue
+            if cls.IF_PATTERN.format(key) not in template:
+                # An orphan `endif` is kept as is by the regex-based algorithm
+                return None
+
+            text = template[position:match.start()]
+            position = match.end()
+            if tag == 'if':
+                if condition is not None:
+                    return None
+                nodes.append([None, text])
+                condition = key
+            else:
+                if condition != key or not text.strip():
+                    return None
+                text = cls.LEADING_WHITESPACES.sub('', text, count=1)
+                text = cls.TRAILING_WHITESPACES.sub('', text, count=1)
+                nodes.append([key, text])
+                condition = None
+
+        if condition is not None:
+            return None
+        nodes.append([None, template[position:]])
+
+        compiled = []
+        for condition, text in nodes:
+            if text.endswith(cls.delimiter):
+                # A placeholder could be built across two nodes
+                return None
+            segments = cls.__split_placeholders(text)
+            if segments is None:
+                return None
+            if segments:
+                compiled.append([condition, segments])
+
+        return compiled
+
+    @classmethod
+    def __get_compiled(cls, template, template_variables_):
+        checksum = hashlib.sha256(
+            '\0'.join([template] + sorted(template_variables_)).encode()
+        ).hexdigest()
+
+        try:
+            return cls._cache[checksum]
+        except KeyError:
+            pass
+
+        compiled = cls.__compile(template, template_variables_)
+        cls._cache[checksum] = compiled
+        return compiled
+
+    @classmethod
+    def __legacy_conditions(cls, template, template_variables_):
         for key, value in template_variables_.items():
-            if self.IF_PATTERN.format(key) in template:
+            if cls.IF_PATTERN.format(key) in template:
                 if value:
-                    if_pattern = r'{}\s*'.format(self.IF_PATTERN.format(key))
+                    if_pattern = r'{}\s*'.format(cls.IF_PATTERN.format(key))
                     endif_pattern = r'\s*{}'.format(
-                        self.ENDIF_PATTERN.format(key))
+                        cls.ENDIF_PATTERN.format(key))
                     template = re.sub(if_pattern, '', template)
                     template = re.sub(endif_pattern, '', template)
                 else:
                     pattern = r'{}(.|\s)*?{}'.format(
-                        self.IF_PATTERN.format(key),
-                        self.ENDIF_PATTERN.format(key))
+                        cls.IF_PATTERN.format(key),
+                        cls.ENDIF_PATTERN.format(key))
                     template = re.sub(pattern, '', template)
-        super(ExtendedPyTemplate, self).__init__(template)
+        return template
+
+    @classmethod
+    def __split_placeholders(cls, text):
+        segments = []
+        position = 0
+        for match in cls.pattern.finditer(text):
+            if match.group('invalid') is not None:
+                # Let `string.Template` raise its own error
+                return None
+            if match.start() > position:
+                segments.append(text[position:match.start()])
+            if match.group('escaped') is not None:
+                segments.append(cls.delimiter)
+            else:
+                segments.append(
+                    [match.group('named') or match.group('braced')]
+                )
+            position = match.end()
+
+        if position < len(text):
+            segments.append(text[position:])
+
+        return segments
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Records timing spans of slow operations (shell commands, git calls,
+    template rendering, network probes, upgrade steps) when `--profile` is
+    passed to `run.py`.
+
+    Spans are written in Chrome trace format (open them with
+    `chrome://tracing` or https://ui.perfetto.dev) and summarized at exit.
+
+    This module must not import other helpers because `CLI` depends on it.
+    """
+
+    PROFILE_OPTION = '--profile'
+    TRACE_FILE_PREFIX = 'kobo-install-trace'
+
+    enabled = False
+
+    __lock = threading.Lock()
+    __origin = time.perf_counter()
+    __spans = []
+
+    @classmethod
+    def enable(cls):
+        cls.enabled = True
+        cls.__origin = time.perf_counter()
+        cls.__spans = []
+
+    @classmethod
+    def get_spans(cls):
+        with cls.__lock:
+            return list(cls.__spans)
+
+    @classmethod
+    def print_summary(cls):
+        """
+        Prints total and maximum durations per span name, slowest first.
+        """
+        summary = {}
+        for span in cls.get_spans():
+            name = span['name']
+            if len(name) > 60:
+                name = f'{name[:57]}...'
+            count, total, maximum = summary.get(name, (0, 0, 0))
+            summary[name] = (
+                count + 1,
+                total + span['duration'],
+                max(maximum, span['duration']),
+            )
+
+        lines = [
+            f"{'Span':<60} {'Count':>6} {'Total (s)':>10} {'Max (s)':>8}",
+            '-' * 87,
+        ]
+        for name, (count, total, maximum) in sorted(
+            summary.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(
+                f'{name:<60} {count:>6} {total:>10.3f} {maximum:>8.3f}'
+            )
+        print('\n'.join(lines))
+
+    @classmethod
+    @contextmanager
+    def span(cls, name, category, **args):
+        """
+        Records the duration of the enclosed block.
+        The yielded dict can be used to add details to the span,
+        e.g. `span['exit_code'] = 0`.
+        """
+        args = dict(args)
+        if not cls.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+        try:
+            yield args
+        except SystemExit as e:
+            args.setdefault('exit_code', e.code)
+            raise
+        except BaseException as e:
+            args.setdefault('error', repr(e))
+            raise
+        finally:
+            end = time.perf_counter()
+            with cls.__lock:
+                cls.__spans.append({
+                    'name': name,
+                    'category': category,
+                    'start': start - cls.__origin,
+                    'duration': end - start,
+                    'thread': threading.get_ident(),
+                    'args': args,
+                })
+
+    @classmethod
+    def trace(cls, category, name=None):
+        """
+        Decorator which records each call of the decorated function.
+        """
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not cls.enabled:
+                    return func(*args, **kwargs)
+                with cls.span(span_name, category):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @classmethod
+    def write(cls, directory):
+        """
+        Writes spans in Chrome trace format into `directory`.
+
+        Returns:
+            str: path of the trace file
+        """
+        events = []
+        pid = os.getpid()
+        for span in cls.get_spans():
+            events.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': int(span['start'] * 1000000),
+                'dur': int(span['duration'] * 1000000),
+                'pid': pid,
+                'tid': span['thread'],
+                'args': span['args'],
+            })
+
+        os.makedirs(directory, exist_ok=True)
+        timestamp = time.strftime('%Y%m%d-%H%M%S')
+        trace_file = os.path.join(
+            directory, f'{cls.TRACE_FILE_PREFIX}-{timestamp}.json'
+        )
+        with open(trace_file, 'w') as f:
+            f.write(json.dumps({'traceEvents': events}, default=str))
+
+        return trace_file
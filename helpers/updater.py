@@ -3,7 +3,10 @@ import os
 import sys
 
 from helpers.cli import CLI
+from helpers.command import Command
+from helpers.config import Config
 from helpers.setup import Setup
+from helpers.tracer import Tracer
 
 
 class Updater:
@@ -14,7 +17,16 @@ class Updater:
     NO_UPDATE_SELF_OPTION = '--no-update-self'
 
     @classmethod
-    def run(cls, version=None, cron=False, update_self=True):
+    def run(cls, version=None, cron=False, update_self=True, blue_green=False):
+        """
+        Args:
+            version (str): Branch or tag of kobo-install. Current one if empty
+            cron (bool): Do not ask any questions
+            update_self (bool): Update kobo-install and restart this script
+            blue_green (bool): Deploy kobo-docker next to the running front
+                               end instead of updating it in place (see
+                               `Command.deploy_blue_green()`)
+        """
         # Validate kobo-docker already exists and is valid
         Setup.validate_already_run()
 
@@ -28,8 +40,11 @@ class Updater:
             version = CLI.run_command(git_commit_version_command).strip()
 
         if update_self:
-            # Update kobo-install first
-            Setup.update_koboinstall(version)
+            # Update kobo-install first. kobo-docker is fetched at the same
+            # time (unless it is deployed in another directory); if the new
+            # version of kobo-install pins another tag, it is fetched again
+            # after the restart.
+            Setup.update_koboinstall(version, update_kobodocker=not blue_green)
             CLI.colored_print('kobo-install has been updated',
                               CLI.COLOR_SUCCESS)
 
@@ -38,8 +53,16 @@ class Updater:
             # path as it usually would, so we have to do it manually--hence the
             # double `sys.executable`
             sys.argv.append(cls.NO_UPDATE_SELF_OPTION)
+            if Tracer.enabled:
+                sys.argv.append(Tracer.PROFILE_OPTION)
             os.execl(sys.executable, sys.executable, *sys.argv)
 
+        if blue_green:
+            config = Config()
+            config.set_config(config.get_upgraded_dict())
+            Command.deploy_blue_green()
+            return
+
         # Update kobo-docker
         Setup.update_kobodocker()
         CLI.colored_print('kobo-docker has been updated', CLI.COLOR_SUCCESS)
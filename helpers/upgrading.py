@@ -6,12 +6,14 @@ import sys
 from shutil import which
 
 from helpers.cli import CLI
+from helpers.tracer import Tracer
 from helpers.utils import run_docker_compose
 
 
 class Upgrading:
 
     @staticmethod
+    @Tracer.trace('upgrading')
     def migrate_single_to_two_databases(config: 'helpers.Config'):
         """
         Check the contents of the databases. If KPI's is empty or doesn't exist
@@ -127,6 +129,7 @@ class Upgrading:
             sys.exit(1)
 
     @staticmethod
+    @Tracer.trace('upgrading')
     def two_databases(upgraded_dict: dict, current_dict: dict) -> dict:
         """
         If the configuration came from a previous version that had a single
@@ -163,6 +166,7 @@ class Upgrading:
         return upgraded_dict
 
     @staticmethod
+    @Tracer.trace('upgrading')
     def use_booleans(upgraded_dict: dict) -> dict:
         """
         Until version 3.x, two constants (`Config.TRUE` and `Config.FALSE`) were
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import platform
 import sys
 
@@ -23,36 +24,66 @@ if (
 from helpers.cli import CLI
 from helpers.command import Command
 from helpers.config import Config
+from helpers.fleet import Fleet
 from helpers.setup import Setup
 from helpers.template import Template
+from helpers.tracer import Tracer
 from helpers.updater import Updater
 
 
-def run(force_setup=False):
+def run(force_setup=False, cluster_file=None, answers_file=None):
 
     if not platform.system() in ['Linux', 'Darwin']:
         CLI.colored_print('Not compatible with this OS', CLI.COLOR_ERROR)
     else:
         config = Config()
         dict_ = config.get_dict()
-        if config.first_time:
+        if cluster_file:
+            # Settings come from another front-end node, nothing to ask
+            dict_ = config.import_cluster(cluster_file)
+            force_setup = True
+        elif answers_file:
+            # Settings come from a file, nothing to ask
+            dict_ = config.build_from_answers(answers_file)
+            force_setup = True
+        elif config.first_time:
             force_setup = True
 
+        changed_files = None
         if force_setup:
-            dict_ = config.build()
+            if not cluster_file and not answers_file:
+                dict_ = config.build()
             Setup.clone_kobodocker(config)
-            Template.render(config)
+            changed_files = Template.render(config)
             Setup.update_hosts(dict_)
         else:
             if config.auto_detect_network():
-                Template.render(config)
+                changed_files = Template.render(config)
                 Setup.update_hosts(dict_)
 
         config.validate_passwords()
-        Command.start(force_setup=force_setup)
+        Command.start(force_setup=force_setup, changed_files=changed_files)
+
+
+def write_profile():
+    Tracer.print_summary()
+    config = Config()
+    if 'kobodocker_path' in config.get_dict():
+        directory = config.get_env_files_path()
+    else:
+        # Setup has not run yet
+        directory = os.path.dirname(os.path.realpath(__file__))
+    trace_file = Tracer.write(directory)
+    CLI.colored_print(f'Trace has been written to `{trace_file}`',
+                      CLI.COLOR_INFO)
 
 
 if __name__ == '__main__':
+    if Tracer.PROFILE_OPTION in sys.argv:
+        Tracer.enable()
+        while Tracer.PROFILE_OPTION in sys.argv:
+            sys.argv.remove(Tracer.PROFILE_OPTION)
+
     try:
 
         # avoid infinite self-updating loops
@@ -70,6 +101,26 @@ if __name__ == '__main__':
                 Command.compose_backend(sys.argv[2:])
             elif sys.argv[1] == '-u' or sys.argv[1] == '--update':
                 Updater.run(sys.argv[2], update_self=update_self)
+            elif sys.argv[1] == '-l' or sys.argv[1] == '--logs':
+                Command.logs(sys.argv[2:])
+            elif sys.argv[1] == '--export-cluster':
+                Config().export_cluster(sys.argv[2])
+            elif (
+                sys.argv[1] in ['-s', '--setup']
+                and sys.argv[2] == '--answers'
+                and len(sys.argv) == 4
+            ):
+                run(force_setup=True, answers_file=sys.argv[3])
+            elif sys.argv[1] == '--import-cluster':
+                run(cluster_file=sys.argv[2])
+            elif sys.argv[1] == '--blue-green':
+                Updater.run(
+                    sys.argv[2], update_self=update_self, blue_green=True
+                )
+            elif sys.argv[1] == '--fleet':
+                Fleet.run(*sys.argv[2:4])
+            elif sys.argv[1] == '--scale':
+                Command.scale(sys.argv[2:])
             elif sys.argv[1] == '--upgrade':
                 Updater.run(sys.argv[2], update_self=update_self)
             elif sys.argv[1] == '--auto-update':
@@ -89,7 +140,9 @@ if __name__ == '__main__':
             elif sys.argv[1] == '--auto-update':
                 Updater.run(cron=True, update_self=update_self)
             elif sys.argv[1] == '-i' or sys.argv[1] == '--info':
-                Command.info(0)
+                # Exit code is used by health checks (e.g. `--fleet`)
+                if not Command.info(0):
+                    sys.exit(1)
             elif sys.argv[1] == '-s' or sys.argv[1] == '--setup':
                 run(force_setup=True)
             elif sys.argv[1] == '-S' or sys.argv[1] == '--stop':
@@ -104,6 +157,12 @@ if __name__ == '__main__':
                 Command.configure_maintenance()
             elif sys.argv[1] == '-sm' or sys.argv[1] == '--stop-maintenance':
                 Command.stop_maintenance()
+            elif sys.argv[1] == '--rolling-restart':
+                Command.rolling_restart()
+            elif sys.argv[1] == '--blue-green':
+                Updater.run(update_self=update_self, blue_green=True)
+            elif sys.argv[1] == '--rollback':
+                Command.rollback()
             else:
                 CLI.colored_print("Bad syntax. Try 'run.py --help'",
                                   CLI.COLOR_ERROR)
@@ -112,3 +171,6 @@ if __name__ == '__main__':
 
     except KeyboardInterrupt:
         CLI.colored_print('\nUser interrupted execution', CLI.COLOR_INFO)
+    finally:
+        if Tracer.enabled:
+            write_profile()
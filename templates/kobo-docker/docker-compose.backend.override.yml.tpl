@@ -1,10 +1,13 @@
-# Override for primary back-end server
+# Override for primary and secondary back-end servers
 
 services:
 
   postgres:
+    ${USE_POSTGRES_STANDBY}entrypoint: ['/bin/bash', '/kobo-install-scripts/replication/standby.bash']
+    ${USE_POSTGRES_STANDBY}command: ['docker-entrypoint.sh', 'postgres']
     volumes:
       - ../kobo-env/postgres/conf/postgres.conf:/kobo-docker-scripts/conf/postgres.conf
+      - ../kobo-env/postgres/replication:/kobo-install-scripts/replication:ro
     ${EXPOSE_BACKEND_PORTS}ports:
     ${EXPOSE_BACKEND_PORTS}  - ${POSTGRES_PORT}:5432
     ${USE_BACKEND_NETWORK}networks:
@@ -12,7 +15,27 @@ services:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - postgres.${PRIVATE_DOMAIN_NAME}
 
+${USE_PGBOUNCER}  pgbouncer:
+${USE_PGBOUNCER}    image: ${PGBOUNCER_IMAGE}
+${USE_PGBOUNCER}    restart: unless-stopped
+${USE_PGBOUNCER}    depends_on:
+${USE_PGBOUNCER}      - postgres
+${USE_PGBOUNCER}    volumes:
+${USE_PGBOUNCER}      - ../kobo-env/pgbouncer/pgbouncer.ini:/etc/pgbouncer/pgbouncer.ini:ro
+${USE_PGBOUNCER}      - ../kobo-env/pgbouncer/userlist.txt:/etc/pgbouncer/userlist.txt:ro
+${USE_PGBOUNCER}    ${EXPOSE_BACKEND_PORTS}ports:
+${USE_PGBOUNCER}    ${EXPOSE_BACKEND_PORTS}  - ${PGBOUNCER_PORT}:6432
+${USE_PGBOUNCER}    ${USE_BACKEND_NETWORK}networks:
+${USE_PGBOUNCER}    ${USE_BACKEND_NETWORK}  kobo-be-network:
+${USE_PGBOUNCER}    ${USE_BACKEND_NETWORK}    aliases:
+${USE_PGBOUNCER}    ${USE_BACKEND_NETWORK}      - pgbouncer.${PRIVATE_DOMAIN_NAME}
+
   mongo:
+    command:
+      - mongod
+      ${USE_MONGO_WIREDTIGER_CACHE_SIZE}- --wiredTigerCacheSizeGB=${MONGO_WIREDTIGER_CACHE_SIZE}
+      - --wiredTigerCollectionBlockCompressor=${MONGO_BLOCK_COMPRESSOR}
+      - --journalCommitInterval=${MONGO_JOURNAL_COMMIT_INTERVAL}
     ${EXPOSE_BACKEND_PORTS}ports:
     ${EXPOSE_BACKEND_PORTS}  - ${MONGO_PORT}:27017
     ${USE_BACKEND_NETWORK}networks:
@@ -21,6 +44,8 @@ services:
     ${USE_BACKEND_NETWORK}      - mongo.${PRIVATE_DOMAIN_NAME}
 
   redis_main:
+    volumes:
+      - ../kobo-env/redis:/kobo-install-scripts/redis:ro
     ${EXPOSE_BACKEND_PORTS}ports:
     ${EXPOSE_BACKEND_PORTS}  - ${REDIS_MAIN_PORT}:6379
     ${USE_BACKEND_NETWORK}networks:
@@ -29,6 +54,8 @@ services:
     ${USE_BACKEND_NETWORK}      - redis-main.${PRIVATE_DOMAIN_NAME}
 
   redis_cache:
+    volumes:
+      - ../kobo-env/redis:/kobo-install-scripts/redis:ro
     ${EXPOSE_BACKEND_PORTS}ports:
     ${EXPOSE_BACKEND_PORTS}  - ${REDIS_CACHE_PORT}:6380
     ${USE_BACKEND_NETWORK}networks:
@@ -25,14 +25,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - kpi
     ${USE_BACKEND_NETWORK}      - kpi.docker.container
+    deploy:
+      replicas: ${KPI_REPLICAS}
 
   worker:
   ${USE_KPI_DEV_MODE}  build: ${KPI_PATH}
@@ -43,6 +47,11 @@ services:
   ${USE_AWS_PROFILE}    - ${AWS_HOST_AWS_DIR}:/root/.aws/:ro
     environment:
       - WSGI=${WSGI}
+      - CELERY_AUTOSCALE_MIN=${WORKER_AUTOSCALE_MIN}
+      - CELERY_AUTOSCALE_MAX=${WORKER_AUTOSCALE_MAX}
+    ${USE_WORKER_PREFETCH_MULTIPLIER}  - CELERY_WORKER_PREFETCH_MULTIPLIER=${WORKER_PREFETCH_MULTIPLIER}
+    ${USE_WORKER_MAX_TASKS_PER_CHILD}  - CELERY_WORKER_MAX_TASKS_PER_CHILD=${WORKER_MAX_TASKS_PER_CHILD}
+    ${USE_WORKER_MAX_MEMORY_PER_CHILD}  - CELERY_WORKER_MAX_MEMORY_PER_CHILD=${WORKER_MAX_MEMORY_PER_CHILD}
     ${USE_DEV_MODE}  - DJANGO_SETTINGS_MODULE=kobo.settings.dev
     ${USE_HTTPS}  - SECURE_PROXY_SSL_HEADER=HTTP_X_FORWARDED_PROTO,https
     ${USE_EXTRA_HOSTS}extra_hosts:
@@ -50,14 +59,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - worker
     ${USE_BACKEND_NETWORK}      - worker.docker.container
+    deploy:
+      replicas: ${WORKER_REPLICAS}
 
   worker_kobocat:
   ${USE_KPI_DEV_MODE}  build: ${KPI_PATH}
@@ -68,6 +81,11 @@ services:
   ${USE_AWS_PROFILE}    - ${AWS_HOST_AWS_DIR}:/root/.aws/:ro
     environment:
       - WSGI=${WSGI}
+      - CELERY_AUTOSCALE_MIN=${WORKER_KOBOCAT_AUTOSCALE_MIN}
+      - CELERY_AUTOSCALE_MAX=${WORKER_KOBOCAT_AUTOSCALE_MAX}
+    ${USE_WORKER_KOBOCAT_PREFETCH_MULTIPLIER}  - CELERY_WORKER_PREFETCH_MULTIPLIER=${WORKER_KOBOCAT_PREFETCH_MULTIPLIER}
+    ${USE_WORKER_KOBOCAT_MAX_TASKS_PER_CHILD}  - CELERY_WORKER_MAX_TASKS_PER_CHILD=${WORKER_KOBOCAT_MAX_TASKS_PER_CHILD}
+    ${USE_WORKER_KOBOCAT_MAX_MEMORY_PER_CHILD}  - CELERY_WORKER_MAX_MEMORY_PER_CHILD=${WORKER_KOBOCAT_MAX_MEMORY_PER_CHILD}
     ${USE_DEV_MODE}  - DJANGO_SETTINGS_MODULE=kobo.settings.dev
     ${USE_HTTPS}  - SECURE_PROXY_SSL_HEADER=HTTP_X_FORWARDED_PROTO,https
     ${USE_EXTRA_HOSTS}extra_hosts:
@@ -75,14 +93,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - worker_kobocat
     ${USE_BACKEND_NETWORK}      - worker_kobocat.docker.container
+    deploy:
+      replicas: ${WORKER_KOBOCAT_REPLICAS}
 
   worker_low_priority:
   ${USE_KPI_DEV_MODE}  build: ${KPI_PATH}
@@ -93,6 +115,11 @@ services:
   ${USE_AWS_PROFILE}    - ${AWS_HOST_AWS_DIR}:/root/.aws/:ro
     environment:
       - WSGI=${WSGI}
+      - CELERY_AUTOSCALE_MIN=${WORKER_LOW_PRIORITY_AUTOSCALE_MIN}
+      - CELERY_AUTOSCALE_MAX=${WORKER_LOW_PRIORITY_AUTOSCALE_MAX}
+    ${USE_WORKER_LOW_PRIORITY_PREFETCH_MULTIPLIER}  - CELERY_WORKER_PREFETCH_MULTIPLIER=${WORKER_LOW_PRIORITY_PREFETCH_MULTIPLIER}
+    ${USE_WORKER_LOW_PRIORITY_MAX_TASKS_PER_CHILD}  - CELERY_WORKER_MAX_TASKS_PER_CHILD=${WORKER_LOW_PRIORITY_MAX_TASKS_PER_CHILD}
+    ${USE_WORKER_LOW_PRIORITY_MAX_MEMORY_PER_CHILD}  - CELERY_WORKER_MAX_MEMORY_PER_CHILD=${WORKER_LOW_PRIORITY_MAX_MEMORY_PER_CHILD}
     ${USE_DEV_MODE}  - DJANGO_SETTINGS_MODULE=kobo.settings.dev
     ${USE_HTTPS}  - SECURE_PROXY_SSL_HEADER=HTTP_X_FORWARDED_PROTO,https
     ${USE_EXTRA_HOSTS}extra_hosts:
@@ -100,14 +127,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - worker_low_priority
     ${USE_BACKEND_NETWORK}      - worker_low_priority.docker.container
+    deploy:
+      replicas: ${WORKER_LOW_PRIORITY_REPLICAS}
 
   worker_long_running_tasks:
   ${USE_KPI_DEV_MODE}  build: ${KPI_PATH}
@@ -118,6 +149,11 @@ services:
   ${USE_AWS_PROFILE}    - ${AWS_HOST_AWS_DIR}:/root/.aws/:ro
     environment:
       - WSGI=${WSGI}
+      - CELERY_AUTOSCALE_MIN=${WORKER_LONG_RUNNING_TASKS_AUTOSCALE_MIN}
+      - CELERY_AUTOSCALE_MAX=${WORKER_LONG_RUNNING_TASKS_AUTOSCALE_MAX}
+    ${USE_WORKER_LONG_RUNNING_TASKS_PREFETCH_MULTIPLIER}  - CELERY_WORKER_PREFETCH_MULTIPLIER=${WORKER_LONG_RUNNING_TASKS_PREFETCH_MULTIPLIER}
+    ${USE_WORKER_LONG_RUNNING_TASKS_MAX_TASKS_PER_CHILD}  - CELERY_WORKER_MAX_TASKS_PER_CHILD=${WORKER_LONG_RUNNING_TASKS_MAX_TASKS_PER_CHILD}
+    ${USE_WORKER_LONG_RUNNING_TASKS_MAX_MEMORY_PER_CHILD}  - CELERY_WORKER_MAX_MEMORY_PER_CHILD=${WORKER_LONG_RUNNING_TASKS_MAX_MEMORY_PER_CHILD}
     ${USE_DEV_MODE}  - DJANGO_SETTINGS_MODULE=kobo.settings.dev
     ${USE_HTTPS}  - SECURE_PROXY_SSL_HEADER=HTTP_X_FORWARDED_PROTO,https
     ${USE_EXTRA_HOSTS}extra_hosts:
@@ -125,14 +161,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - worker_long_running_tasks
     ${USE_BACKEND_NETWORK}      - worker_long_running_tasks.docker.container
+    deploy:
+      replicas: ${WORKER_LONG_RUNNING_TASKS_REPLICAS}
 
   beat:
   ${USE_KPI_DEV_MODE}  build: ${KPI_PATH}
@@ -150,14 +190,18 @@ services:
     ${USE_FAKE_DNS}  - ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${USE_FAKE_DNS}  - ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}:${LOCAL_INTERFACE_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - postgres.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_PGBOUNCER_EXTRA_HOSTS}  - pgbouncer.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - mongo.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-main.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
     ${ADD_BACKEND_EXTRA_HOSTS}  - redis-cache.${PRIVATE_DOMAIN_NAME}:${PRIMARY_BACKEND_IP}
+    ${ADD_REPLICA_EXTRA_HOSTS}  - postgres-replica.${PRIVATE_DOMAIN_NAME}:${SECONDARY_BACKEND_IP}
     ${USE_BACKEND_NETWORK}networks:
     ${USE_BACKEND_NETWORK}  kobo-be-network:
     ${USE_BACKEND_NETWORK}    aliases:
     ${USE_BACKEND_NETWORK}      - beat
     ${USE_BACKEND_NETWORK}      - beat.docker.container
+    deploy:
+      replicas: ${BEAT_REPLICAS}
 
   nginx:
     environment:
@@ -180,6 +224,8 @@ services:
           - ${KOBOFORM_SUBDOMAIN}.${INTERNAL_DOMAIN_NAME}
           - ${KOBOCAT_SUBDOMAIN}.${INTERNAL_DOMAIN_NAME}
           - ${ENKETO_SUBDOMAIN}.${INTERNAL_DOMAIN_NAME}
+          # Let's Encrypt NGINX may be connected to blue and green front ends
+          - nginx-${DEPLOYMENT_COLOR}
 
   enketo_express:
     # `DUMMY_ENV` is only there to avoid extra complex condition to override
@@ -10,8 +10,8 @@ KPI_PREFIX=/
 SESSION_COOKIE_DOMAIN=".${PUBLIC_DOMAIN_NAME}"
 
 CELERY_BROKER_URL=redis://{% if REDIS_PASSWORD %}:${REDIS_PASSWORD}@{% endif REDIS_PASSWORD %}redis-main.${PRIVATE_DOMAIN_NAME}:${REDIS_MAIN_PORT}/1
-CELERY_AUTOSCALE_MIN=2
-CELERY_AUTOSCALE_MAX=6
+CELERY_AUTOSCALE_MIN=${CELERY_AUTOSCALE_MIN}
+CELERY_AUTOSCALE_MAX=${CELERY_AUTOSCALE_MAX}
 
 # See "api key" here: https://github.com/kobotoolbox/enketo-express/tree/master/config#linked-form-and-data-server.
 ENKETO_API_KEY=${ENKETO_API_KEY}
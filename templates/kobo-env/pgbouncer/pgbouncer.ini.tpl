@@ -0,0 +1,25 @@
+#------------------------------------------------------------------------------------
+# PgBouncer, connection pooler between Django (kpi, kobocat) and PostgreSQL.
+# Pool sizes are computed by kobo-install to fit within PostgreSQL `max_connections`
+# (${POSTGRES_MAX_CONNECTIONS}).
+#------------------------------------------------------------------------------------
+
+[databases]
+${KPI_POSTGRES_DB} = host=postgres port=5432 dbname=${KPI_POSTGRES_DB}
+${KC_POSTGRES_DB} = host=postgres port=5432 dbname=${KC_POSTGRES_DB}
+
+[pgbouncer]
+listen_addr = 0.0.0.0
+listen_port = 6432
+auth_type = scram-sha-256
+auth_file = /etc/pgbouncer/userlist.txt
+
+pool_mode = ${PGBOUNCER_POOL_MODE}
+max_client_conn = ${PGBOUNCER_MAX_CLIENT_CONN}
+default_pool_size = ${PGBOUNCER_DEFAULT_POOL_SIZE}
+reserve_pool_size = ${PGBOUNCER_RESERVE_POOL_SIZE}
+max_db_connections = ${PGBOUNCER_MAX_DB_CONNECTIONS}
+
+server_reset_query = DISCARD ALL
+# Sent by psycopg, not supported by PgBouncer
+ignore_startup_parameters = extra_float_digits
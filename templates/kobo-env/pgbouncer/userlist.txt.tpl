@@ -0,0 +1 @@
+"${POSTGRES_USER}" "${POSTGRES_PASSWORD}"
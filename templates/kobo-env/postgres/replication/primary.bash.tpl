@@ -0,0 +1,31 @@
+#!/bin/bash
+#------------------------------------------------------------------------------------
+# Allows secondary back-end servers to stream changes from this PostgreSQL server.
+# It is run by kobo-install inside the `postgres` container and can be run
+# several times.
+#------------------------------------------------------------------------------------
+set -e
+
+until pg_isready -q -U "$$POSTGRES_USER"; do
+    sleep 1
+done
+
+psql -v ON_ERROR_STOP=1 -U "$$POSTGRES_USER" -d postgres <<-EOSQL
+    DO $$$$
+    BEGIN
+        IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = '${POSTGRES_REPLICATION_USER}') THEN
+            CREATE ROLE ${POSTGRES_REPLICATION_USER} WITH REPLICATION LOGIN PASSWORD '${POSTGRES_REPLICATION_PASSWORD}';
+        ELSE
+            ALTER ROLE ${POSTGRES_REPLICATION_USER} WITH REPLICATION LOGIN PASSWORD '${POSTGRES_REPLICATION_PASSWORD}';
+        END IF;
+    END
+    $$$$;
+EOSQL
+
+# `md5` also accepts SCRAM-encrypted passwords
+HBA_FILE=$$(psql -U "$$POSTGRES_USER" -d postgres -tAc 'SHOW hba_file')
+HBA_RULE="host replication ${POSTGRES_REPLICATION_USER} all md5"
+if ! grep -qxF "$$HBA_RULE" "$$HBA_FILE"; then
+    echo "$$HBA_RULE" >> "$$HBA_FILE"
+    psql -U "$$POSTGRES_USER" -d postgres -tAc 'SELECT pg_reload_conf()'
+fi
@@ -0,0 +1,30 @@
+#!/bin/bash
+#------------------------------------------------------------------------------------
+# Entrypoint of the `postgres` container on secondary back-end servers.
+# The first time, data are cloned from the primary server and PostgreSQL starts as
+# a hot standby (read-only queries) which streams changes from the primary.
+#------------------------------------------------------------------------------------
+set -e
+
+PGDATA="$${PGDATA:-/var/lib/postgresql/data}"
+
+if [ ! -s "$$PGDATA/PG_VERSION" ]; then
+    echo "Cloning PostgreSQL from primary back-end server ${PRIMARY_BACKEND_IP}:${POSTGRES_PORT}..."
+    mkdir -p "$$PGDATA"
+    chown postgres:postgres "$$PGDATA"
+    chmod 700 "$$PGDATA"
+    until PGPASSWORD='${POSTGRES_REPLICATION_PASSWORD}' gosu postgres pg_basebackup \
+        --host=${PRIMARY_BACKEND_IP} \
+        --port=${POSTGRES_PORT} \
+        --username=${POSTGRES_REPLICATION_USER} \
+        --pgdata="$$PGDATA" \
+        --wal-method=stream \
+        --write-recovery-conf \
+        --checkpoint=fast; do
+        echo 'Primary back-end server is not ready yet. Retrying in 5 seconds...'
+        rm -rf "$${PGDATA:?}"/*
+        sleep 5
+    done
+fi
+
+exec "$$@"
@@ -0,0 +1,31 @@
+#!/bin/bash
+#------------------------------------------------------------------------------------
+# Applies settings of `/kobo-install-scripts/redis/<instance>.conf` to the running
+# Redis server. It is run by kobo-install inside the `redis_main` and `redis_cache`
+# containers and can be run several times.
+#
+# Usage: apply.bash <instance> <port>
+#------------------------------------------------------------------------------------
+set -e
+
+CONF_FILE="/kobo-install-scripts/redis/$$1.conf"
+PORT="$$2"
+{% if REDIS_PASSWORD %}export REDISCLI_AUTH='${REDIS_PASSWORD}'{% endif REDIS_PASSWORD %}
+
+until redis-cli -p "$$PORT" ping > /dev/null 2>&1; do
+    sleep 1
+done
+
+while read -r NAME VALUE; do
+    if [[ -z "$$NAME" || "$$NAME" == \#* ]]; then
+        continue
+    fi
+    if [[ "$$VALUE" == '""' ]]; then
+        VALUE=''
+    fi
+    redis-cli -p "$$PORT" CONFIG SET "$$NAME" "$$VALUE" > /dev/null
+done < "$$CONF_FILE"
+
+# Keep settings if Redis restarts on its own. It fails if the configuration
+# file is not writable, settings are applied again at next start.
+redis-cli -p "$$PORT" CONFIG REWRITE > /dev/null 2>&1 || true
@@ -0,0 +1,7 @@
+#------------------------------------------------------------------------------------
+# TUNING
+#------------------------------------------------------------------------------------
+# Django cache and sessions: keys are evicted when memory is full, no persistence.
+# Applied by kobo-install with `CONFIG SET` once the container is up.
+
+${REDIS_CACHE_SETTINGS}
@@ -0,0 +1,7 @@
+#------------------------------------------------------------------------------------
+# TUNING
+#------------------------------------------------------------------------------------
+# Celery queues and Enketo data: no eviction, AOF persistence.
+# Applied by kobo-install with `CONFIG SET` once the container is up.
+
+${REDIS_MAIN_SETTINGS}
@@ -1,3 +1,12 @@
+upstream kobo_nginx {
+    # Front end which serves traffic (see `run.py --blue-green`)
+    server nginx-${DEPLOYMENT_COLOR}:80;
+    # Reuse connections to kobo-docker NGINX instead of opening one per request
+    keepalive ${SSL_PROXY_KEEPALIVE};
+}
+
+${USE_SSL_PROXY_STATIC_CACHE}proxy_cache_path /var/cache/nginx/kobo_static levels=1:2 keys_zone=kobo_static:10m max_size=1g inactive=7d use_temp_path=off;
+
 server {
     listen 80;
     server_name ${KOBOFORM_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME} ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME} ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME};
@@ -13,23 +22,51 @@ server {
 }
 
 server {
-    listen 443 ssl;
+    # `http2` parameter (instead of `http2 on;`) works with NGINX < 1.25.1
+    listen 443 ssl${SSL_PROXY_HTTP2};
     server_name ${KOBOFORM_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME} ${KOBOCAT_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME} ${ENKETO_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME};
     server_tokens off;
 
     ssl_certificate /etc/letsencrypt/live/${KOBOFORM_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}/fullchain.pem;
     ssl_certificate_key /etc/letsencrypt/live/${KOBOFORM_SUBDOMAIN}.${PUBLIC_DOMAIN_NAME}/privkey.pem;
+    # Also enables TLS session reuse (`ssl_session_cache`, `ssl_session_timeout`)
     include /etc/letsencrypt/options-ssl-nginx.conf;
     ssl_dhparam /etc/letsencrypt/ssl-dhparams.pem;
 
-    # Allow 100M upload
-    client_max_body_size 100M;
+    # Allow ${SSL_PROXY_CLIENT_MAX_BODY_SIZE}M upload
+    client_max_body_size ${SSL_PROXY_CLIENT_MAX_BODY_SIZE}M;
+
+    gzip on;
+    gzip_vary on;
+    gzip_proxied any;
+    gzip_comp_level 5;
+    gzip_min_length 1024;
+    gzip_types text/plain text/css text/xml application/xml application/json application/javascript image/svg+xml;
+
+    proxy_http_version 1.1;
+    proxy_set_header    Connection          "";
+    proxy_set_header    Host                $$http_host;
+    proxy_set_header    X-Real-IP           $$remote_addr;
+    proxy_set_header    X-Forwarded-For     $$proxy_add_x_forwarded_for;
+    proxy_set_header    X-Forwarded-Proto   https;
+
+    # Responses are buffered in memory, uploads are streamed to kobo-docker
+    # NGINX which already buffers them
+    proxy_buffer_size 16k;
+    proxy_buffers 32 16k;
+    proxy_busy_buffers_size 64k;
+    proxy_request_buffering off;
+
+    ${USE_SSL_PROXY_STATIC_CACHE}location /static/ {
+    ${USE_SSL_PROXY_STATIC_CACHE}    proxy_pass  http://kobo_nginx;
+    ${USE_SSL_PROXY_STATIC_CACHE}    proxy_cache kobo_static;
+    ${USE_SSL_PROXY_STATIC_CACHE}    proxy_cache_key $$host$$request_uri;
+    ${USE_SSL_PROXY_STATIC_CACHE}    proxy_cache_valid 200 301 302 7d;
+    ${USE_SSL_PROXY_STATIC_CACHE}    proxy_cache_use_stale error timeout updating;
+    ${USE_SSL_PROXY_STATIC_CACHE}    add_header X-Cache-Status $$upstream_cache_status;
+    ${USE_SSL_PROXY_STATIC_CACHE}}
 
     location / {
-        proxy_pass  http://nginx;
-        proxy_set_header    Host                $$http_host;
-        proxy_set_header    X-Real-IP           $$remote_addr;
-        proxy_set_header    X-Forwarded-For     $$proxy_add_x_forwarded_for;
-        proxy_set_header    X-Forwarded-Proto   https;
+        proxy_pass  http://kobo_nginx;
     }
 }
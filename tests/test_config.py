@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import os
 import pytest
 import random
@@ -851,6 +852,31 @@ def test_update_postgres_db_name_from_single_database():
     assert dict_['kc_postgres_db'] == old_db_name
 
 
+def test_upgraded_dict_computes_missing_dynamic_values_only():
+    config = read_config()
+    with patch('helpers.config.os.urandom') as mock_urandom, \
+            patch('helpers.config.Config.generate_password') as mock_password, \
+            patch('helpers.network.Network.get_primary_interface') as mock_iface, \
+            patch('helpers.network.Network.get_primary_ip') as mock_ip:
+        dict_ = config.get_upgraded_dict()
+        assert dict_['redis_password'] == config.get_dict()['redis_password']
+        assert not mock_ip.called
+        assert not mock_iface.called
+        assert not mock_password.called
+        assert not mock_urandom.called
+
+        del config._Config__dict['redis_password']
+        del config._Config__dict['primary_backend_ip']
+        mock_password.return_value = 'new_password'
+        mock_ip.return_value = '192.168.1.10'
+        dict_ = config.get_upgraded_dict()
+        assert dict_['redis_password'] == 'new_password'
+        assert dict_['primary_backend_ip'] == '192.168.1.10'
+        assert mock_password.call_count == 1
+        assert mock_ip.call_count == 1
+        assert not mock_urandom.called
+
+
 def test_use_boolean():
     """
     Ensure config uses booleans instead of '1' or '2'
@@ -1002,3 +1028,198 @@ def test_activate_only_postgres_backup():
         assert config._Config__dict['postgres_backup_schedule'] == '2 2 2 2 2'
         assert config._Config__dict['mongo_backup_schedule'] == ''
         assert config._Config__dict['redis_backup_schedule'] == ''
+
+
+def test_service_catalog_cache():
+    config = read_config()
+    tmp_dir = tempfile.mkdtemp()
+    kobodocker_path = os.path.join(tmp_dir, 'kobo-docker')
+    os.makedirs(kobodocker_path)
+    os.makedirs(os.path.join(tmp_dir, Config.ENV_FILES_DIR))
+    config._Config__dict['kobodocker_path'] = kobodocker_path
+    override_file = os.path.join(
+        kobodocker_path, 'docker-compose.frontend.override.yml'
+    )
+    for compose_file in [
+        'docker-compose.frontend.yml',
+        'docker-compose.frontend.override.yml',
+    ]:
+        with open(os.path.join(kobodocker_path, compose_file), 'w') as f:
+            f.write('services:\n')
+
+    compose_config = (
+        '{"services": {"kpi": {"image": "kobotoolbox/kpi", '
+        '"depends_on": {"worker": {"condition": "service_started"}}}, '
+        '"worker": {"image": "kobotoolbox/kpi"}}}'
+    )
+    try:
+        with patch.object(
+            CLI, 'run_command', return_value=compose_config
+        ) as mock_run_command:
+            assert config.get_service_names() == ['kpi', 'worker']
+            assert config.get_service_catalog()['kpi']['depends_on'] == [
+                'worker'
+            ]
+            assert mock_run_command.call_count == 1
+
+            # Touching files without changing them keeps the cache
+            os.utime(override_file, (0, 0))
+            config.get_service_names()
+            assert mock_run_command.call_count == 1
+
+            with open(override_file, 'a') as f:
+                f.write('  kpi:\n')
+            config.get_service_names()
+            assert mock_run_command.call_count == 2
+
+            config.clear_service_catalog()
+            config.get_service_names()
+            assert mock_run_command.call_count == 3
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@patch('helpers.config.Config.write_config', new=MagicMock())
+def test_export_and_import_cluster():
+    config = read_config({
+        'multi': True,
+        'server_role': 'frontend',
+        'frontend_nodes': '10.0.0.1, 10.0.0.2',
+        'primary_frontend': True,
+        'local_interface_ip': '10.0.0.1',
+        'kobodocker_path': '/opt/node1/kobo-docker',
+    })
+    assert config.frontend_cluster
+    assert config.frontend_nodes == ['10.0.0.1', '10.0.0.2']
+    assert config.primary_frontend
+    exported_dict = dict(config.get_dict())
+
+    tmp_dir = tempfile.mkdtemp()
+    cluster_file = os.path.join(tmp_dir, 'cluster.json')
+    try:
+        config.export_cluster(cluster_file)
+        # Secrets must not be readable by other users
+        assert os.stat(cluster_file).st_mode & 0o777 == 0o600
+
+        # Simulate a brand-new node
+        config._Config__dict = {'unique_id': 123}
+        with patch(
+            'helpers.network.Network.get_primary_ip',
+            MagicMock(return_value='10.0.0.2'),
+        ):
+            dict_ = config.import_cluster(cluster_file)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    for key in [
+        'django_secret_key',
+        'postgres_password',
+        'redis_password',
+        'public_domain_name',
+        'primary_backend_ip',
+    ]:
+        assert dict_[key] == exported_dict[key]
+
+    assert dict_['unique_id'] == 123
+    assert dict_['local_interface_ip'] == '10.0.0.2'
+    assert dict_['kobodocker_path'] != '/opt/node1/kobo-docker'
+    assert config.frontend_cluster
+    assert not config.primary_frontend
+
+
+def test_validate_answers():
+    config = read_config()
+    answers = {
+        'advanced': True,
+        'postgresql_port': 5433,
+        'server_role': 'frontend',
+        'redis_password': '',
+        'django_session_cookie_age': 3600,
+    }
+    assert config.validate_answers(answers) == []
+    # Numbers are converted like values typed by users
+    assert answers['postgresql_port'] == '5433'
+
+    errors = config.validate_answers({
+        'advanced': 'yes',
+        'postgresql_port': 'abc',
+        'server_role': 'worker',
+        'postgres_password': 'short',
+        'celery_worker_replicas': '0',
+        'date_created': 123,
+    })
+    assert len(errors) == 6
+    assert '`date_created`: unknown option' in errors
+
+
+def test_declined_tweaks_keep_replicas():
+    config = read_config({
+        'kpi_replicas': '3',
+        'celery_worker_replicas': '2',
+        'celery_worker_prefetch_multiplier': '8',
+        'uwsgi_harakiri': '300',
+    })
+    with patch('helpers.cli.CLI.yes_no_question', return_value=False):
+        config._Config__questions_uwsgi()
+        config._Config__questions_celery()
+
+    dict_ = config.get_dict()
+    assert dict_['kpi_replicas'] == '3'
+    assert dict_['celery_worker_replicas'] == '2'
+    # Other settings covered by the questions are reset
+    assert dict_['celery_worker_prefetch_multiplier'] == ''
+    assert dict_['uwsgi_harakiri'] == '120'
+
+
+def test_is_valid_response_with_regex():
+    assert CLI.is_valid_response(r'~^\d+$', '42')
+    # Characters of the pattern itself are not valid values
+    for response in ['+', 'd', '^', '$', '\\', '~']:
+        assert not CLI.is_valid_response(r'~^\d+$', response)
+    assert CLI.is_valid_response(['1', '2'], '2')
+    assert not CLI.is_valid_response(['1', '2'], '3')
+
+    config = read_config()
+    errors = config.validate_answers({'postgres_ram': '+'})
+    assert len(errors) == 1
+
+
+@patch('helpers.config.Config.write_config', new=MagicMock())
+@patch('helpers.config.Config.write_unique_id', new=MagicMock())
+def test_build_from_answers():
+    config = read_config()
+    tmp_dir = tempfile.mkdtemp()
+    answers_file = os.path.join(tmp_dir, 'answers.json')
+    kobodocker_path = os.path.join(tmp_dir, 'kobo-docker')
+    try:
+        with open(answers_file, 'w') as f:
+            f.write(json.dumps({
+                'advanced': True,
+                'kobodocker_path': kobodocker_path,
+                'public_domain_name': 'example.org',
+                'use_letsencrypt': False,
+                'postgres_settings': True,
+                'postgres_ram': '8',
+                'postgres_max_connections': 200,
+                'uwsgi_workers_max': '6',
+            }))
+        with patch.object(
+            CLI, 'colored_input', side_effect=AssertionError('prompted')
+        ), patch.object(CLI, 'non_interactive', False):
+            dict_ = config.build_from_answers(answers_file)
+            assert CLI.non_interactive
+
+        assert os.path.isdir(kobodocker_path)
+        assert dict_['public_domain_name'] == 'example.org'
+        assert dict_['postgres_max_connections'] == '200'
+        # Answers win over values sized for the host
+        assert dict_['uwsgi_workers_max'] == '6'
+        assert 'max_connections = 200' in dict_['postgres_settings_content']
+
+        # Invalid values stop the setup before anything is changed
+        with open(answers_file, 'w') as f:
+            f.write(json.dumps({'postgresql_port': 'not a port'}))
+        with pytest.raises(SystemExit):
+            config.build_from_answers(answers_file)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+from helpers.fleet import Fleet
+from .utils import MockTransport
+
+UPDATE = 'python3 run.py --auto-update'
+START = 'python3 run.py'
+INFO = 'python3 run.py --info'
+CHECK_CONFIG = 'test -f .run.conf'
+
+
+def _get_hosts(count, canaries=0):
+    return [
+        {
+            'name': f'kobo-{index}',
+            'address': f'host{index}',
+            'path': '/opt/kobo-install',
+            'canary': index < canaries,
+        }
+        for index in range(count)
+    ]
+
+
+def test_deploy_all_hosts():
+    transport = MockTransport()
+    fleet = Fleet(_get_hosts(3), transport=transport, max_workers=2)
+    results = fleet.deploy()
+
+    assert [r['status'] for r in results] == [Fleet.STATUS_SUCCESS] * 3
+    for index in range(3):
+        steps = [
+            step for address, step in transport.calls
+            if address == f'host{index}'
+        ]
+        assert steps == [CHECK_CONFIG, UPDATE, START, INFO]
+    assert 'https://kf.host1' in results[1]['output']
+
+
+def test_canaries_are_deployed_first():
+    transport = MockTransport()
+    fleet = Fleet(_get_hosts(4, canaries=1), transport=transport)
+    fleet.deploy()
+
+    # Canary is entirely deployed before any other host is touched
+    addresses = [address for address, _ in transport.calls]
+    assert addresses[:4] == ['host0'] * 4
+    assert 'host0' not in addresses[4:]
+
+
+def test_rollout_stops_on_failure():
+    # A failed canary stops everything
+    transport = MockTransport(failures={'host0': START})
+    fleet = Fleet(_get_hosts(4, canaries=1), transport=transport)
+    results = fleet.deploy()
+
+    assert results[0]['status'] == Fleet.STATUS_FAILED
+    assert results[0]['step'] == 'start'
+    assert [r['status'] for r in results[1:]] == [Fleet.STATUS_SKIPPED] * 3
+    assert ('host0', INFO) not in transport.calls
+    assert {address for address, _ in transport.calls} == {'host0'}
+
+    # With one worker, hosts after the failed one are skipped
+    transport = MockTransport(failures={'host1': INFO})
+    fleet = Fleet(_get_hosts(4), transport=transport, max_workers=1)
+    results = fleet.deploy()
+    assert [r['status'] for r in results] == [
+        Fleet.STATUS_SUCCESS,
+        Fleet.STATUS_FAILED,
+        Fleet.STATUS_SKIPPED,
+        Fleet.STATUS_SKIPPED,
+    ]
+
+
+def test_missing_run_conf_fails_fast():
+    transport = MockTransport(failures={'host0': CHECK_CONFIG})
+    fleet = Fleet(_get_hosts(2), transport=transport, max_workers=1)
+    results = fleet.deploy()
+
+    assert results[0]['status'] == Fleet.STATUS_FAILED
+    assert results[0]['step'] == 'config'
+    assert results[1]['status'] == Fleet.STATUS_SKIPPED
+    assert transport.calls == [('host0', CHECK_CONFIG)]
+
+
+def test_inventory(tmpdir):
+    tmpdir.join('kobo-1.run.conf').write('{}')
+    inventory = tmpdir.join('inventory.json')
+    inventory.write(json.dumps({
+        'max_workers': 1,
+        'hosts': [
+            {'address': 'admin@host1', 'run_conf': 'kobo-1.run.conf'},
+        ],
+    }))
+
+    transport = MockTransport()
+    fleet = Fleet.from_inventory(
+        str(inventory), transport=transport, version='2.024.36'
+    )
+    results = fleet.deploy()
+    assert results[0]['name'] == 'admin@host1'
+    assert transport.calls == [
+        ('admin@host1', 'copy ~/kobo-install/.run.conf'),
+        ('admin@host1', f'{UPDATE} 2.024.36'),
+        ('admin@host1', START),
+        ('admin@host1', INFO),
+    ]
+
+    inventory.write(json.dumps({'hosts': [{'name': 'no address'}]}))
+    with pytest.raises(SystemExit):
+        Fleet.from_inventory(str(inventory))
+
+    with pytest.raises(SystemExit):
+        Fleet.from_inventory(os.path.join(str(tmpdir), 'missing.json'))
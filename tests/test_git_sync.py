@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from helpers.git_sync import GitSync
+
+
+def _git(cwd, *args):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=kobo', '-c', 'user.email=kobo@kobo.local']
+        + list(args),
+        cwd=cwd,
+        universal_newlines=True,
+    ).strip()
+
+
+def _commit_and_tag(origin, tag):
+    with open(os.path.join(origin, 'version'), 'w') as f:
+        f.write(tag)
+    _git(origin, 'add', 'version')
+    _git(origin, 'commit', '-q', '-m', tag)
+    _git(origin, 'tag', tag)
+
+
+@pytest.fixture
+def repositories(tmp_path):
+    origin = str(tmp_path / 'origin')
+    os.makedirs(origin)
+    _git(origin, 'init', '-q', '-b', 'main')
+    _commit_and_tag(origin, '1.0')
+    _commit_and_tag(origin, '2.0')
+
+    working_copy = str(tmp_path / 'working_copy')
+    _git(
+        str(tmp_path), 'clone', '-q', '--depth', '1', '--branch', '1.0',
+        f'file://{origin}', working_copy,
+    )
+    return origin, working_copy
+
+
+def test_sync_fetches_pinned_tag_only(repositories):
+    origin, working_copy = repositories
+    GitSync.sync(working_copy, '2.0')
+
+    assert _git(working_copy, 'describe', '--tags') == '2.0'
+    # Shallow: history before `2.0` has not been downloaded
+    assert _git(working_copy, 'rev-parse', '--is-shallow-repository') == 'true'
+    assert _git(working_copy, 'rev-list', '--count', 'HEAD') == '1'
+
+
+def test_sync_skips_fetch_when_tag_is_known(repositories):
+    origin, working_copy = repositories
+    GitSync.sync(working_copy, '2.0')
+
+    # Any network access would fail without the remote repository
+    shutil.rmtree(origin)
+    with open(os.path.join(working_copy, 'version'), 'w') as f:
+        f.write('modified')
+    GitSync.sync(working_copy, '2.0')
+
+    assert _git(working_copy, 'describe', '--tags') == '2.0'
+    with open(os.path.join(working_copy, 'version')) as f:
+        assert f.read() == '2.0'
+
+
+def test_sync_all_updates_branches_and_tags(repositories, tmp_path):
+    origin, working_copy = repositories
+    other_working_copy = str(tmp_path / 'other_working_copy')
+    _git(
+        str(tmp_path), 'clone', '-q', '--depth', '1', '--branch', '1.0',
+        f'file://{origin}', other_working_copy,
+    )
+    _commit_and_tag(origin, '3.0')
+
+    GitSync.sync_all([(working_copy, '2.0'), (other_working_copy, 'main')])
+
+    assert _git(working_copy, 'describe', '--tags') == '2.0'
+    assert _git(other_working_copy, 'rev-parse', '--abbrev-ref', 'HEAD') == 'main'
+    assert _git(other_working_copy, 'rev-parse', 'HEAD') == _git(
+        origin, 'rev-parse', 'main'
+    )
+
+    with pytest.raises(SystemExit):
+        GitSync.sync(working_copy, 'unknown')
+
+
+def test_sync_keeps_full_clones_and_local_commits(repositories, tmp_path):
+    origin, _ = repositories
+    working_copy = str(tmp_path / 'full_working_copy')
+    _git(str(tmp_path), 'clone', '-q', f'file://{origin}', working_copy)
+
+    _commit_and_tag(origin, '3.0')
+    GitSync.sync(working_copy, 'main')
+    assert _git(working_copy, 'rev-parse', '--is-shallow-repository') == 'false'
+    assert _git(working_copy, 'rev-list', '--count', 'HEAD') == '3'
+
+    # Tag which is not on a fetched branch
+    _git(origin, 'checkout', '-q', '-b', 'hotfix')
+    _commit_and_tag(origin, '3.0.1')
+    _git(origin, 'checkout', '-q', 'main')
+    GitSync.sync(working_copy, '3.0.1')
+    assert _git(working_copy, 'describe', '--tags') == '3.0.1'
+    assert _git(working_copy, 'rev-parse', '--is-shallow-repository') == 'false'
+
+    # Local commit on a branch which has diverged from the remote one
+    _git(working_copy, 'checkout', '-q', 'main')
+    _git(working_copy, 'commit', '-q', '--allow-empty', '-m', 'local')
+    local_commit = _git(working_copy, 'rev-parse', 'HEAD')
+    _commit_and_tag(origin, '4.0')
+    with pytest.raises(SystemExit):
+        GitSync.sync(working_copy, 'main')
+    assert _git(working_copy, 'rev-parse', 'main') == local_commit
+
+
+def test_sync_detached_head(repositories):
+    origin, working_copy = repositories
+    _git(working_copy, 'checkout', '-q', '--detach', 'HEAD')
+    GitSync.sync(working_copy, 'HEAD')
+    assert _git(working_copy, 'describe', '--tags') == '1.0'
+
+    # Not on a tag
+    _git(working_copy, 'commit', '-q', '--allow-empty', '-m', 'local')
+    head = _git(working_copy, 'rev-parse', 'HEAD')
+    GitSync.sync(working_copy, 'HEAD')
+    assert _git(working_copy, 'rev-parse', 'HEAD') == head
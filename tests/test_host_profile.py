@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import os
+from unittest.mock import patch
+
+from helpers.host_profile import HostProfile
+from .utils import mock_read_config as read_config
+
+
+def _write(root, path, content):
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_detect_host_without_limits(tmpdir):
+    root = str(tmpdir)
+    _write(root, 'proc/meminfo', 'MemTotal:       16777216 kB\nMemFree: 1 kB\n')
+    _write(root, 'sys/fs/cgroup/memory.max', 'max\n')
+    _write(root, 'sys/fs/cgroup/cpu.max', 'max 100000\n')
+    _write(root, 'sys/block/nvme0n1/queue/rotational', '0\n')
+    _write(root, 'sys/block/loop0/queue/rotational', '1\n')
+
+    with patch('os.sched_getaffinity', return_value=set(range(8))):
+        host_profile = HostProfile.detect(root)
+
+    assert host_profile.memory == 16384
+    assert host_profile.cpus == 8
+    assert host_profile.drive_type == 'ssd'
+
+
+def test_detect_cgroup_limits(tmpdir):
+    # cgroup v2
+    root = str(tmpdir.mkdir('v2'))
+    _write(root, 'proc/meminfo', 'MemTotal:       16777216 kB\n')
+    _write(root, 'sys/fs/cgroup/memory.max', str(4 * 1024 ** 3))
+    _write(root, 'sys/fs/cgroup/cpu.max', '150000 100000\n')
+    _write(root, 'sys/block/sda/queue/rotational', '1\n')
+    _write(root, 'sys/block/sdb/queue/rotational', '0\n')
+
+    with patch('os.sched_getaffinity', return_value=set(range(8))):
+        host_profile = HostProfile.detect(root)
+
+    assert host_profile.memory == 4096
+    assert host_profile.cpus == 2
+    assert host_profile.drive_type == 'hdd'
+
+    # cgroup v1, unlimited memory is a huge number
+    root = str(tmpdir.mkdir('v1'))
+    _write(root, 'proc/meminfo', 'MemTotal:       8388608 kB\n')
+    _write(
+        root,
+        'sys/fs/cgroup/memory/memory.limit_in_bytes',
+        '9223372036854771712',
+    )
+    _write(root, 'sys/fs/cgroup/cpu/cpu.cfs_quota_us', '-1')
+    _write(root, 'sys/fs/cgroup/cpu/cpu.cfs_period_us', '100000')
+
+    with patch('os.sched_getaffinity', return_value=set(range(4))):
+        host_profile = HostProfile.detect(root)
+
+    assert host_profile.memory == 8192
+    assert host_profile.cpus == 4
+    # No block devices found
+    assert host_profile.drive_type == 'hdd'
+
+
+def test_memory_budget_fits_host():
+    for memory in [1024, 2048, 8192, 65536]:
+        host_profile = HostProfile(memory=memory, cpus=4, drive_type='ssd')
+        for frontend, backend in [(True, True), (True, False), (False, True)]:
+            budget = host_profile.get_memory_budget(
+                frontend=frontend, backend=backend
+            )
+            assert sum(budget.values()) <= memory - 512
+            assert ('uwsgi' in budget) == frontend
+            assert ('postgres' in budget) == backend
+
+
+def test_proposals():
+    host_profile = HostProfile(memory=16384, cpus=4, drive_type='ssd')
+    proposals = host_profile.get_proposals(frontend=True, backend=True)
+    assert proposals == {
+        'postgres_cpus': '4',
+        'postgres_ram': '7',
+        'postgres_hard_drive_type': 'ssd',
+        'redis_cache_max_memory': '737',
+        'mongo_wiredtiger_cache_size': '1.25',
+        'uwsgi_workers_start': '4',
+        'uwsgi_workers_max': '8',
+        'celery_autoscale_min': '2',
+        'celery_autoscale_max': '6',
+    }
+
+    # Back-end server gives PostgreSQL its own share of memory only
+    proposals = host_profile.get_proposals(frontend=False, backend=True)
+    assert proposals['postgres_ram'] == '7'
+    assert proposals['mongo_wiredtiger_cache_size'] == '3.5'
+    assert 'uwsgi_workers_max' not in proposals
+    # Redis main (Celery queues, Enketo data) is never capped
+    assert 'redis_main_max_memory' not in proposals
+
+    # Small hosts still get the minimum number of workers
+    host_profile = HostProfile(memory=1024, cpus=1, drive_type='hdd')
+    proposals = host_profile.get_proposals(frontend=True, backend=False)
+    assert proposals['uwsgi_workers_max'] == '2'
+    assert proposals['celery_autoscale_min'] == '2'
+    assert proposals['celery_autoscale_max'] == '6'
+    assert 'postgres_ram' not in proposals
+
+    # Large hosts get more Celery workers than the defaults
+    host_profile = HostProfile(memory=65536, cpus=8, drive_type='ssd')
+    proposals = host_profile.get_proposals(frontend=True, backend=False)
+    assert proposals['celery_autoscale_min'] == '5'
+    assert proposals['celery_autoscale_max'] == '16'
+
+
+def test_proposals_fit_host():
+    for memory in [4096, 8192, 16384, 65536]:
+        for cpus in [1, 4, 16]:
+            host_profile = HostProfile(
+                memory=memory, cpus=cpus, drive_type='ssd'
+            )
+            proposals = host_profile.get_proposals(frontend=True, backend=True)
+            used_memory = (
+                # `Mixed` profile halves the memory given to PostgreSQL
+                int(proposals['postgres_ram']) * 1024 // 2
+                + int(float(proposals['mongo_wiredtiger_cache_size']) * 1024)
+                + int(proposals['redis_cache_max_memory'])
+                + int(proposals['uwsgi_workers_max'])
+                * HostProfile.UWSGI_WORKER_MEMORY
+                # Processes above `celery_autoscale_min` are only forked
+                # under load
+                + int(proposals['celery_autoscale_min'])
+                * HostProfile.CELERY_WORKER_MEMORY
+                * HostProfile.CELERY_WORKER_SERVICES
+            )
+            assert used_memory <= memory, (memory, cpus)
+
+
+def test_apply_host_profile():
+    config = read_config()
+    host_profile = HostProfile(memory=8192, cpus=2, drive_type='ssd')
+    proposals = config.apply_host_profile(host_profile)
+    dict_ = config.get_dict()
+    for key, value in proposals.items():
+        assert dict_[key] == value
+    assert dict_['postgres_hard_drive_type'] == 'ssd'
+    assert dict_['uwsgi_workers_max'] == '4'
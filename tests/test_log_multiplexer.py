@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from helpers.cli import CLI
+from helpers.log_multiplexer import LogMultiplexer
+
+
+def _printf(output):
+    return ['sh', '-c', f"printf '{output}'"]
+
+
+def test_logs_are_prefixed_and_filtered():
+    lines = []
+    multiplexer = LogMultiplexer(
+        services=['kpi', 'postgres'], pattern='error', output=lines.append
+    )
+    multiplexer.add_source('frontend', _printf(
+        'kpi-1    | an error\\n'
+        'kpi-2    | all good\\n'
+        'nginx-1  | another error\\n'
+        'kpi-1    | last error without new line'
+    ))
+    multiplexer.add_source('backend', _printf('postgres-1  | error\\n'))
+    multiplexer.run()
+
+    frontend = CLI.colorize('[frontend]', LogMultiplexer.PROJECT_COLORS[0])
+    backend = CLI.colorize('[backend]', LogMultiplexer.PROJECT_COLORS[1])
+    assert sorted(lines) == sorted([
+        f'{frontend} kpi-1 | an error',
+        f'{frontend} kpi-1 | last error without new line',
+        f'{backend} postgres-1 | error',
+    ])
+
+
+def test_long_lines_are_truncated():
+    lines = []
+    multiplexer = LogMultiplexer(output=lines.append)
+    multiplexer.MAX_LINE_LENGTH = 10
+    multiplexer.add_source('frontend', _printf('kpi-1 | ' + 'a' * 100))
+    multiplexer.run()
+
+    assert len(lines[0]) < 100
+    assert lines[0].endswith('...')
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from helpers.config import Config
+from helpers.postgres_tuning import PostgresTuning
+
+
+def _get_settings_lines(content):
+    return [
+        line
+        for line in content.split('\n')
+        if line and not line.startswith('#')
+    ]
+
+
+def test_default_settings_match_pgconfig():
+    """
+    Default `postgres_settings_content` has been generated by
+    api.pgconfig.org for 2GB of RAM, 1 CPU, SSD, 100 connections and
+    `Mixed` profile.
+    """
+    pgconfig_content = Config.get_static_template()['postgres_settings_content']
+    content = PostgresTuning.get_settings_content(
+        cpus='1',
+        ram='2',
+        drive_type='ssd',
+        max_connections='100',
+        profile='Mixed',
+    )
+    assert _get_settings_lines(content) == _get_settings_lines(
+        pgconfig_content
+    )
+
+
+def test_settings_scale_with_hardware():
+    settings = dict(
+        setting
+        for _, section in PostgresTuning.get_settings(
+            cpus=16,
+            ram=64,
+            drive_type='hdd',
+            max_connections=200,
+            profile='WEB',
+        )
+        for setting in section
+    )
+    assert settings['shared_buffers'] == '16GB'
+    assert settings['effective_cache_size'] == '48GB'
+    assert settings['work_mem'] == '81MB'
+    assert settings['maintenance_work_mem'] == '3276MB'
+    assert settings['random_page_cost'] == '4'
+    assert settings['effective_io_concurrency'] == '2'
+    assert settings['max_worker_processes'] == '16'
+    assert settings['max_parallel_workers_per_gather'] == '8'
+    assert settings['max_parallel_workers'] == '16'
+
+
+def test_settings_follow_pgconfig_rules():
+    """
+    Expected values apply pgconfig formulas by hand, e.g. for `Web`:
+    `work_mem = (RAM - shared_buffers) / (max_connections * 3)`.
+    """
+    # cpus, ram, drive_type, max_connections, profile, expected settings
+    combinations = [
+        (2, 4, 'ssd', 100, 'WEB', {
+            'shared_buffers': '1GB',
+            'effective_cache_size': '3GB',
+            'work_mem': '10MB',
+            'maintenance_work_mem': '204MB',
+            'max_wal_size': '3GB',
+            'random_page_cost': '1.1',
+            'max_parallel_workers': '2',
+        }),
+        (4, 8, 'hdd', 200, 'OLTP', {
+            'shared_buffers': '2GB',
+            'effective_cache_size': '6GB',
+            'work_mem': '10MB',
+            'maintenance_work_mem': '409MB',
+            'max_wal_size': '3GB',
+            'random_page_cost': '4',
+            'max_parallel_workers': '4',
+        }),
+        (8, 32, 'san', 50, 'DW', {
+            'shared_buffers': '8GB',
+            'effective_cache_size': '24GB',
+            'work_mem': '327MB',
+            'maintenance_work_mem': '4GB',
+            'max_wal_size': '16GB',
+            'random_page_cost': '2',
+            'max_parallel_workers': '8',
+        }),
+        (2, 8, 'ssd', 20, 'Desktop', {
+            'shared_buffers': '512MB',
+            'effective_cache_size': '2GB',
+            'work_mem': '64MB',
+            'maintenance_work_mem': '409MB',
+            'max_wal_size': '3GB',
+            'random_page_cost': '1.1',
+            'max_parallel_workers': '2',
+        }),
+        (1, 4, 'hdd', 1000, 'Mixed', {
+            'shared_buffers': '512MB',
+            'effective_cache_size': '1536MB',
+            'work_mem': '524kB',
+            'maintenance_work_mem': '102MB',
+            'max_wal_size': '3GB',
+            'random_page_cost': '4',
+            'max_parallel_workers': '2',
+        }),
+        # `work_mem` cannot be lower than PostgreSQL minimum
+        (1, 1, 'ssd', 10000, 'WEB', {
+            'shared_buffers': '256MB',
+            'work_mem': '64kB',
+        }),
+    ]
+    for cpus, ram, drive_type, max_connections, profile, expected in (
+        combinations
+    ):
+        settings = dict(
+            setting
+            for _, section in PostgresTuning.get_settings(
+                cpus=cpus,
+                ram=ram,
+                drive_type=drive_type,
+                max_connections=max_connections,
+                profile=profile,
+            )
+            for setting in section
+        )
+        for name, value in expected.items():
+            assert settings[name] == value, (profile, name)
+
+
+def test_settings_reject_invalid_hardware():
+    arguments = {
+        'cpus': 1,
+        'ram': 2,
+        'drive_type': 'ssd',
+        'max_connections': 100,
+        'profile': 'Mixed',
+    }
+    for name, value in [
+        ('cpus', 0),
+        ('ram', '0'),
+        ('max_connections', -1),
+        ('drive_type', 'nvme'),
+        ('profile', 'unknown'),
+    ]:
+        with pytest.raises(ValueError):
+            PostgresTuning.get_settings(**dict(arguments, **{name: value}))
+
+
+def test_format_size():
+    assert PostgresTuning.format_size(655) == '655kB'
+    assert PostgresTuning.format_size(52428) == '51MB'
+    assert PostgresTuning.format_size(786432) == '768MB'
+    assert PostgresTuning.format_size(2 * PostgresTuning.GB) == '2GB'
+
+
+def test_pooler_settings_fit_max_connections():
+    settings = PostgresTuning.get_pooler_settings(max_connections=100)
+    assert settings == {
+        'default_pool_size': 36,
+        'reserve_pool_size': 9,
+        'max_db_connections': 45,
+    }
+
+    # Requested pool size is lowered if it does not fit
+    settings = PostgresTuning.get_pooler_settings(
+        max_connections=50, databases=1, pool_size=100
+    )
+    assert settings['default_pool_size'] == 40
+    assert settings['reserve_pool_size'] == 0
+
+    for max_connections in [20, 100, 500]:
+        settings = PostgresTuning.get_pooler_settings(max_connections)
+        assert (
+            settings['default_pool_size'] + settings['reserve_pool_size']
+            <= settings['max_db_connections']
+        )
+        assert (
+            settings['max_db_connections'] * 2
+            <= max_connections - PostgresTuning.POOLER_RESERVED_CONNECTIONS
+        )
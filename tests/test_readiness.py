@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import time
+from unittest.mock import patch, MagicMock
+
+from helpers.readiness import Readiness
+from .utils import mock_read_config as read_config
+
+
+@patch('helpers.readiness.Readiness.INITIAL_DELAY', 0.01)
+@patch('helpers.network.Network.status_check')
+def test_wait_until_all_services_are_ready(mock_status_check):
+    config = read_config()
+    calls = []
+
+    def status_check(hostname, endpoint, port=80, secure=False):
+        calls.append(hostname)
+        # Each service becomes ready after its third probe
+        if calls.count(hostname) < 3:
+            return 502
+        return 200
+
+    mock_status_check.side_effect = status_check
+    readiness = Readiness(config)
+    assert readiness.probes == ['kpi', 'kobocat', 'enketo_express']
+
+    start = time.monotonic()
+    assert readiness.wait(timeout=10)
+    assert time.monotonic() - start < 1
+    assert len(calls) == 9
+
+
+@patch('helpers.readiness.Readiness.INITIAL_DELAY', 0.01)
+@patch('helpers.network.Network.status_check',
+       MagicMock(return_value=200))
+def test_wait_fails_when_backend_port_is_closed():
+    config = read_config({
+        'expose_backend_ports': True,
+        'postgresql_port': '1',
+    })
+    readiness = Readiness(config)
+    assert 'postgres' in readiness.probes
+    assert not readiness.wait(timeout=0)
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import json
+import os
 from unittest.mock import patch, MagicMock
 
+import pytest
+
 from helpers.command import Command
 from .utils import (
     mock_read_config as read_config,
@@ -132,3 +136,328 @@ def test_toggle_maintenance():
     Command.stop()
     assert len(mock_docker.ps()) == 0
     del mock_docker
+
+
+@patch('helpers.cli.CLI.run_command')
+def test_stop_respects_network_order(mock_run_command):
+    config_object = read_config()
+    Command.stop(output=False)
+
+    # Keep only `<project> <mode>` of each docker compose command
+    calls = []
+    for call in mock_run_command.call_args_list:
+        command = call.args[0]
+        project = command[command.index('-p') + 1] if '-p' in command else 'certbot'
+        calls.append(f'{project} {command[-1]}')
+
+    assert sorted(calls) == sorted([
+        'kobomaintenance stop',
+        'certbot stop',
+        'kobofe stop',
+        'kobomaintenance down',
+        'certbot down',
+        'kobobe down',
+        'kobofe down',
+    ])
+    for stopped in ['kobomaintenance stop', 'certbot stop', 'kobofe stop']:
+        assert calls.index(stopped) < calls.index('kobobe down')
+        assert calls.index(stopped) < calls.index('kobomaintenance down')
+    assert calls.index('kobomaintenance down') < calls.index('kobofe down')
+    assert calls.index('certbot down') < calls.index('kobofe down')
+
+
+@patch('helpers.command.time.sleep', MagicMock())
+@patch('helpers.config.Config.get_service_names',
+       MagicMock(return_value=[
+           'nginx',
+           'enketo_express',
+           'beat',
+           'worker',
+           'kpi',
+           'worker_low_priority',
+       ]))
+@patch('helpers.cli.CLI.run_command')
+def test_rolling_restart_order(mock_run_command):
+    read_config()
+    health = {}
+
+    def run_command(command, cwd=None, polling=False):
+        if 'up' in command:
+            health[command[-1]] = ['starting', 'healthy']
+            return ''
+        if 'ps' in command:
+            return f'{command[-1]}_id\n'
+        if command[:2] == ['docker', 'inspect']:
+            return health[command[-1].replace('_id', '')].pop(0)
+
+    mock_run_command.side_effect = run_command
+    Command.rolling_restart()
+
+    recreated = [
+        call.args[0][-1]
+        for call in mock_run_command.call_args_list
+        if '--force-recreate' in call.args[0]
+    ]
+    assert recreated == [
+        'kpi',
+        'worker',
+        'worker_low_priority',
+        'beat',
+        'enketo_express',
+        'nginx',
+    ]
+
+
+@patch('helpers.command.Command._Command__pull_images', MagicMock())
+@patch('helpers.command.Command.info',
+       MagicMock(return_value=True))
+@patch('helpers.cli.CLI.run_command')
+def test_start_recreates_affected_services_only(mock_run_command):
+    read_config()
+    mock_run_command.return_value = 'kpi\n'
+    Command.start(changed_files=[
+        'kobo-env/envfiles/django.txt',
+        'kobo-env/postgres/conf/postgres.conf',
+    ])
+
+    commands = [call.args[0] for call in mock_run_command.call_args_list]
+    assert not [c for c in commands if 'stop' in c or 'down' in c]
+
+    recreated = {
+        command[command.index('-p') + 1]: command[
+            command.index('--force-recreate') + 1:
+        ]
+        for command in commands
+        if '--force-recreate' in command
+    }
+    assert recreated == {
+        'kobobe': ['postgres'],
+        'kobofe': [
+            'kpi',
+            'worker',
+            'worker_kobocat',
+            'worker_low_priority',
+            'worker_long_running_tasks',
+            'beat',
+        ],
+    }
+
+
+@patch('helpers.network.Network.is_port_open',
+       MagicMock(return_value=False))
+@patch('helpers.command.Upgrading.migrate_single_to_two_databases',
+       new=MockUpgrading.migrate_single_to_two_databases)
+@patch('helpers.command.Command._Command__pull_images', MagicMock())
+@patch('helpers.command.Command.info',
+       MagicMock(return_value=True))
+@patch('helpers.cli.CLI.run_command')
+def test_start_restarts_everything_on_unknown_changes(mock_run_command):
+    read_config()
+    mock_run_command.return_value = 'kpi\n'
+    Command.start(changed_files=['nginx-certbot/data/nginx/app.conf'])
+
+    commands = [call.args[0] for call in mock_run_command.call_args_list]
+    assert [c for c in commands if c[-1] == 'down']
+    assert not [c for c in commands if '--force-recreate' in c]
+
+
+@patch('helpers.network.Network.is_port_open',
+       MagicMock(return_value=False))
+@patch('helpers.command.Upgrading.migrate_single_to_two_databases',
+       new=MockUpgrading.migrate_single_to_two_databases)
+@patch('helpers.command.Command.info',
+       MagicMock(return_value=True))
+def test_start_pulls_images_before_stopping():
+    config = read_config()
+    config._Config__dict['use_letsencrypt'] = False
+    commands = []
+
+    def run_command(command, cwd=None, polling=False):
+        commands.append(command)
+        if 'pull' in command:
+            # Registry is unreachable, local images are used
+            return 1
+        return MockCommand.run_command(command, cwd, polling)
+
+    with patch('helpers.cli.CLI.run_command', side_effect=run_command):
+        Command.start()
+
+    pulls = [i for i, c in enumerate(commands) if 'pull' in c]
+    downs = [i for i, c in enumerate(commands) if c[-1] == 'down']
+    assert pulls and downs
+    assert max(pulls) < min(downs)
+
+    # One pull per front-end image, i.e. `kpi` and `enketo_express`
+    pulled = sorted(
+        commands[i][-1] for i in pulls if 'frontend' in commands[i][3]
+    )
+    assert pulled == ['enketo_express', 'kpi']
+
+
+@patch('helpers.command.Template.render', MagicMock(return_value=[]))
+@patch('helpers.config.Config.write_config', MagicMock())
+@patch('helpers.cli.CLI.run_command')
+def test_scale(mock_run_command):
+    config = read_config()
+    Command.scale(['kpi=3', 'worker_kobocat=2'])
+
+    dict_ = config.get_dict()
+    assert dict_['kpi_replicas'] == '3'
+    assert dict_['celery_worker_kobocat_replicas'] == '2'
+
+    up_command = mock_run_command.call_args_list[0].args[0]
+    assert up_command[-2:] == ['kpi', 'worker_kobocat']
+    for replicas in ['kpi=3', 'worker=1', 'worker_kobocat=2']:
+        assert up_command[up_command.index(replicas) - 1] == '--scale'
+
+    # NGINX must resolve new `kpi` containers
+    nginx_command = mock_run_command.call_args_list[1].args[0]
+    assert nginx_command[-2:] == ['restart', 'nginx']
+
+    # `beat` must not run twice
+    with pytest.raises(SystemExit):
+        Command.scale(['beat=2'])
+
+
+def _mock_blue_green_commands(healthy=True):
+    commands = []
+
+    def run_command(command, cwd=None, polling=False):
+        commands.append((command, cwd))
+        if command[-3:] == ['ps', '-q', 'nginx_ssl_proxy']:
+            return 'proxy\n'
+        if command[:2] == ['docker', 'inspect']:
+            return json.dumps({'kobofe_kobo-fe-network': {}})
+        if polling:
+            # Exit code of commands run in Let's Encrypt NGINX container
+            return 0 if healthy or 'wget' not in command[-1] else 1
+        return ''
+
+    return commands, run_command
+
+
+def _get_frontend_commands(commands, prefix):
+    return [
+        (command[command.index('-p') + 2:], cwd)
+        for command, cwd in commands
+        if '-p' in command and command[command.index('-p') + 1] == prefix
+    ]
+
+
+@patch('helpers.command.GitSync.clone', MagicMock())
+@patch('helpers.command.Template.render', MagicMock(return_value=[]))
+@patch('helpers.config.Config.write_config', MagicMock())
+@patch('helpers.config.Config.write_unique_id', MagicMock())
+def test_deploy_blue_green(tmp_path):
+    blue_path = str(tmp_path / 'kobo-docker')
+    config = read_config({'kobodocker_path': blue_path, 'use_letsencrypt': True})
+    commands, run_command = _mock_blue_green_commands()
+
+    with patch('helpers.cli.CLI.run_command', side_effect=run_command):
+        Command.deploy_blue_green()
+
+    dict_ = config.get_dict()
+    green_path = f'{blue_path}-green'
+    assert dict_['deployment_color'] == 'green'
+    assert dict_['kobodocker_path'] == green_path
+
+    green_commands = _get_frontend_commands(commands, 'kobofe-green')
+    up_arguments, cwd = green_commands[0]
+    assert cwd == green_path
+    assert up_arguments[:2] == ['up', '-d']
+    assert up_arguments[up_arguments.index('beat=0') - 1] == '--scale'
+    # `beat` starts once the blue front end is stopped
+    assert green_commands[-1][0] == ['up', '-d', '--no-deps', 'beat']
+    assert _get_frontend_commands(commands, 'kobofe') == [(['stop'], blue_path)]
+
+    all_commands = [command for command, _ in commands]
+    connect = [
+        'docker', 'network', 'connect', 'kobofe-green_kobo-fe-network', 'proxy'
+    ]
+    reload = all_commands.index(
+        ['docker', 'compose', 'exec', '-T', 'nginx_ssl_proxy',
+         'nginx', '-s', 'reload']
+    )
+    assert all_commands.index(connect) < reload
+    assert reload < all_commands.index(
+        ['docker', 'compose', '-f', 'docker-compose.frontend.yml',
+         '-f', 'docker-compose.frontend.override.yml',
+         '-p', 'kobofe', 'stop']
+    )
+
+
+@patch('helpers.command.GitSync.clone', MagicMock())
+@patch('helpers.command.Template.render', MagicMock(return_value=[]))
+@patch('helpers.config.Config.write_config')
+def test_deploy_blue_green_keeps_traffic_if_unhealthy(
+    mock_write_config, tmp_path
+):
+    blue_path = str(tmp_path / 'kobo-docker')
+    config = read_config({'kobodocker_path': blue_path, 'use_letsencrypt': True})
+    commands, run_command = _mock_blue_green_commands(healthy=False)
+
+    with patch('helpers.cli.CLI.run_command', side_effect=run_command):
+        with pytest.raises(SystemExit):
+            Command.deploy_blue_green(timeout=0)
+
+    dict_ = config.get_dict()
+    assert dict_['deployment_color'] == 'blue'
+    assert dict_['kobodocker_path'] == blue_path
+    assert not mock_write_config.called
+    assert not _get_frontend_commands(commands, 'kobofe')
+    assert not [c for c, _ in commands if 'reload' in c]
+
+
+@patch('helpers.command.Template.render', MagicMock(return_value=[]))
+@patch('helpers.config.Config.write_config', MagicMock())
+@patch('helpers.config.Config.write_unique_id', MagicMock())
+@patch('helpers.config.Config.get_service_names',
+       MagicMock(return_value=['kpi', 'beat', 'nginx']))
+def test_rollback(tmp_path):
+    blue_path = str(tmp_path / 'kobo-docker')
+    green_path = f'{blue_path}-green'
+    os.makedirs(blue_path)
+    with open(
+        os.path.join(blue_path, 'docker-compose.frontend.override.yml'), 'w'
+    ) as f:
+        f.write('')
+
+    config = read_config({
+        'deployment_color': 'green',
+        'kobodocker_path': green_path,
+        'use_letsencrypt': True,
+    })
+    commands, run_command = _mock_blue_green_commands()
+
+    with patch('helpers.cli.CLI.run_command', side_effect=run_command):
+        Command.rollback()
+
+    dict_ = config.get_dict()
+    assert dict_['deployment_color'] == 'blue'
+    assert dict_['kobodocker_path'] == blue_path
+    assert _get_frontend_commands(commands, 'kobofe') == [
+        (['start', 'kpi', 'nginx'], blue_path),
+        (['up', '-d', '--no-deps', 'beat'], blue_path),
+    ]
+    assert _get_frontend_commands(commands, 'kobofe-green') == [
+        (['stop'], green_path),
+    ]
+
+
+@patch('helpers.network.Network.is_port_open',
+       MagicMock(side_effect=lambda port: port == '6432'))
+@patch('helpers.command.Upgrading.migrate_single_to_two_databases',
+       new=MockUpgrading.migrate_single_to_two_databases)
+@patch('helpers.command.Command._Command__pull_images', MagicMock())
+@patch('helpers.command.Command.info',
+       MagicMock(return_value=True))
+@patch('helpers.cli.CLI.run_command',
+       new=MockCommand.run_command)
+def test_start_checks_pgbouncer_port():
+    config = read_config()
+    config._Config__dict['expose_backend_ports'] = True
+    Command.start()
+
+    config._Config__dict['use_pgbouncer'] = True
+    with pytest.raises(SystemExit):
+        Command.start()
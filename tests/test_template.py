@@ -1,8 +1,12 @@
+import fnmatch
 import os
 import shutil
+from string import Template as PyTemplate
 from unittest.mock import patch, MagicMock
 
-from helpers.template import Template
+import yaml
+
+from helpers.template import ExtendedPyTemplate, Template
 from .utils import mock_read_config as read_config
 
 
@@ -15,6 +19,12 @@ def _get_template_vars(overrides=None):
         return Template._Template__get_template_variables(config)
 
 
+def _render_template(template, vars_):
+    template_path = os.path.join(Template._get_templates_path_parent(), template)
+    with open(template_path) as f:
+        return ExtendedPyTemplate(f.read(), vars_).substitute(vars_)
+
+
 WORK_DIR = '/tmp/kobo-install-tests'
 
 @patch(
@@ -62,6 +72,59 @@ def test_render_templates():
         shutil.rmtree(WORK_DIR)
 
 
+
+@patch(
+    'helpers.template.Template._Template__read_unique_id',
+    MagicMock(return_value='123456789')
+)
+@patch(
+    'helpers.template.Template._Template__write_unique_id',
+    MagicMock(return_value='123456789')
+)
+@patch(
+    'helpers.template.Template._get_templates_path_parent',
+    MagicMock(return_value=f'{WORK_DIR}/templates/')
+)
+@patch(
+    'helpers.config.Config.get_env_files_path',
+    MagicMock(return_value=f'{WORK_DIR}/kobo-env/')
+)
+@patch(
+    'helpers.config.Config.get_letsencrypt_repo_path',
+    MagicMock(return_value=f'{WORK_DIR}/nginx-certbot/')
+)
+def test_render_templates_skips_unchanged_files():
+    config = read_config()
+    config._Config__dict['unique_id'] = '123456789'
+    config._Config__dict['kobodocker_path'] = f'{WORK_DIR}/kobo-docker/'
+    django_envfile = f'{WORK_DIR}/kobo-env/envfiles/django.txt'
+    try:
+        _copy_templates()
+        changed_files = Template.render(config)
+        assert 'kobo-env/envfiles/django.txt' in changed_files
+        assert os.path.exists(
+            f'{WORK_DIR}/kobo-env/{Template.RENDER_MANIFEST_FILE}'
+        )
+        mtime = os.path.getmtime(django_envfile)
+
+        # Nothing has changed, nothing should be written
+        assert Template.render(config) == []
+        assert os.path.getmtime(django_envfile) == mtime
+
+        # Only files which use `KOBOFORM_SUBDOMAIN` should be rewritten
+        config._Config__dict['kpi_subdomain'] = 'kf-new'
+        changed_files = Template.render(config)
+        assert 'kobo-env/envfiles/domains.txt' in changed_files
+        assert 'kobo-env/envfiles/databases.txt' not in changed_files
+
+        # Files modified outside kobo-install are rendered again
+        with open(django_envfile, 'a') as f:
+            f.write('# manual change')
+        assert Template.render(config) == ['kobo-env/envfiles/django.txt']
+    finally:
+        shutil.rmtree(WORK_DIR)
+
+
 def test_aws_template_tokens_credentials_mode():
     vars_ = _get_template_vars({
         'use_aws': True,
@@ -126,6 +189,81 @@ def test_cloud_profile_volumes_active_in_kpi_dev_mode():
     assert vars_['USE_AWS_PROFILE'] == '#'
 
 
+def test_compiled_templates_match_legacy_rendering():
+    for redis_password in ['', 'p@ssw0rd']:
+        template_variables = _get_template_vars(
+            {'redis_password': redis_password}
+        )
+        for content in _read_templates():
+            assert (
+                ExtendedPyTemplate(content, template_variables).substitute(
+                    template_variables
+                )
+                == _legacy_render(content, template_variables)
+            )
+
+
+def test_compiled_templates_edge_cases():
+    template_variables = {'A': 'a', 'B': '', 'C': 'c'}
+    contents = [
+        # Nested conditions
+        'x {% if A %}\n{% if B %}b{% endif B %}\n{% endif A %} y',
+        # Blank conditions
+        'x {% if A %}  {% endif A %} y',
+        # Unknown and orphan tags
+        '{% if D %}d{% endif D %}{% endif C %}',
+        # Unclosed condition
+        '{% if A %}a $A',
+        # Escaped and adjacent placeholders
+        '$$A {% if C %}  ${A}$C  {% endif C %}{% if B %}$B{% endif B %}$$',
+    ]
+    for content in contents:
+        assert (
+            ExtendedPyTemplate(content, template_variables).substitute(
+                template_variables
+            )
+            == _legacy_render(content, template_variables)
+        )
+
+
+def test_compiled_templates_cache():
+    template_variables = _get_template_vars({'redis_password': 'p@ssw0rd'})
+    contents = _read_templates()
+    ExtendedPyTemplate._cache.clear()
+    with patch.object(
+        ExtendedPyTemplate,
+        '_ExtendedPyTemplate__compile',
+        wraps=ExtendedPyTemplate._ExtendedPyTemplate__compile,
+    ) as mock_compile:
+        for _ in range(2):
+            for content in contents:
+                assert ExtendedPyTemplate(
+                    content, template_variables
+                ).substitute(template_variables) == _legacy_render(
+                    content, template_variables
+                )
+
+    # Each template is parsed once, then read from the cache
+    assert mock_compile.call_count == len(set(contents))
+
+
+def _legacy_render(content, template_variables):
+    content = ExtendedPyTemplate._ExtendedPyTemplate__legacy_conditions(
+        content, template_variables
+    )
+    return PyTemplate(content).substitute(template_variables)
+
+
+def _read_templates():
+    templates_path = Template._get_templates_path_parent()
+    contents = []
+    for root, dirnames, filenames in os.walk(templates_path):
+        for filename in sorted(fnmatch.filter(filenames, '*.tpl')):
+            with open(os.path.join(root, filename), 'r') as f:
+                contents.append(f.read())
+    return contents
+
+
 def _copy_templates(src: str = None, dst: str = None):
     if not src:
         src = os.path.dirname(os.path.realpath(__file__)) + '/../templates/'
@@ -145,3 +283,235 @@ def _copy_templates(src: str = None, dst: str = None):
         else:
             # Copy files (overwrite if exists)
             shutil.copy2(src_path, dst_path)
+
+
+def test_celery_workers_template_tokens():
+    vars_ = _get_template_vars({
+        'celery_autoscale_min': '2',
+        'celery_autoscale_max': '6',
+        'celery_worker_long_running_tasks_autoscale_max': '12',
+        'celery_worker_long_running_tasks_max_memory_per_child': '512',
+        'celery_worker_long_running_tasks_replicas': '3',
+    })
+    content = _render_template(
+        'kobo-docker/docker-compose.frontend.override.yml.tpl', vars_
+    )
+
+    services = content.split('\n\n')
+    long_running = next(
+        s for s in services if s.startswith('  worker_long_running_tasks:')
+    )
+    assert '      - CELERY_AUTOSCALE_MIN=2\n' in long_running
+    assert '      - CELERY_AUTOSCALE_MAX=12\n' in long_running
+    assert '      - CELERY_WORKER_PREFETCH_MULTIPLIER=1\n' in long_running
+    assert '      - CELERY_WORKER_MAX_MEMORY_PER_CHILD=524288\n' in long_running
+    assert '#  - CELERY_WORKER_MAX_TASKS_PER_CHILD' in long_running
+    assert '      replicas: 3' in long_running
+
+    low_priority = next(
+        s for s in services if s.startswith('  worker_low_priority:')
+    )
+    assert '      - CELERY_AUTOSCALE_MAX=6\n' in low_priority
+    assert '#  - CELERY_WORKER_PREFETCH_MULTIPLIER' in low_priority
+    assert '      replicas: 1' in low_priority
+
+
+def test_beat_runs_on_primary_frontend_only():
+    cluster = {
+        'multi': True,
+        'server_role': 'frontend',
+        'frontend_nodes': '10.0.0.1,10.0.0.2',
+    }
+    assert _get_template_vars()['BEAT_REPLICAS'] == '1'
+    assert _get_template_vars(
+        dict(cluster, primary_frontend=True)
+    )['BEAT_REPLICAS'] == '1'
+    assert _get_template_vars(
+        dict(cluster, primary_frontend=False)
+    )['BEAT_REPLICAS'] == '0'
+
+
+def test_postgres_read_replica_templates():
+    vars_ = _get_template_vars({
+        'multi': True,
+        'server_role': 'backend',
+        'backend_server_role': 'secondary',
+        'primary_backend_ip': '10.0.0.10',
+        'postgres_replication_password': 'replicationpassword',
+    })
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    assert (
+        "    entrypoint: ['/bin/bash', "
+        "'/kobo-install-scripts/replication/standby.bash']"
+    ) in content
+    content = _render_template(
+        'kobo-env/postgres/replication/standby.bash.tpl', vars_
+    )
+    assert '--host=10.0.0.10' in content
+    assert "PGPASSWORD='replicationpassword'" in content
+    assert 'exec "$@"' in content
+
+    # Primary back end keeps the default entrypoint
+    vars_ = _get_template_vars({'multi': True, 'server_role': 'backend'})
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    assert '#entrypoint:' in content
+
+    # Front end
+    content = _render_template('kobo-env/envfiles/databases.txt.tpl', vars_)
+    assert '#KPI_DATABASE_REPLICA_URL=' in content
+    vars_ = _get_template_vars({
+        'multi': True,
+        'server_role': 'frontend',
+        'use_postgres_replica': True,
+        'private_domain_name': 'kobo.private',
+    })
+    content = _render_template('kobo-env/envfiles/databases.txt.tpl', vars_)
+    assert '\nKPI_DATABASE_REPLICA_URL=postgis://' in content
+    assert '@postgres-replica.kobo.private:' in content
+
+
+def test_pgbouncer_templates():
+    vars_ = _get_template_vars({'private_domain_name': 'kobo.private'})
+    content = _render_template('kobo-env/envfiles/databases.txt.tpl', vars_)
+    assert '@postgres.kobo.private:5432/' in content
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    assert '#  pgbouncer:' in content
+
+    vars_ = _get_template_vars({
+        'private_domain_name': 'kobo.private',
+        'use_pgbouncer': True,
+        'pgbouncer_pool_mode': 'transaction',
+    })
+    content = _render_template('kobo-env/envfiles/databases.txt.tpl', vars_)
+    assert '@pgbouncer.kobo.private:6432/' in content
+    assert '@postgres.kobo.private:' not in content
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    services = yaml.safe_load(content)['services']
+    assert services['pgbouncer']['networks']['kobo-be-network']['aliases'] == [
+        'pgbouncer.kobo.private'
+    ]
+    assert 'ports' not in services['pgbouncer']
+    assert set(services) == {
+        'postgres', 'pgbouncer', 'mongo', 'redis_main', 'redis_cache'
+    }
+    content = _render_template('kobo-env/pgbouncer/pgbouncer.ini.tpl', vars_)
+    assert 'pool_mode = transaction' in content
+    assert 'default_pool_size = 36' in content
+    assert 'max_db_connections = 45' in content
+
+    vars_ = _get_template_vars({
+        'use_pgbouncer': True,
+        'expose_backend_ports': True,
+        'pgbouncer_port': '6433',
+    })
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    services = yaml.safe_load(content)['services']
+    assert services['pgbouncer']['ports'] == ['6433:6432']
+    assert 'networks' not in services['pgbouncer']
+
+
+def test_redis_tuning_templates():
+    vars_ = _get_template_vars({
+        'redis_main_max_memory': '512',
+        'redis_cache_max_memory': '256',
+        'redis_cache_eviction_policy': 'allkeys-lfu',
+        'redis_password': 'redispassword',
+    })
+    content = _render_template('kobo-env/redis/redis_main.conf.tpl', vars_)
+    assert '\nmaxmemory 512mb\n' in content
+    assert '\nmaxmemory-policy noeviction\n' in content
+    assert '\nappendonly yes\n' in content
+    assert '\nappendfsync everysec\n' in content
+
+    content = _render_template('kobo-env/redis/redis_cache.conf.tpl', vars_)
+    assert '\nmaxmemory 256mb\n' in content
+    assert '\nmaxmemory-policy allkeys-lfu\n' in content
+    assert '\nappendonly no\n' in content
+    assert '\nsave ""\n' in content
+
+    content = _render_template('kobo-env/redis/apply.bash.tpl', vars_)
+    assert "export REDISCLI_AUTH='redispassword'" in content
+    assert 'CONF_FILE="/kobo-install-scripts/redis/$1.conf"' in content
+
+    # No limits
+    vars_ = _get_template_vars({
+        'redis_main_max_memory': '',
+        'redis_cache_max_memory': '-',
+        'redis_password': '',
+    })
+    content = _render_template('kobo-env/redis/redis_main.conf.tpl', vars_)
+    assert '\nmaxmemory 0\n' in content
+    content = _render_template('kobo-env/redis/redis_cache.conf.tpl', vars_)
+    assert '\nmaxmemory 0\n' in content
+    assert '\nmaxmemory-policy allkeys-lru\n' in content
+    content = _render_template('kobo-env/redis/apply.bash.tpl', vars_)
+    assert 'REDISCLI_AUTH' not in content
+
+
+def test_mongo_wiredtiger_settings():
+    vars_ = _get_template_vars({
+        'mongo_wiredtiger_cache_size': '1.5',
+        'mongo_block_compressor': 'zstd',
+        'mongo_journal_commit_interval': '200',
+    })
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    assert '\n      - --wiredTigerCacheSizeGB=1.5\n' in content
+    assert '\n      - --wiredTigerCollectionBlockCompressor=zstd\n' in content
+    assert '\n      - --journalCommitInterval=200\n' in content
+
+    # MongoDB default cache size
+    vars_ = _get_template_vars({'mongo_wiredtiger_cache_size': ''})
+    content = _render_template(
+        'kobo-docker/docker-compose.backend.override.yml.tpl', vars_
+    )
+    assert '#- --wiredTigerCacheSizeGB=' in content
+
+
+def test_ssl_proxy_performance_settings():
+    vars_ = _get_template_vars({'ssl_proxy_client_max_body_size': '250'})
+    content = _render_template(
+        'nginx-certbot/data/nginx/app.conf.tpl', vars_
+    )
+    assert '\n    keepalive 32;\n' in content
+    assert '\n    listen 443 ssl http2;\n' in content
+    assert '\n    client_max_body_size 250M;\n' in content
+    assert '\nproxy_cache_path ' in content
+    assert '\n    location /static/ {\n' in content
+    assert 'proxy_pass  http://kobo_nginx;' in content
+    assert 'proxy_set_header    Host                $http_host;' in content
+
+    vars_ = _get_template_vars({
+        'ssl_proxy_http2': False,
+        'ssl_proxy_static_cache': False,
+    })
+    content = _render_template(
+        'nginx-certbot/data/nginx/app.conf.tpl', vars_
+    )
+    assert '\n    listen 443 ssl;\n' in content
+    assert '\n#proxy_cache_path ' in content
+    assert '\n    #location /static/ {\n' in content
+
+
+def test_blue_green_upstream():
+    vars_ = _get_template_vars({'deployment_color': 'green'})
+    assert vars_['DOCKER_NETWORK_FRONTEND_PREFIX'] == 'kobofe-green'
+    content = _render_template(
+        'nginx-certbot/data/nginx/app.conf.tpl', vars_
+    )
+    assert '\n    server nginx-green:80;\n' in content
+    content = _render_template(
+        'kobo-docker/docker-compose.frontend.override.yml.tpl', vars_
+    )
+    assert '\n          - nginx-green\n' in content
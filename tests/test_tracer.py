@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+
+import pytest
+
+from helpers.cli import CLI
+from helpers.tracer import Tracer
+
+
+def test_spans_are_recorded_only_when_enabled():
+    Tracer.enabled = False
+    CLI.run_command(['echo', 'not traced'])
+    assert Tracer.get_spans() == []
+
+    Tracer.enable()
+    try:
+        CLI.run_command(['echo', 'traced'])
+        with pytest.raises(SystemExit):
+            CLI.run_command(['false'])
+    finally:
+        Tracer.enabled = False
+
+    spans = Tracer.get_spans()
+    assert [span['name'] for span in spans] == ['echo traced', 'false']
+    assert spans[0]['args']['exit_code'] == 0
+    assert spans[0]['args']['output_bytes'] == len('traced\n')
+    assert spans[1]['args']['exit_code'] == 1
+
+
+def test_write_chrome_trace():
+    Tracer.enable()
+    try:
+        with Tracer.span('render', 'template') as span:
+            span['files'] = 3
+    finally:
+        Tracer.enabled = False
+
+    directory = tempfile.mkdtemp()
+    try:
+        with open(Tracer.write(directory), 'r') as f:
+            trace = json.loads(f.read())
+    finally:
+        shutil.rmtree(directory)
+
+    event = trace['traceEvents'][0]
+    assert event['name'] == 'render'
+    assert event['ph'] == 'X'
+    assert event['args'] == {'files': 3}
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import json
+import threading
 from unittest.mock import patch, mock_open
 
 from helpers.config import Config
@@ -92,11 +93,20 @@ class MockDocker(metaclass=Singleton):
         config_object = Config()
         letsencrypt = cwd == config_object.get_letsencrypt_repo_path()
 
-        if command[-2] == 'config':
-            return '\n'.join([c
-                              for c in self.FRONTEND_CONTAINERS
-                              if c != 'nginx'])
-        if command[-2] == 'up':
+        if command[-3:] == ['config', '--format', 'json']:
+            return json.dumps({
+                'services': {
+                    c: {'image': f'kobotoolbox/{c}'}
+                    for c in self.FRONTEND_CONTAINERS
+                    if c != 'nginx'
+                }
+            })
+        if 'up' in command and all(
+            # Only track whole projects, not commands with specific services.
+            # `--scale` values look like `kpi=1`
+            arg.startswith('-') or '=' in arg
+            for arg in command[command.index('up') + 1:]
+        ):
             if letsencrypt:
                 self.__containers += self.LETSENCRYPT
             elif 'backend' in command[3]:
@@ -143,3 +153,30 @@ class MockAWSValidation:
             return True
         else:
             return False
+
+
+class MockTransport:
+    """
+    Fake SSH transport for `helpers.fleet.Fleet`. Commands are recorded and
+    succeed, unless a step of a host is listed in `failures`.
+    """
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.calls = []
+        self.__lock = threading.Lock()
+
+    def run(self, address, command):
+        step = command.split(' && ', 1)[1]
+        with self.__lock:
+            self.calls.append((address, step))
+        if self.failures.get(address) == step:
+            return 1, f'{step} failed'
+        if step.endswith('--info'):
+            return 0, f'║ Ready ║\n║ URL: https://kf.{address} ║\n'
+        return 0, ''
+
+    def copy(self, address, local_path, remote_path):
+        with self.__lock:
+            self.calls.append((address, f'copy {remote_path}'))
+        return 0, ''